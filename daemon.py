@@ -0,0 +1,255 @@
+"""
+Resident tabulation daemon.
+
+Keeps arcpy loaded, holds the Spatial Analyst license, and keeps the metadata, service path, and projection caches warm
+across requests, so that the time of each request is spent on the analysis instead of on startup.  Requests are sent by
+the tabulate tool (see submitJob) over a local connection authenticated with DAEMON_AUTHKEY, and are processed one at a
+time in the order received; requests sent while another is being processed wait in the listener queue.  Clients that
+do not authenticate or send their request within DAEMON_CLIENT_TIMEOUT are disconnected, so that they cannot block
+other requests.
+
+Jobs and responses are sent as JSON.  The area of interest is written to a scratch file by the tool, and read from it by
+the daemon, so the daemon must run as the same user as the map services (the ArcGIS Server account).
+
+Start the daemon with:
+    python daemon.py
+"""
+
+import os
+import sys
+import json
+import shutil
+import socket
+import struct
+import tempfile
+import traceback
+import logging
+from multiprocessing.connection import Listener, Client, AuthenticationError
+
+import settings
+from tool_exceptions import GPToolError
+
+logger = logging.getLogger(__name__)
+
+#maximum size of a job (JSON of scratch file of area of interest, and target configuration)
+MAX_JOB_BYTES = 16 * 1024 * 1024
+
+
+class ConnectionMessages(object):
+    """
+    Forwards GP tool messages to the client that submitted a job
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def addMessage(self, message):
+        _sendJSON(self.connection, {"message": message})
+
+
+def _sendJSON(connection, value):
+    connection.send_bytes(json.dumps(value))
+
+
+def _receiveJSON(connection, maxBytes=None):
+    if maxBytes is None:
+        return json.loads(connection.recv_bytes())
+    return json.loads(connection.recv_bytes(maxBytes))
+
+
+def connectToDaemon():
+    """
+    Return connection to the daemon at DAEMON_ADDRESS in settings, or None if the daemon is not running or no
+    DAEMON_AUTHKEY is set
+    """
+
+    if not settings.DAEMON_AUTHKEY:
+        logger.warning("DAEMON_AUTHKEY is not set in settings, tabulation daemon is not used")
+        return None
+    try:
+        return Client(settings.DAEMON_ADDRESS, authkey=settings.DAEMON_AUTHKEY)
+    except (socket.error, EOFError, AuthenticationError) as ex:
+        logger.warning("Could not connect to tabulation daemon at %s: %s" % (settings.DAEMON_ADDRESS, ex))
+        return None
+
+
+def writeFeatureSet(featureSet):
+    """
+    Write a featureset to a scratch file for the daemon to read, so that it is not copied over the connection.
+    Compressed featuresets are written decompressed, since the format of featuresets is only detected in strings (see
+    openFeatureSet).
+
+    :param featureSet: featureset string (JSON, quantized JSON, or gzip-compressed JSON)
+    :return: path of scratch file, to be deleted by the caller
+    """
+
+    from utilities.featureset_reader import openFeatureSet
+
+    featureSet = openFeatureSet(featureSet)
+    fd, path = tempfile.mkstemp(prefix="databasin_aoi_", suffix=".json")
+    try:
+        with os.fdopen(fd, "wb") as scratchFile:
+            if isinstance(featureSet, unicode):
+                scratchFile.write(featureSet.encode("utf-8"))
+            elif isinstance(featureSet, basestring):
+                scratchFile.write(featureSet)
+            else:
+                shutil.copyfileobj(featureSet, scratchFile)
+    except:
+        os.remove(path)
+        raise
+    return path
+
+
+def submitJob(featureSetJSON, config, messages):
+    """
+    Tabulate map services in the daemon, and wait for results.  Messages from the daemon (including progress) are added
+    to messages as they are received.
+
+    :param featureSetJSON: area of interest FeatureSet (JSON, quantized JSON, or gzip-compressed JSON)
+    :param config: target configuration
+    :param messages: GP tool messages
+    :return: results, or None if the daemon is not running (so that the job can be run in this process instead)
+    """
+
+    connection = connectToDaemon()
+    if connection is None:
+        return None
+    featureSetPath = None
+    try:
+        featureSetPath = writeFeatureSet(featureSetJSON)
+        _sendJSON(connection, {"featureSetPath": featureSetPath, "config": config})
+        while True:
+            response = _receiveJSON(connection)
+            if response.has_key("message"):
+                messages.addMessage(response["message"])
+            elif response.has_key("error"):
+                if response.get("errorType") == "GPToolError":
+                    raise GPToolError(response["error"])
+                raise RuntimeError("Error in tabulation daemon:\n%s" % (response["error"]))
+            else:
+                return response["results"]
+    finally:
+        connection.close()
+        if featureSetPath is not None:
+            os.remove(featureSetPath)
+
+
+def _setupWorkspace():
+    """
+    Create a scratch workspace (folder with scratch.gdb) for the lifetime of the daemon
+    """
+
+    import arcpy
+
+    scratchWorkspace = tempfile.mkdtemp(prefix="databasin_daemon_")
+    arcpy.CreateFileGDB_management(scratchWorkspace, "scratch.gdb")
+    arcpy.env.scratchWorkspace = scratchWorkspace
+    #workspace must be pointing at GDB to prevent server object crashes
+    arcpy.env.workspace = os.path.join(scratchWorkspace, "scratch.gdb")
+    arcpy.env.overwriteOutput = True
+    logger.debug("Daemon scratch workspace: %s" % (scratchWorkspace))
+    return scratchWorkspace
+
+
+def runJob(job, messages):
+    """
+    Tabulate map services for a job, deleting the area of interest and its projected variants once done
+
+    :param job: dictionary of featureSetPath (scratch file of area of interest FeatureSet JSON) and config
+    :param messages: GP tool messages
+    """
+
+    import arcpy
+    from utilities import FeatureSetConverter
+    from utilities.feature_class_wrapper import FeatureClassWrapper
+    from tabulate import tabulateMapServices
+
+    with open(job["featureSetPath"], "rb") as featureSet:
+        featureClass = FeatureSetConverter.createFeatureClass(featureSet)
+    srcFC = FeatureClassWrapper(featureClass)
+    try:
+        return tabulateMapServices(srcFC, job["config"], messages)
+    finally:
+        srcFC.delete()
+        if arcpy.Exists(featureClass):
+            arcpy.Delete_management(featureClass)
+
+
+def createListener():
+    """
+    Return Listener at DAEMON_ADDRESS, which authenticates clients with DAEMON_AUTHKEY.  Reads from accepted connections
+    (including authentication within Listener.accept) raise IOError if the client does not send anything for
+    DAEMON_CLIENT_TIMEOUT, including clients that stop partway through a message.
+    """
+
+    listener = Listener(settings.DAEMON_ADDRESS, authkey=settings.DAEMON_AUTHKEY)
+    #receive timeout is inherited by sockets accepted from the listening socket, which Listener does not expose
+    timeout = settings.DAEMON_CLIENT_TIMEOUT
+    if sys.platform == "win32":
+        value = struct.pack("L", int(timeout * 1000))
+    else:
+        value = struct.pack("ll", int(timeout), int((timeout - int(timeout)) * 1000000))
+    listener._listener._socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVTIMEO, value)
+    return listener
+
+
+def _handleConnection(connection):
+    job = _receiveJSON(connection, MAX_JOB_BYTES)
+    try:
+        response = {"results": runJob(job, ConnectionMessages(connection))}
+    except GPToolError as ex:
+        response = {"error": str(ex), "errorType": "GPToolError"}
+    except:
+        error = traceback.format_exc()
+        logger.error("Error processing job\n%s" % (error))
+        response = {"error": error}
+    _sendJSON(connection, response)
+
+
+def serve():
+    """
+    Run the daemon until interrupted.  DAEMON_AUTHKEY must be set in settings.
+    """
+
+    if not settings.DAEMON_AUTHKEY:
+        raise ValueError("DAEMON_AUTHKEY must be set in settings to a key unique to this installation to start the "
+                         "tabulation daemon")
+
+    import tool_logging  # init logging in this process
+    import tabulate
+
+    scratchWorkspace = _setupWorkspace()
+    tabulate.holdSpatialExtension()
+    if settings.PREWARM_SERVICE_PATHS:
+        from utilities.PathUtils import prewarmServicePaths
+        prewarmServicePaths()
+
+    listener = createListener()
+    logger.info("Tabulation daemon listening at %s" % (str(settings.DAEMON_ADDRESS)))
+    try:
+        while True:
+            try:
+                connection = listener.accept()
+            except (socket.error, AuthenticationError, EOFError, IOError) as ex:
+                logger.warning("Rejected connection to tabulation daemon: %s" % (ex))
+                continue
+            try:
+                _handleConnection(connection)
+            except (EOFError, IOError, ValueError) as ex:
+                #client went away or stalled before sending its job, or job was not valid JSON
+                logger.warning("Lost connection to client of tabulation daemon: %s" % (ex))
+            finally:
+                connection.close()
+    finally:
+        listener.close()
+        tabulate.releaseSpatialExtension()
+        shutil.rmtree(scratchWorkspace, ignore_errors=True)
+        logger.info("Tabulation daemon stopped")
+
+
+if __name__ == "__main__":
+    try:
+        serve()
+    except KeyboardInterrupt:
+        pass
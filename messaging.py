@@ -18,6 +18,7 @@ class MessageHandler:
         self.minor_step=0
         self.minor_steps=0
         self._last_message=None
+        self._progress=0
 
     def setMajorSteps(self,major_steps):
         """
@@ -41,10 +42,15 @@ class MessageHandler:
         self.minor_step=0
         self._updateMajorProgress()
 
-    def incrementMajorStep(self):
-        """Increment the current major step by one, and emit a new progress message."""
+    def incrementMajorStep(self,steps=1):
+        """
+        Increment the current major step, and emit a new progress message.
+
+        :param steps: number of major steps completed; may be a fraction of a step (e.g., one of several layers of a
+        map service, where layers of several map services complete out of order)
+        """
 
-        self.major_step+=1
+        self.major_step+=steps
         self._updateMajorProgress()
 
     def incrementMinorStep(self):
@@ -69,10 +75,13 @@ class MessageHandler:
         """
         Emit a new progress message: PROGRESS [PERCENT_COMPLETE]
 
+        Progress never decreases and never exceeds 100, even if more minor steps are completed than were set.
+
         :param progress: the current progress, on a percent scale.
         """
 
-        self.addMessage("PROGRESS: %.0f"%(progress))
+        self._progress=min(max(progress,self._progress),100.0)
+        self.addMessage("PROGRESS: %.0f"%(self._progress))
 
     def addMessage(self,message):
         """
@@ -87,3 +96,9 @@ class MessageHandler:
             if self.logger:
                 self.logger.debug(message)
 
+
+class NullMessages:
+    """Discards messages, where GP tool messages are not available (e.g., in worker processes)."""
+
+    def addMessage(self,message):
+        pass
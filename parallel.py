@@ -0,0 +1,178 @@
+"""
+Run tabulation tasks in a pool of worker processes.
+
+Each worker process has its own scratch workspace (folder with scratch.gdb) and arcpy environment, so that intermediate
+datasets created by concurrent tasks do not collide.  Log records of workers are sent to the parent process and logged
+there, so that only one process writes to (and rotates) the log file.  ArcGIS objects cannot be passed between processes, so tasks must
+be described using values that can be pickled (paths, configuration, spatial references as WKT).
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import logging
+import threading
+import multiprocessing
+
+import arcpy
+
+import settings
+
+logger = logging.getLogger(__name__)
+
+
+def getWorkerCount(numTasks):
+    """
+    Return the number of worker processes to use for a number of tasks, based on PARALLEL_WORKERS in settings.  Returns
+    0 if tasks should be run serially in this process.
+
+    :param numTasks: number of tasks to run
+    """
+
+    workers = settings.PARALLEL_WORKERS
+    if workers < 0:
+        workers = multiprocessing.cpu_count()
+    workers = min(workers, numTasks)
+    return workers if workers > 1 else 0
+
+
+def _callIndexed(indexedTask):
+    """
+    Call function on task, and return result with index of task
+    """
+
+    function, index, task = indexedTask
+    return index, function(task)
+
+
+class QueueLogHandler(logging.Handler):
+    """
+    Sends log records of a worker process to a queue, from which they are logged in the parent process (see
+    _logQueuedRecords)
+    """
+
+    def __init__(self, queue):
+        logging.Handler.__init__(self)
+        self.queue = queue
+
+    def emit(self, record):
+        try:
+            #arguments and exception info of record may not be picklable; send the formatted message instead
+            message = self.format(record)
+            record.msg = message
+            record.args = None
+            record.exc_info = None
+            record.exc_text = None
+            self.queue.put_nowait(record)
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except:
+            self.handleError(record)
+
+
+def _logQueuedRecords(queue):
+    """
+    Log records received from worker processes, until None is received
+    """
+
+    while True:
+        record = queue.get()
+        if record is None:
+            break
+        logging.getLogger(record.name).handle(record)
+
+
+def _initWorker(scratchRoot, logQueue):
+    """
+    Setup a worker process: logging to the parent process, and a scratch workspace for this process
+    """
+
+    #replace handlers inherited from the parent process, if any
+    rootLogger = logging.getLogger()
+    for handler in rootLogger.handlers[:]:
+        rootLogger.removeHandler(handler)
+    rootLogger.addHandler(QueueLogHandler(logQueue))
+    rootLogger.setLevel(settings.LOG_LEVEL)
+
+    scratchWorkspace = tempfile.mkdtemp(prefix="worker_", dir=scratchRoot)
+    arcpy.CreateFileGDB_management(scratchWorkspace, "scratch.gdb")
+    arcpy.env.scratchWorkspace = scratchWorkspace
+    #workspace must be pointing at GDB to prevent server object crashes
+    arcpy.env.workspace = os.path.join(scratchWorkspace, "scratch.gdb")
+    arcpy.env.overwriteOutput = True
+    logger.debug("Worker %s scratch workspace: %s" % (os.getpid(), scratchWorkspace))
+
+
+class WorkerPool(object):
+    """
+    Pool of worker processes, for use as a context manager.  Scratch workspaces of the workers are deleted when the pool
+    is closed.
+
+    Example:
+        with WorkerPool(4) as pool:
+            for result in pool.imap(function, tasks):
+                ...
+    """
+
+    def __init__(self, workers):
+        """
+        :param workers: number of worker processes
+        """
+
+        self.workers = workers
+        self._pool = None
+        self._scratchRoot = None
+        self._logQueue = None
+        self._logThread = None
+
+    def __enter__(self):
+        if sys.platform == "win32":
+            #ArcGIS runs Python within its own executables; workers must be started with the Python interpreter instead
+            multiprocessing.set_executable(os.path.join(sys.exec_prefix, "python.exe"))
+        self._scratchRoot = tempfile.mkdtemp(prefix="workers_", dir=arcpy.env.scratchWorkspace)
+        logger.debug("Starting %i worker processes" % (self.workers))
+        self._logQueue = multiprocessing.Queue()
+        self._logThread = threading.Thread(target=_logQueuedRecords, args=(self._logQueue,))
+        self._logThread.daemon = True
+        self._logThread.start()
+        self._pool = multiprocessing.Pool(self.workers, _initWorker, (self._scratchRoot, self._logQueue))
+        return self
+
+    def imap(self, function, tasks):
+        """
+        Run function on each task in the worker processes.
+
+        :param function: function defined at the top level of a module, so that it can be called in worker processes
+        :param tasks: list of arguments to function, one for each call
+        :return: iterator over results, in the same order as tasks
+        """
+
+        return self._pool.imap(function, tasks)
+
+    def imapUnordered(self, function, tasks):
+        """
+        Run function on each task in the worker processes, returning results as soon as each task completes.
+
+        :param function: function defined at the top level of a module, so that it can be called in worker processes
+        :param tasks: list of arguments to function, one for each call
+        :return: iterator over tuples of (index of task, result), in the order that tasks complete
+        """
+
+        return self._pool.imap_unordered(_callIndexed, [(function, index, task) for index, task in enumerate(tasks)])
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self._pool.close()
+        else:
+            self._pool.terminate()
+        self._pool.join()
+        self._pool = None
+        self._logQueue.put(None)
+        #records may be lost, but logging must not hang, if workers were terminated while sending them
+        self._logThread.join(10)
+        self._logQueue.close()
+        self._logQueue = None
+        self._logThread = None
+        shutil.rmtree(self._scratchRoot, ignore_errors=True)
+        return False
@@ -9,3 +9,82 @@ ARCGIS_SVC_CONFIG_DIR="/opt/arcgis/server/usr/config-store"
 LOG_FILENAME = "/var/log/databasin/databasin_gp_tools/databasin_gp_tools.log"
 LOG_LEVEL = "DEBUG" #Valid options are DEBUG, INFO, ERROR (or any other level supported by logging package)
 
+
+#Raster tabulation: maximum number of pixels within extent of area of interest for which the precise (area weighted)
+#method is used; larger extents use the approximate method
+PRECISE_MAX_PIXELS = 5000000
+#Method used to calculate the area or length of the area of interest within each pixel for the precise method.
+#Valid options are "numpy" (calculated in memory) or "fishnet" (intersection with a fishnet feature class, limited to 50,000 pixels)
+PRECISE_COVERAGE_METHOD = "numpy"
+#Approximate method: if True, rasters are read in windows and the area of interest is rasterized in memory, instead of
+#creating intermediate rasters with Spatial Analyst.  Statistics are accumulated from each window (see
+#utilities.moments); layers requesting statistics that cannot be accumulated this way use Spatial Analyst.
+RASTER_STREAMING = True
+#Maximum number of rows and columns of each window read from rasters
+RASTER_WINDOW_SIZE = 1024
+
+#Number of worker processes used to tabulate the layers of all map services in parallel.  Each worker uses its own scratch
+#workspace.  Use 0 to process layers in the tool process, or -1 to use one worker per CPU.
+PARALLEL_WORKERS = 0
+
+#Directory for cached results of each layer, so that repeated requests for the same area of interest are not processed
+#again.  Results are invalidated when source datasets change.  Use None to disable caching.
+RESULT_CACHE_DIR = None
+#Maximum size of cached results; least recently used results are deleted first
+RESULT_CACHE_MAX_BYTES = 500 * 1024 * 1024
+
+#Directory used to persist the descriptions of layer data sources (extent, projection, fields, etc), with one JSON file
+#per data source, so that they are shared by processes.  Descriptions are always cached within each process.  Use None to
+#disable persistence.
+METADATA_CATALOG_DIR = None
+
+#Resolve the data paths of all map services when the daemon starts, and in the background when the toolbox is loaded,
+#so that they are cached for all requests
+PREWARM_SERVICE_PATHS = False
+
+#Send tabulation requests to a resident daemon (started with "python daemon.py"), which keeps arcpy loaded, holds the
+#Spatial Analyst license, and keeps caches warm between requests.  Requests are processed in the tool process if the
+#daemon is not running.
+DAEMON_ENABLED = False
+#Local address of the daemon, and key used to authenticate requests.  There is no default key: set a secret key unique to
+#this installation (e.g., a random string of 32 characters) to use the daemon.  The daemon must run as the same user as
+#map services (the ArcGIS Server account), since areas of interest are passed to it in scratch files.
+DAEMON_ADDRESS = ("localhost", 6543)
+DAEMON_AUTHKEY = None
+#Jobs are processed by the daemon one at a time, in the order received, so concurrent tool processes wait for each
+#other's jobs (layers within a job are still processed in parallel, see PARALLEL_WORKERS).  Run the tool without the
+#daemon (DAEMON_ENABLED = False) for concurrent jobs.
+#Seconds the daemon waits for a client to authenticate and send its job before disconnecting it
+DAEMON_CLIENT_TIMEOUT = 30
+
+#Directory of tile indexes of raster layers (histograms and statistics of tiles at several tile sizes), used by the
+#approximate method to tabulate tiles entirely within polygon areas of interest without reading their pixels.  Build
+#indexes with "python -m utilities.tile_index <path to raster> ...".  Use None to disable.
+TILE_INDEX_DIR = None
+#Tile sizes (pixels) of tile indexes; each size must be a multiple of the next smaller size
+TILE_INDEX_SIZES = (4096, 1024, 256)
+
+#Method used for raster layers in geographic coordinates (latitude / longitude): "geodesic" to tabulate pixels on the
+#native grid of the raster, weighted by the area of each pixel on the ellipsoid, where the approximate method is used
+#(large areas of interest and points; small polygons and lines use the precise method on the projected raster), or
+#"project" to project the raster to the target projection first.
+GEOGRAPHIC_AREA_METHOD = "geodesic"
+
+#Grid (in degrees) to which the central meridian and standard parallels of the custom Albers projection are snapped,
+#so that nearby areas of interest share the same projection, and data projected for one request can be reused by
+#others.  None to fit the projection to each area of interest (rounded to 0.1 degree).
+CUSTOM_ALBERS_SNAP_DEGREES = None
+
+#Maximum scale error (e.g., 0.01 for 1%) within the area of interest that snapping the custom Albers projection may add
+#to the scale error of the projection fit to the area of interest.  If exceeded, the fitted projection is used instead.  Albers projections preserve areas regardless of
+#their parameters; this limits the distortion of distances and shapes (and of pixels in projected rasters).
+CUSTOM_ALBERS_MAX_SCALE_ERROR = 0.01
+
+#Directory for tiles of raster layers projected to target projections (for layers not in a projection valid for
+#calculating areas), so that layers are projected once per tile instead of once per request.  Most effective with
+#CUSTOM_ALBERS_SNAP_DEGREES.  Use None to disable.
+PROJECTED_TILE_CACHE_DIR = None
+#Maximum size of projected tiles; least recently used tiles are deleted first
+PROJECTED_TILE_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024
+#Number of rows and columns of each projected tile
+PROJECTED_TILE_SIZE = 512
@@ -23,10 +23,24 @@ import logging
 import numpy
 import arcpy
 
+import settings
 from utilities import ProjectionUtilities
 from utilities.feature_class_wrapper import FeatureClassWrapper
+from utilities.grid import getGridTransform
+from utilities.pixel_coverage import getPixelMask
+from utilities.aoi_decomposition import AOIDecomposition
+from utilities.raster_windows import RasterWindowReader
+from utilities.scratch import ScratchWorkspace
+from utilities.result_cache import getResultCache, getCacheKey
+from utilities.metadata_catalog import getMetadataCatalog
+from utilities.tile_index import getTileIndex
+from utilities.projected_tiles import getProjectedTileReader
+from utilities.geodesic import GeodesicCellAreas
+from utilities.moments import RunningStatistics, STATISTICS
+from utilities.tally import tallyValues, sumByValue, ClassBinner
 from utilities.PathUtils import getDataPathsForService, get_scratch_GDB
-from messaging import MessageHandler
+from messaging import MessageHandler, NullMessages
+from parallel import WorkerPool, getWorkerCount
 from tool_exceptions import GPToolError
 
 logger = logging.getLogger(__name__)
@@ -36,6 +50,18 @@ arcpy.env.overwriteOutput = True
 arcpy.env.pyramid = "NONE"
 arcpy.env.rasterStatistics = "NONE"  #we will calculate these manually as required
 
+#Intersecting a fishnet is too slow for more pixels than this
+FISHNET_MAX_PIXELS = 50000
+
+HECTARES_PER_SQUARE_METER = 0.0001
+
+#Number of minor progress steps of each layer, when layers are tabulated in this process
+LAYER_MINOR_STEPS = 5
+
+#True while the Spatial Analyst extension is held for the lifetime of this process (e.g., by the tabulation daemon),
+#instead of being checked out for each raster layer
+_spatialExtensionHeld = False
+
 
 class SummaryResult:
     """
@@ -51,73 +77,141 @@ class SummaryResult:
         self.quantity += quantity
 
 
-class SummaryField:
+class SummaryField(object):
     """
     convenience class wrapper of an attribute used for summarization of attribute values by unique, classes, or statistics
+
+    Records are stored in arrays of counts and quantities by class index (if classes are used) or by unique value.  Add
+    records in bulk using addRecords where possible, since values are grouped using numpy.
     """
 
     def __init__(self, fieldJSON, hasGeometry=False):
         self.attribute = fieldJSON["attribute"]
         self.classes = fieldJSON.get("classes", [])
         self.statistics = fieldJSON.get("statistics", [])
-        self.results = dict()
-        self._classRanges = []
-        for i in range(0, len(self.classes)):
-            classRange = self.classes[i]
-            self._classRanges.append((float(classRange[0]), float(classRange[1])))
-            self.results[i] = SummaryResult()
+        self._classBinner = ClassBinner(self.classes)
+        self._classCounts = numpy.zeros(len(self.classes), dtype=numpy.int64)
+        self._classQuantities = numpy.zeros(len(self.classes))
+        #unique values and their counts and quantities; records are grouped into these when results are requested
+        self._values = numpy.zeros(0)
+        self._counts = numpy.zeros(0, dtype=numpy.int64)
+        self._quantities = numpy.zeros(0)
+        self._pending = []
 
         self.hasGeometry = hasGeometry
 
     def addRecord(self, value, count, quantity=0):  #quantity: area or length
-        key = None
+        self.addRecords([value], [count], [quantity])
+
+    def addRecords(self, values, counts, quantities=None):
+        """
+        Add multiple records at once
+
+        :param values: sequence or array of attribute values
+        :param counts: sequence or array of counts for each record, or a single count for all records
+        :param quantities: sequence or array of quantities (area or length) for each record, or None
+        """
+
+        values = numpy.asarray(values)
+        if values.dtype == object:
+            #build array from list so that numeric values are not stored as objects
+            values = numpy.array(values.tolist())
+        counts = numpy.zeros(len(values), dtype=numpy.int64) + numpy.asarray(counts, dtype=numpy.int64)
+        quantities = numpy.zeros(len(values)) + (0 if quantities is None else numpy.asarray(quantities, dtype=numpy.float64))
+        if not len(values):
+            return
+
         if self.classes:
-            key = self.getClass(value)
+            classes = self.getClasses(values)
+            inClass = classes >= 0
+            self._classCounts += numpy.bincount(classes[inClass], weights=counts[inClass],
+                                                minlength=len(self.classes)).round().astype(numpy.int64)
+            self._classQuantities += numpy.bincount(classes[inClass], weights=quantities[inClass],
+                                                    minlength=len(self.classes))
         else:
-            key = value
-        if key is not None:
-            if not self.results.has_key(key):
-                self.results[key] = SummaryResult()
-            self.results[key].update(count, quantity)
+            if values.dtype == object:
+                notNull = numpy.array([value is not None for value in values.tolist()], dtype=bool)
+                values = numpy.array(values[notNull].tolist())
+                counts = counts[notNull]
+                quantities = quantities[notNull]
+            self._pending.append((values, counts, quantities))
 
     def getClass(self, value):
-        #>=lower value and <upper
-        for classIndex in range(0, len(self._classRanges)):
-            classRange = self._classRanges[classIndex]
-            if value >= classRange[0] and value < classRange[1]:
-                return classIndex
-        return None
+        #>=lower value and <upper; first matching class
+        return self._classBinner.getClass(value)
+
+    def getClasses(self, values):
+        """
+        Return array of class index for each value, or -1 if value is not in any class
+        """
+
+        if values.dtype.kind in "iuf":
+            return self._classBinner.classify(values)
+        elif values.dtype == object:
+            classes = [self.getClass(value) for value in values.tolist()]
+            return numpy.array([-1 if classIndex is None else classIndex for classIndex in classes], dtype=numpy.intp)
+        return numpy.zeros(len(values), dtype=numpy.intp) - 1
+
+    def _getValueTally(self):
+        """
+        Group pending records by unique value, and return arrays of unique values, counts, and quantities
+        """
+
+        if self._pending:
+            if len(self._values):
+                self._pending.insert(0, (self._values, self._counts, self._quantities))
+            values = [pending[0] for pending in self._pending if len(pending[0])]
+            if values:
+                self._values, self._counts, self._quantities = sumByValue(
+                    numpy.concatenate(values),
+                    numpy.concatenate([pending[1] for pending in self._pending]),
+                    numpy.concatenate([pending[2] for pending in self._pending])
+                )
+            self._pending = []
+        return self._values, self._counts, self._quantities
+
+    @property
+    def results(self):
+        """
+        Dictionary of SummaryResult, by class index or unique value
+        """
+
+        if self.classes:
+            keys, counts, quantities = range(0, len(self.classes)), self._classCounts, self._classQuantities
+        else:
+            keys, counts, quantities = self._getValueTally()
+            keys = keys.tolist()
+        results = dict()
+        for key, count, quantity in zip(keys, counts.tolist(), quantities.tolist()):
+            results[key] = SummaryResult()
+            results[key].update(count, quantity)
+        return results
 
     def getStatistics(self, statisticsList):
         statistics = dict()
-        statisticAttribute = "count"
-        if self.hasGeometry:
-            statisticAttribute = "quantity"
-        values_present = self.results.keys()
+        values, counts, quantities = self._getValueTally()
+        weights = quantities if self.hasGeometry else counts
         for statistic in statisticsList:
             statisticName = statistic.upper()
-            if statisticName == "SUM":
+            if not len(values):
+                statistics[statistic] = None
+            elif statisticName == "SUM":
                 #sum = count * value for each entry in results
-                statistics[statistic] = sum([(self.results[key].count * key) for key in values_present])
+                statistics[statistic] = (counts * values).sum().item()
             elif statisticName == "MIN":
-                statistics[statistic] = min(values_present)
+                statistics[statistic] = values.min().item()
             elif statisticName == "MAX":
-                statistics[statistic] = max(values_present)
+                statistics[statistic] = values.max().item()
             elif statisticName == "MEAN":
                 #area/length/count weighted average
-                total = float(sum([getattr(result, statisticAttribute) for result in self.results.values()]))
+                total = float(weights.sum())
                 if total:
-                    statistics[statistic] = sum(
-                        map(
-                            lambda value: value * (float(getattr(self.results[value], statisticAttribute)) / total),
-                            self.results
-                        )
-                    )
+                    statistics[statistic] = float((values * weights).sum() / total)
                 else:
                     statistics[statistic] = None
             elif statisticName == "STD":
                 #regular standard deviation, not weighted
-                statistics[statistic] = float(numpy.std(values_present))
+                statistics[statistic] = float(numpy.std(values))
 
         return statistics
 
@@ -130,23 +224,22 @@ class SummaryField:
             for i in range(0, len(self.classes)):
                 classResult = {
                     'class': self.classes[i],
-                    'intersectionCount': self.results[i].count
+                    'intersectionCount': int(self._classCounts[i])
                 }
                 if self.hasGeometry:
-                    classResult["intersectionQuantity"] = self.results[i].quantity
+                    classResult["intersectionQuantity"] = float(self._classQuantities[i])
                 classResults.append(classResult)
             fieldResults.update({'classes': classResults})
         else:
             valueResults = []
-            keys = self.results.keys()
-            keys.sort()
-            for key in keys:
+            values, counts, quantities = self._getValueTally()
+            for value, count, quantity in zip(values.tolist(), counts.tolist(), quantities.tolist()):
                 valueResult = {
-                    'value': key,
-                    'intersectionCount': self.results[key].count
+                    'value': value,
+                    'intersectionCount': count
                 }
                 if self.hasGeometry:
-                    valueResult["intersectionQuantity"] = self.results[key].quantity
+                    valueResult["intersectionQuantity"] = quantity
                 valueResults.append(valueResult)
             fieldResults.update({'values': valueResults})
         return fieldResults
@@ -170,69 +263,45 @@ def getGridClasses(grid, field, classBreaks):
     return results
 
 
-def getNumpyValueQuantities(values, quantities):
+def getNumpyValueQuantities(values, quantities, decomposition=None):
     """
     Tallys the quantities for each unique value found in values based on the amount within each pixel
 
-    :param values:  pixel values
+    :param values:  pixel values (masked values are excluded)
     :param quantities: quantities measured for each pixel
-    :return: dictionary mapping value to count and quantity
+    :param decomposition: optional AOIDecomposition of pixels, so that pixels entirely within the area of interest are
+        tallied without weights
+    :return: tuple of arrays of unique values, count, and quantity, sorted by value
     """
 
-    flat_values = values.ravel()
-    flat_quantities = quantities.ravel()
-    results = dict()
-    if str(flat_values.dtype).count("ui") or flat_values.min() > 0:
-        logger.debug("Tallying unique values using bincount method")
-        # Bincount is preferred, performant method but only works for positive integers
-        if flat_values.mask.shape:
-            # Remove masked values or they get into calculation
-            valid = flat_values.mask == False
-            flat_values = flat_values[valid]
-            flat_quantities = flat_quantities[valid]
-
-        b_quantity = numpy.bincount(flat_values, weights=flat_quantities)
-        b_count = numpy.bincount(flat_values)
-        nonzero_indices = numpy.flatnonzero(b_count)
-        tally = numpy.vstack((nonzero_indices, b_count[nonzero_indices], b_quantity[nonzero_indices])).T
-        for result in tally:
-            results[int(result[0])] = {
-                'intersectionCount': int(result[1]),
-                'intersectionQuantity': float(result[2])
-            }
-    else:
-        logger.debug("Tallying unique values using looping method")
-        unique = numpy.ma.unique(flat_values)
-        for value in unique[unique.mask == False]:
-            equals_value = flat_values == value
-            results[value] = {
-                'intersectionCount': numpy.ma.sum(equals_value),
-                'intersectionQuantity': numpy.ma.sum(flat_quantities[equals_value])
-            }
-    return results
+    if decomposition is not None:
+        return decomposition.tallyValues(values, quantities)
+    return tallyValues(values, quantities)
 
 
-def getNumpyClassQuantities(values, quantities, classBreaks):
+def getNumpyClassQuantities(values, quantities, classBreaks, decomposition=None):
     """
     Tally quantities by class, using quantities within each pixel.  Classes are tested on greater than or equal to lower
     value and less than upper value.
 
-    :param values:  pixel values
+    :param values:  pixel values (masked values are excluded)
     :param quantities: quantities measured for each pixel
     :param classBreaks:
+    :param decomposition: optional AOIDecomposition of pixels, so that pixels entirely within the area of interest are
+        tallied without weights
     :return: list with dictionary objects of class range, count, and quantity
     """
 
-    import numpy
-
+    if decomposition is not None:
+        counts, class_quantities = decomposition.tallyClasses(ClassBinner(classBreaks), values, quantities)
+    else:
+        counts, class_quantities = ClassBinner(classBreaks).tally(values, quantities)
     class_results = []
     for i in range(0, len(classBreaks)):
-        class_range = classBreaks[i]
-        in_class = numpy.logical_and(values >= float(class_range[0]), values < float(class_range[1]))
         class_results.append({
-            'class': class_range,
-            'intersectionCount': int(in_class.sum()),
-            'intersectedQuantity': (in_class * quantities).sum()
+            'class': classBreaks[i],
+            'intersectionCount': int(counts[i]),
+            'intersectedQuantity': float(class_quantities[i])
         })
     return class_results
 
@@ -242,12 +311,83 @@ def FishnetOIDToNumpy(OID, rows, cols):
     Return the row and column in grid coordinates that correspond to the given OID
     Fishnet numbers start at 1, in bottom left corner, and go columnwise from there.
     Grid coordinates start at 0, and start in upper left
+
+    OID may also be a numpy array of OIDs, in which case arrays of rows and columns are returned.
     """
     row, col = divmod(OID - 1, cols)
     row = (rows - 1) - row  #invert row order
     return row, col
 
 
+def getFishnetQuantities(projFC, projectedGrid, quantityAttribute, messages, scratch, cells=None):
+    """
+    Calculate the area or length of features within each pixel, by intersecting features with a fishnet that matches the
+    pixels of the grid.
+
+    :param projFC: feature class in same projection as grid
+    :param projectedGrid: arcpy Raster object
+    :param quantityAttribute: area or length
+    :param messages: instance of MessageHandler
+    :param scratch: ScratchWorkspace for intermediate datasets
+    :param cells: optional boolean array of pixels to include in fishnet (e.g., pixels on boundary of area of interest);
+        all pixels are included if not provided
+    :return: numpy array with area or length within each pixel, in units of projection
+    """
+
+    fishnet = scratch.getGDBPath("fishnet")
+    if cells is None:
+        logger.debug("Creating fishnet")
+        arcpy.CreateFishnet_management(fishnet, "%f %f" % (projectedGrid.extent.XMin, projectedGrid.extent.YMin),
+                                       "%f %f" % (projectedGrid.extent.XMin, projectedGrid.extent.YMax),
+                                       projectedGrid.meanCellWidth, projectedGrid.meanCellHeight,
+                                       projectedGrid.height,
+                                       projectedGrid.width, "#", False, projectedGrid, "POLYGON")
+    else:
+        cellRows, cellCols = numpy.nonzero(cells)
+        logger.debug("Creating fishnet of %i pixels" % (len(cellRows)))
+        grid = getGridTransform(projectedGrid)
+        spatialReference = projectedGrid.spatialReference
+        arcpy.CreateFeatureclass_management(os.path.dirname(fishnet), os.path.basename(fishnet), "POLYGON",
+                                            spatial_reference=spatialReference)
+        cursor = arcpy.da.InsertCursor(fishnet, ["SHAPE@"])
+        try:
+            for row, col in zip(cellRows.tolist(), cellCols.tolist()):
+                cell = grid.window(row, col, 1, 1)
+                corners = [(cell.xMin, cell.yMax), (cell.xMax, cell.yMax), (cell.xMax, cell.yMin),
+                           (cell.xMin, cell.yMin)]
+                cursor.insertRow([arcpy.Polygon(arcpy.Array([arcpy.Point(x, y) for x, y in corners]),
+                                                spatialReference)])
+        finally:
+            del cursor
+
+    messages.incrementMinorStep()
+
+    logger.debug("Intersecting with area of interest")
+    intersection = scratch.getGDBPath("intersection")
+    arcpy.Intersect_analysis("%s #;%s #" % (projFC, fishnet), intersection, "ONLY_FID", "#", "INPUT")
+
+    messages.incrementMinorStep()
+
+    #read all intersected cells at once and scatter their quantities into the grid
+    fidField = "FID_%s" % (os.path.split(fishnet)[1])
+    quantityField = "SHAPE@%s" % (quantityAttribute.upper())
+    table = arcpy.da.TableToNumPyArray(intersection, [fidField, quantityField])
+    fids = table[fidField].astype(numpy.int64)
+    if cells is None:
+        grid_rows, grid_cols = FishnetOIDToNumpy(fids, projectedGrid.height, projectedGrid.width)
+    else:
+        #features are numbered from 1 in the order they were inserted
+        grid_rows, grid_cols = cellRows[fids - 1], cellCols[fids - 1]
+    quantities = numpy.bincount(grid_rows * projectedGrid.width + grid_cols, weights=table[quantityField],
+                                minlength=projectedGrid.height * projectedGrid.width)
+    quantities = quantities.reshape((projectedGrid.height, projectedGrid.width))
+
+    del table
+    arcpy.Delete_management(fishnet)
+    arcpy.Delete_management(intersection)
+    return quantities
+
+
 #TODO: use python Counter class when supported
 def getGridCount(grid, summaryField):
     """
@@ -273,6 +413,50 @@ def getGridCount(grid, summaryField):
     return totalCount, summary
 
 
+def getTableColumns(table, fields):
+    """
+    Read all records of a table at once
+
+    :param table: table, feature class, or raster (with attribute table)
+    :param fields: list of field names (or geometry tokens, such as SHAPE@AREA)
+    :return: list of numpy arrays of values, one per field
+    """
+
+    rows = arcpy.da.SearchCursor(getattr(table, "catalogPath", table), fields)
+    records = [row for row in rows]
+    del rows
+    if not records:
+        return [numpy.zeros(0) for field in fields]
+    return [numpy.array(column) for column in zip(*records)]
+
+
+def tallyFeatures(featureClass, summaryFields, quantityAttribute, conversionFactor):
+    """
+    Tally count and area or length of all features in feature class, and add them to summary fields
+
+    :param featureClass: feature class
+    :param summaryFields: dictionary of SummaryField objects by attribute name
+    :param quantityAttribute: area, length, or None
+    :param conversionFactor: factor to convert area or length to hectares or kilometers
+    :return: tuple of feature count, total area or length
+    """
+
+    fields = ["OID@"] + list(summaryFields.keys())
+    if quantityAttribute:
+        fields.append("SHAPE@%s" % (quantityAttribute.upper()))
+    columns = getTableColumns(featureClass, fields)
+    #Note: NOT number of features within each record in case of multi-part features
+    count = len(columns[0])
+    quantities = None
+    total = 0
+    if quantityAttribute:
+        quantities = columns[-1].astype(numpy.float64) * conversionFactor
+        total = float(quantities.sum())
+    for i, summaryField in enumerate(summaryFields):
+        summaryFields[summaryField].addRecords(columns[i + 1], 1, quantities)
+    return count, total
+
+
 def getGridValueField(grid):
     """
     Return value field name for grid, because case changes based on format
@@ -287,10 +471,217 @@ def getGridValueField(grid):
     return "VALUE"
 
 
+def getPreciseMaxPixels():
+    """
+    Return the number of pixels above which the precise method is too slow to use, for the configured coverage method
+    """
+
+    maxPrecisePixels = settings.PRECISE_MAX_PIXELS
+    if settings.PRECISE_COVERAGE_METHOD == "fishnet":
+        maxPrecisePixels = min(maxPrecisePixels, FISHNET_MAX_PIXELS)
+    return maxPrecisePixels
+
+
+def tabulateRasterAttributes(raster, layerName, attributes, uniqueValues, counts, quantities, fields=None,
+                             valueField=None):
+    """
+    Summarize attributes in raster attribute table, based on count and quantity tallied for each raster value
+
+    :param raster: raster with attribute table
+    :param layerName: name of layer, for error messages
+    :param attributes: list of attribute configurations from layer config
+    :param uniqueValues: array of raster values found within area of interest
+    :param counts: array of count of pixels for each value
+    :param quantities: array of quantity (area) for each value
+    :param fields: optional list of field names in raster attribute table, if already known
+    :param valueField: optional name of value field in raster attribute table, if already known
+    :return: list of results for each attribute
+    """
+
+    if fields is None:
+        fields = [field.name for field in arcpy.ListFields(raster)]
+    summaryFields = dict([(summaryField["attribute"], SummaryField(summaryField, True)) for summaryField in attributes])
+    diffFields = set(summaryFields.keys()).difference(fields)
+    if diffFields:
+        raise ValueError(
+            "FIELD_NOT_FOUND: Fields do not exist in layer %s: %s\nThese fields are present: %s"
+            % (layerName, ",".join([str(fieldName) for fieldName in diffFields]), ",".join(fields))
+        )
+
+    if valueField is None:
+        valueField = getGridValueField(raster)
+    columns = getTableColumns(raster, [valueField] + list(summaryFields.keys()))
+    rat_values = columns[0]
+    #Values will be absent if outside the analysis area
+    value_index = numpy.minimum(numpy.searchsorted(uniqueValues, rat_values), max(len(uniqueValues) - 1, 0))
+    present = numpy.zeros(len(rat_values), dtype=bool)
+    if len(uniqueValues):
+        present = uniqueValues[value_index] == rat_values
+    value_index = value_index[present]
+    for i, summaryField in enumerate(summaryFields):
+        summaryFields[summaryField].addRecords(columns[i + 1][present], counts[value_index], quantities[value_index])
+    return [summaryFields[summaryField].getResults() for summaryField in summaryFields]
+
+
+def canTabulateRasterWindows(layerConfig):
+    """
+    Return True if raster layer can be tabulated by reading the raster in windows (see tabulateRasterWindows)
+    """
+
+    if not settings.RASTER_STREAMING:
+        return False
+    return not [statistic for statistic in layerConfig.get("statistics", []) if not statistic.upper() in STATISTICS]
+
+
+def tabulateRasterWindows(srcFC, reader, window, layerConfig, spatialReference, pixelArea, layerName, messages,
+                          tileIndex=None, cellAreas=None):
+    """
+    Tabulate pixels of raster within area of interest, using the approximate method (pixels are counted if their center
+    is within the area of interest).  Raster is read in windows of limited size, and area of interest is rasterized onto
+    each window in memory, so no intermediate rasters are created.  Statistics are accumulated from each window as running
+    moments.
+
+    If a tile index of the raster is provided, tiles entirely within a polygon area of interest are tabulated from the
+    index, and only tiles that contain edges of the area of interest are read.
+
+    If cell areas are provided (rasters in geographic coordinates), quantities are the sum of the area of each pixel,
+    and statistics are weighted by the area of each pixel.
+
+    :param srcFC: source feature class wrapper
+    :param reader: RasterWindowReader for raster
+    :param window: GridTransform of window of raster that covers extent of area of interest
+    :param layerConfig: subset of config for a single layer
+    :param spatialReference: spatial reference of raster
+    :param pixelArea: area of each pixel, in hectares
+    :param layerName: name of layer, for error messages
+    :param messages: instance of MessageHandler
+    :param tileIndex: optional TileIndex of raster
+    :param cellAreas: optional GeodesicCellAreas of raster, in hectares
+    :return: dictionary of results
+    """
+
+    logger.debug("Tabulating %i pixels in windows of %i pixels" % (window.rows * window.cols, settings.RASTER_WINDOW_SIZE))
+    parts = srcFC.getGeometryParts(spatialReference)
+    geometryType = srcFC.getGeometryType()
+    classes = layerConfig.get("classes", [])
+    classBinner = ClassBinner(classes)
+    classCounts = numpy.zeros(len(classes), dtype=numpy.int64)
+    classQuantities = numpy.zeros(len(classes))
+    valueTallies = []
+    statistics = layerConfig.get("statistics")
+    runningStatistics = RunningStatistics()
+    sourcePixelCount = 0
+    intersectionCount = 0
+    intersectionQuantity = 0.0
+
+    blocks = window.getBlocks(settings.RASTER_WINDOW_SIZE)
+    #classes of floating point values cannot be tabulated from a tile index
+    if (tileIndex is not None and cellAreas is None and geometryType == "Polygon" and (statistics or reader.isInteger)
+            and tileIndex.grid == reader.grid and tileIndex.isInteger == reader.isInteger):
+        insideTiles, sourcePixelCount, blocks = tileIndex.decompose(parts, window)
+        intersectionCount = tileIndex.getCount(insideTiles)
+        if statistics:
+            runningStatistics.merge(tileIndex.getStatistics(insideTiles))
+        elif reader.isInteger:
+            valueTallies.append(tileIndex.getValueCounts(insideTiles) + (None,))
+        logger.debug("Tabulated %i pixels from tile index, reading %i tiles along edges of area of interest" %
+                     (sourcePixelCount, len(blocks)))
+        blockInside = [False] * len(blocks)
+    elif geometryType == "Polygon":
+        #blocks entirely inside the area of interest are not rasterized, and blocks entirely outside it are not read
+        decomposition = AOIDecomposition(parts, window.getBlockGrid(settings.RASTER_WINDOW_SIZE), geometryType)
+        blockStates = zip(blocks, decomposition.inside.ravel().tolist(), decomposition.boundary.ravel().tolist())
+        blocks = [block for block, inside, boundary in blockStates if inside or boundary]
+        blockInside = [inside for block, inside, boundary in blockStates if inside or boundary]
+    else:
+        blockInside = [False] * len(blocks)
+
+    for block, inside in zip(blocks, blockInside):
+        if inside:
+            mask = numpy.ones(block.shape, dtype=bool)
+        else:
+            mask = getPixelMask(parts, block, geometryType)
+        blockPixelCount = int(mask.sum())
+        if not blockPixelCount:
+            continue
+        sourcePixelCount += blockPixelCount
+
+        values = reader.read(block)
+        values.mask |= ~mask
+        intersectionCount += int(values.count())
+        areas = None
+        if cellAreas is not None:
+            areas = cellAreas.getCellAreas(block)
+            intersectionQuantity += float(areas[~values.mask].sum())
+        if statistics:
+            runningStatistics.update(values, areas)
+        elif reader.isInteger:
+            valueTallies.append(tallyValues(values, areas))
+        elif classes:
+            blockCounts, blockQuantities = classBinner.tally(values, areas)
+            classCounts += blockCounts
+            if areas is not None:
+                classQuantities += blockQuantities
+
+    messages.incrementMinorStep()
+
+    if cellAreas is None:
+        intersectionQuantity = float(intersectionCount) * pixelArea
+        classQuantities = classCounts * pixelArea
+
+    results = {
+        "sourcePixelCount": sourcePixelCount,
+        "intersectionCount": intersectionCount,
+        "intersectionQuantity": intersectionQuantity
+    }
+    if statistics:
+        results["statistics"] = runningStatistics.getStatistics(statistics)
+
+    elif not reader.isInteger:
+        if classes:
+            classResults = []
+            for classIndex in range(0, len(classes)):
+                classResults.append({
+                    'class': classes[classIndex],
+                    'intersectionCount': int(classCounts[classIndex]),
+                    'intersectionQuantity': float(classQuantities[classIndex])})
+            results['classes'] = classResults
+
+    else:
+        uniqueValues, counts = numpy.zeros(0, dtype=numpy.int64), numpy.zeros(0, dtype=numpy.int64)
+        quantities = numpy.zeros(0)
+        if valueTallies:
+            uniqueValues, counts, quantities = sumByValue(
+                numpy.concatenate([tally[0] for tally in valueTallies]),
+                numpy.concatenate([tally[1] for tally in valueTallies]),
+                numpy.concatenate([tally[2] for tally in valueTallies]) if cellAreas is not None else None)
+        if cellAreas is None:
+            quantities = counts * pixelArea
+        #use field names from metadata catalog if available, instead of listing fields again
+        fields, valueFieldName = None, None
+        if reader.metadata is not None:
+            fields, valueFieldName = reader.metadata.fieldNames, reader.metadata.valueField
+        if layerConfig.get("attributes"):
+            results["attributes"] = tabulateRasterAttributes(reader.raster, layerName, layerConfig["attributes"],
+                                                             uniqueValues, counts, quantities, fields,
+                                                             valueFieldName)
+        else:
+            if valueFieldName is None:
+                valueFieldName = getGridValueField(reader.raster)
+            valueField = SummaryField({'attribute': valueFieldName, 'classes': classes}, True)
+            valueField.addRecords(uniqueValues, counts, quantities)
+            key = "classes" if classes else "values"
+            results[key] = valueField.getResults()[key]
+
+    messages.incrementMinorStep()
+
+    return results
+
+
 def tabulateRasterLayer(srcFC, layer, layerConfig, spatialReference, messages):
     """
     srcFC: source feature class wrapper
-    layer: layer object
+    layer: LayerMetadata of layer (from metadata catalog)
     layerConfig: subset of config for a single layer
     spatialReference: spatial reference object with target projection
     """
@@ -304,11 +695,12 @@ def tabulateRasterLayer(srcFC, layer, layerConfig, spatialReference, messages):
         "method": "approximate"
     }
 
+    scratch = ScratchWorkspace()
     try:
         #Convert the projected user defined feature class (projFC) to a temporary raster - which is in the same spatial reference as the target raster.
-        lyrInfo = arcpy.Describe(layer.dataSource)
-        rasterExtent = lyrInfo.extent
-        extentInRasterProjection = srcFC.getExtent(lyrInfo.spatialReference, True)
+        layerSpatialReference = layer.getSpatialReference()
+        rasterExtent = layer.getExtent()
+        extentInRasterProjection = srcFC.getExtent(layerSpatialReference, True)
 
         #have to do the comparison ourselves; the builtin geometric comparisons don't work properly (e.g., extent.overlaps)
         if (extentInRasterProjection.XMin > rasterExtent.XMax or extentInRasterProjection.XMax < rasterExtent.XMin or
@@ -316,74 +708,152 @@ def tabulateRasterLayer(srcFC, layer, layerConfig, spatialReference, messages):
             logger.debug("Source features do not overlap target raster")
             return results
 
+        if (settings.GEOGRAPHIC_AREA_METHOD == "geodesic" and layerSpatialReference.type == "Geographic" and
+                canTabulateRasterWindows(layerConfig)):
+            reader = RasterWindowReader(layer.dataSource, layer)
+            clippedWindow = reader.grid.getWindowForExtent(extentInRasterProjection.XMin, extentInRasterProjection.YMin,
+                                                           extentInRasterProjection.XMax, extentInRasterProjection.YMax)
+            numPixels = clippedWindow.rows * clippedWindow.cols
+            #small polygon and line areas of interest use the precise method on the projected raster instead
+            if numPixels > getPreciseMaxPixels() or not srcFC.getGeometryType() in ["Polygon", "Polyline"]:
+                #tabulate on the native grid, weighting each pixel by its area on the ellipsoid, instead of projecting
+                #raster
+                logger.debug("Large input grid or point input in geographic coordinates, using geodesic pixel areas on "
+                             "native grid")
+                aoiWindow = reader.grid.getWindowForExtent(extentInRasterProjection.XMin, extentInRasterProjection.YMin,
+                                                           extentInRasterProjection.XMax, extentInRasterProjection.YMax,
+                                                           clip=False)
+                cellAreas = GeodesicCellAreas(layerSpatialReference, HECTARES_PER_SQUARE_METER)
+                results['projection'] = "native"
+                #pixels differ in area by row; report the area of pixels in the middle of the area of interest
+                results['pixelArea'] = float(cellAreas.getRowAreas(aoiWindow.window(aoiWindow.rows // 2, 0, 1, 1))[0])
+                messages.incrementMinorStep()
+                results.update(tabulateRasterWindows(srcFC, reader, aoiWindow, layerConfig, layerSpatialReference,
+                                                     results['pixelArea'], layer.name, messages, cellAreas=cellAreas))
+                return results
+            del reader
+
+        if canTabulateRasterWindows(layerConfig) and ProjectionUtilities.isValidAreaProjection(layerSpatialReference):
+            #read directly from the raster if it would be tabulated using the approximate method in its native projection
+            reader = RasterWindowReader(layer.dataSource, layer)
+            aoiWindow = reader.grid.getWindowForExtent(extentInRasterProjection.XMin, extentInRasterProjection.YMin,
+                                                       extentInRasterProjection.XMax, extentInRasterProjection.YMax,
+                                                       clip=False)
+            clippedWindow = reader.grid.getWindowForExtent(extentInRasterProjection.XMin, extentInRasterProjection.YMin,
+                                                           extentInRasterProjection.XMax, extentInRasterProjection.YMax)
+            numPixels = clippedWindow.rows * clippedWindow.cols
+            if numPixels > getPreciseMaxPixels() or not srcFC.getGeometryType() in ["Polygon", "Polyline"]:
+                logger.debug("Large input grid or point input, using approximate method on raster in native projection")
+                results['projection'] = "native"
+                pixelArea = (reader.grid.cellArea *
+                             ProjectionUtilities.getProjUnitFactors(layerSpatialReference)[1])
+                results['pixelArea'] = pixelArea
+                messages.incrementMinorStep()
+                tileIndex = getTileIndex(layer.dataSource, layer.version)
+                results.update(tabulateRasterWindows(srcFC, reader, aoiWindow, layerConfig, layerSpatialReference,
+                                                     pixelArea, layer.name, messages, tileIndex))
+                return results
+            del reader
+
+        #layers that need to be projected are assembled from cached projected tiles, if enabled
+        tileReader = None
+        if not ProjectionUtilities.isValidAreaProjection(layerSpatialReference):
+            tileReader = getProjectedTileReader(layer, spatialReference)
+        if tileReader is not None:
+            aoiExtent = srcFC.getExtent(spatialReference, True)
+            aoiWindow = tileReader.grid.getWindowForExtent(aoiExtent.XMin, aoiExtent.YMin, aoiExtent.XMax,
+                                                           aoiExtent.YMax, clip=False)
+            clippedWindow = tileReader.grid.getWindowForExtent(aoiExtent.XMin, aoiExtent.YMin, aoiExtent.XMax,
+                                                               aoiExtent.YMax)
+            numPixels = clippedWindow.rows * clippedWindow.cols
+            if numPixels > getPreciseMaxPixels() or not srcFC.getGeometryType() in ["Polygon", "Polyline"]:
+                if canTabulateRasterWindows(layerConfig):
+                    logger.debug("Large input grid or point input, using approximate method on projected tiles")
+                    results['projection'] = "custom"
+                    pixelArea = tileReader.grid.cellArea * ProjectionUtilities.getProjUnitFactors(spatialReference)[1]
+                    results['pixelArea'] = pixelArea
+                    messages.incrementMinorStep()
+                    try:
+                        results.update(tabulateRasterWindows(srcFC, tileReader, aoiWindow, layerConfig,
+                                                             spatialReference, pixelArea, layer.name, messages))
+                    finally:
+                        tileReader.close()
+                    return results
+                #Spatial Analyst methods need the attribute table of a projected raster
+                tileReader.close()
+                tileReader = None
+
         arcpy.CheckOutExtension("Spatial")
 
         #TODO: if point type, branch here and use sample tool
 
 
-        #extract using extent
-        clippedGrid = os.path.join(arcpy.env.scratchWorkspace, "data.img")
-        arcpy.Clip_management(layer.dataSource,
-                              "%f %f %f %f" % (extentInRasterProjection.XMin, extentInRasterProjection.YMin,
-                                               extentInRasterProjection.XMax, extentInRasterProjection.YMax),
-                              clippedGrid, "#", "#", "NONE")
+        if tileReader is not None:
+            logger.debug("Assembling projected raster from cached tiles")
+            results['projection'] = "custom"
+            try:
+                projectedGrid = tileReader.saveWindow(clippedWindow, scratch.getRasterPath("projData"))
+            finally:
+                tileReader.close()
+            messages.incrementMinorStep()
+            arcpy.env.snapRaster = projectedGrid
+            projectedGrid = arcpy.Raster(projectedGrid)
 
-        messages.incrementMinorStep()
+        else:
+            #extract using extent
+            clippedGrid = scratch.getRasterPath("data")
+            arcpy.Clip_management(layer.dataSource,
+                                  "%f %f %f %f" % (extentInRasterProjection.XMin, extentInRasterProjection.YMin,
+                                                   extentInRasterProjection.XMax, extentInRasterProjection.YMax),
+                                  clippedGrid, "#", "#", "NONE")
 
-        logger.debug("Raster projection is: %s\n(%s)" % (lyrInfo.spatialReference.projectionName, lyrInfo.spatialReference.exporttostring()))
+            messages.incrementMinorStep()
 
-        projectedGrid = None
-        if ProjectionUtilities.isValidAreaProjection(lyrInfo.spatialReference):
-            logger.debug("Raster is in valid projection for calculating areas, using that instead of custom projection")
-            results['projection'] = "native"
-            spatialReference = lyrInfo.spatialReference
-            arcpy.env.snapRaster = clippedGrid
-            projectedGrid = arcpy.Raster(clippedGrid)
+            logger.debug("Raster projection is: %s\n(%s)" % (layerSpatialReference.projectionName, layerSpatialReference.exporttostring()))
 
-        else:
-            #only project if necessary
-            logger.debug("Projecting raster to target projection")
-            results['projection'] = "custom"
-            projectedGrid = os.path.join(arcpy.env.scratchWorkspace, "projData.img")
-            geoTransform = ProjectionUtilities.getGeoTransform(lyrInfo.spatialReference, spatialReference)
-            arcpy.ProjectRaster_management(clippedGrid, projectedGrid, spatialReference.exportToString(),
-                                           geographic_transform=geoTransform)
-            arcpy.env.snapRaster = projectedGrid
-            projectedGrid = arcpy.Raster(projectedGrid)
+            projectedGrid = None
+            if ProjectionUtilities.isValidAreaProjection(layerSpatialReference):
+                logger.debug("Raster is in valid projection for calculating areas, using that instead of custom projection")
+                results['projection'] = "native"
+                spatialReference = layerSpatialReference
+                arcpy.env.snapRaster = clippedGrid
+                projectedGrid = arcpy.Raster(clippedGrid)
+
+            else:
+                #only project if necessary
+                logger.debug("Projecting raster to target projection")
+                results['projection'] = "custom"
+                projectedGrid = scratch.getRasterPath("projData")
+                geoTransform = ProjectionUtilities.getGeoTransform(layerSpatialReference, spatialReference)
+                arcpy.ProjectRaster_management(clippedGrid, projectedGrid, spatialReference.exportToString(),
+                                               geographic_transform=geoTransform)
+                arcpy.env.snapRaster = projectedGrid
+                projectedGrid = arcpy.Raster(projectedGrid)
 
         messages.incrementMinorStep()
 
         pixelArea = (projectedGrid.meanCellHeight * projectedGrid.meanCellWidth * ProjectionUtilities.getProjUnitFactors(spatialReference)[1])
         results['pixelArea'] = pixelArea
 
-        #get projected features
-        projFC = srcFC.project(spatialReference)
-
         numPixels = projectedGrid.height * projectedGrid.width
         logger.debug("%i pixels within extent of source features" % (numPixels))
 
-        #arbitrary limit above which too big to use more exact fishnet-based area weighted methods
-        if numPixels <= 50000 and srcFC.getGeometryType() in ["Polygon", "Polyline"]:
-            import numpy
-
+        #limit above which too big to use more exact area weighted methods
+        if numPixels <= getPreciseMaxPixels() and srcFC.getGeometryType() in ["Polygon", "Polyline"]:
             results['method'] = "precise"
             logger.debug("Small input grid, using precise method")
 
-            logger.debug("Creating fishnet")
-            fishnet = os.path.join(get_scratch_GDB(), "fishnet")
-            arcpy.CreateFishnet_management(fishnet, "%f %f" % (projectedGrid.extent.XMin, projectedGrid.extent.YMin),
-                                           "%f %f" % (projectedGrid.extent.XMin, projectedGrid.extent.YMax),
-                                           projectedGrid.meanCellWidth, projectedGrid.meanCellHeight,
-                                           projectedGrid.height,
-                                           projectedGrid.width, "#", False, projectedGrid, "POLYGON")
-
-            messages.incrementMinorStep()
-
-            logger.debug("Intersecting with area of interest")
-            intersection = os.path.join(get_scratch_GDB(), "intersection")
-            arcpy.Intersect_analysis("%s #;%s #" % (projFC, fishnet), intersection, "ONLY_FID", "#", "INPUT")
-
-            messages.incrementMinorStep()
+            #only pixels on the boundary of the area of interest need the area or length within them calculated
+            decomposition = AOIDecomposition(srcFC.getGeometryParts(spatialReference), getGridTransform(projectedGrid),
+                                             srcFC.getGeometryType())
+            if settings.PRECISE_COVERAGE_METHOD == "fishnet":
+                quantities = decomposition.getCoverage(
+                    getFishnetQuantities(srcFC.project(spatialReference), projectedGrid, srcFC.getQuantityAttribute(),
+                                         messages, scratch, decomposition.boundary))
+            else:
+                logger.debug("Calculating area or length of area of interest within each pixel")
+                quantities = decomposition.getCoverage()
+                messages.incrementMinorStep()
 
             logger.debug("Tabulating quantities")
             fix_nodata = False
@@ -394,27 +864,8 @@ def tabulateRasterLayer(srcFC, layer, layerConfig, spatialReference, messages):
                 logger.debug("Could not apply nodata directly to numpy array as numpy.nan, masking later")
                 values = arcpy.RasterToNumPyArray(projectedGrid)
                 fix_nodata = True
-            quantities = numpy.zeros(values.shape)
-            quantityAttribute = srcFC.getQuantityAttribute()
-            areaLengthFactor = 0
-            totalQuantity = 0.0
-            if srcFC.getGeometryType() == "Polyline":
-                areaLengthFactor = ProjectionUtilities.getProjUnitFactors(spatialReference)[0]
-            elif srcFC.getGeometryType() == "Polygon":
-                areaLengthFactor = ProjectionUtilities.getProjUnitFactors(spatialReference)[1]
-            rows = arcpy.SearchCursor(intersection)
-            for row in rows:
-                OID = row.getValue("FID_%s" % (os.path.split(fishnet)[1]))
-                grid_row, grid_col = FishnetOIDToNumpy(OID, projectedGrid.height, projectedGrid.width)
-                quantity = getattr(row.shape, quantityAttribute) * areaLengthFactor
-                totalQuantity += quantity
-                quantities[grid_row][grid_col] += quantity
-
-            del row, rows
-            arcpy.Delete_management(fishnet)
-            del fishnet
-            arcpy.Delete_management(intersection)
-            del intersection
+            quantities *= srcFC.getGeometryConversionFactor(spatialReference)
+            totalQuantity = float(quantities.sum())
 
             #mask out the original NoData values and areas outside AOI
             if fix_nodata:
@@ -464,193 +915,201 @@ def tabulateRasterLayer(srcFC, layer, layerConfig, spatialReference, messages):
                     #only option is classes of original values
                     if layerConfig.has_key("classes"):
                         logger.debug("Classifying input raster")
-                        results.update({'classes': getNumpyClassQuantities(values, quantities, layerConfig["classes"])})
+                        results.update({'classes': getNumpyClassQuantities(values, quantities, layerConfig["classes"],
+                                                                           decomposition)})
                 else:
                     logger.debug("Tabulating unique values")
                     values = values.astype(int)
-                    by_value_results = getNumpyValueQuantities(values, quantities)
+                    unique_values, value_counts, value_quantities = getNumpyValueQuantities(values, quantities,
+                                                                                            decomposition)
 
-                    if layerConfig.has_key("attributes") and len(layerConfig["attributes"]):
-                        arcpy.BuildRasterAttributeTable_management(projectedGrid)
-                        fields = [field.name for field in arcpy.ListFields(projectedGrid)]
-                        summaryFields = dict(
-                            [(summaryField["attribute"], SummaryField(summaryField, True)) for summaryField in
-                             layerConfig.get("attributes", [])])
-                        diffFields = set(summaryFields.keys()).difference(fields)
-                        if diffFields:
-                            raise ValueError(
-                                "FIELD_NOT_FOUND: Fields do not exist in layer %s: %s\nThese fields are present: %s"
-                                % (layer.name, ",".join([str(fieldName) for fieldName in diffFields]), ",".join(fields))
-                            )
-
-                        rows = arcpy.SearchCursor(projectedGrid)
-                        valueField = getGridValueField(projectedGrid)
+                    if layerConfig.has_key("attributes") and len(layerConfig["attributes"]) and tileReader is not None:
+                        #raster assembled from tiles has no attribute table; values are unchanged by projection
+                        results['attributes'] = tabulateRasterAttributes(layer.dataSource, layer.name,
+                                                                         layerConfig["attributes"], unique_values,
+                                                                         value_counts, value_quantities,
+                                                                         layer.fieldNames, layer.valueField)
 
-                        for row in rows:
-                            value = row.getValue(valueField)
-                            if value in by_value_results:
-                                #Values will be absent if outside the analysis area
-                                count = by_value_results[value]['intersectionCount']
-                                quantity = by_value_results[value]['intersectionQuantity']
-                                for summaryField in summaryFields:
-                                    summaryFields[summaryField].addRecord(row.getValue(summaryField), count, quantity)
-                        del rows
-                        results['attributes'] = []
-                        for summaryField in summaryFields:
-                            results["attributes"].append(summaryFields[summaryField].getResults())
+                    elif layerConfig.has_key("attributes") and len(layerConfig["attributes"]):
+                        arcpy.BuildRasterAttributeTable_management(projectedGrid)
+                        results['attributes'] = tabulateRasterAttributes(projectedGrid, layer.name,
+                                                                         layerConfig["attributes"], unique_values,
+                                                                         value_counts, value_quantities)
 
                     else:
                         if layerConfig.has_key("classes"):
                             results.update(
-                                {'classes': getNumpyClassQuantities(values, quantities, layerConfig["classes"])})
+                                {'classes': getNumpyClassQuantities(values, quantities, layerConfig["classes"],
+                                                                    decomposition)})
                         else:
-                            unique_values = by_value_results.keys()
-                            unique_values.sort()
                             value_results = []
-                            for value in unique_values:
+                            for value, count, quantity in zip(unique_values.tolist(), value_counts.tolist(),
+                                                              value_quantities.tolist()):
                                 value_results.append(
                                     {
                                         'value': value,
-                                        'intersectionCount': by_value_results[value]['intersectionCount'],
-                                        'intersectionQuantity': by_value_results[value]['intersectionQuantity']
+                                        'intersectionCount': count,
+                                        'intersectionQuantity': quantity
                                     }
                                 )
                             results.update({'values': value_results})
         else:
             logger.debug("Large input grid or point input, using approximate method")
 
-            logger.debug("Creating area of interest raster")
-            aoiGrid = os.path.join(arcpy.env.scratchWorkspace, "aoiGrid.img")
-            #arcpy.Describe(projFC).OIDFieldName  #we control this, not needed
-            arcpy.FeatureToRaster_conversion(projFC, "OBJECTID", aoiGrid, projectedGrid.meanCellHeight)
-            arcpy.BuildRasterAttributeTable_management(aoiGrid)
-            results["sourcePixelCount"] = getGridCount(aoiGrid, None)[0]
+            if canTabulateRasterWindows(layerConfig):
+                aoiExtent = srcFC.getExtent(spatialReference, True)
+                reader = RasterWindowReader(projectedGrid)
+                window = reader.grid.getWindowForExtent(aoiExtent.XMin, aoiExtent.YMin, aoiExtent.XMax, aoiExtent.YMax,
+                                                        clip=False)
+                results.update(tabulateRasterWindows(srcFC, reader, window, layerConfig, spatialReference, pixelArea,
+                                                     layer.name, messages))
+                del reader
 
-            messages.incrementMinorStep()
-
-            if layerConfig.has_key("statistics"):
-                results["statistics"] = dict()
-                logger.debug("Creating zone grid for statistics from area of interest grid")
-                zoneGrid = arcpy.sa.Times(aoiGrid, 0)
-
-                statistics = dict()
-                for statistic in layerConfig["statistics"]:
-                    arcgisStatistic = statistic.upper()
-                    statistics[statistic] = (arcgisStatistic + "IMUM" if arcgisStatistic in ("MIN", "MAX")
-                                             else arcgisStatistic)
-                zonalStatsTable = "%s/zonalStatsTable" % (get_scratch_GDB())
-                if arcpy.Exists(zonalStatsTable):
-                    arcpy.Delete_management(zonalStatsTable)
-                arcpy.BuildRasterAttributeTable_management(zoneGrid)
-                logger.debug("Executing zonal statistics: %s" % (",".join(statistics.values())))
-                zonalStatsTable = arcpy.sa.ZonalStatisticsAsTable(zoneGrid, getGridValueField(zoneGrid),
-                                                                  arcpy.Raster(layer.dataSource), zonalStatsTable,
-                                                                  "DATA", "ALL")
-                del zoneGrid
+            else:
+                logger.debug("Creating area of interest raster")
+                aoiGrid = scratch.getRasterPath("aoiGrid")
+                #arcpy.Describe(projFC).OIDFieldName  #we control this, not needed
+                arcpy.FeatureToRaster_conversion(srcFC.project(spatialReference), "OBJECTID", aoiGrid,
+                                                 projectedGrid.meanCellHeight)
+                arcpy.BuildRasterAttributeTable_management(aoiGrid)
+                results["sourcePixelCount"] = getGridCount(aoiGrid, None)[0]
 
                 messages.incrementMinorStep()
 
-                totalCount = 0
-                rows = arcpy.SearchCursor(zonalStatsTable)
-                if rows:
-                    for row in rows:
-                        totalCount += row.COUNT
-                        for statistic in statistics:
-                            results["statistics"][statistic] = row.getValue(statistic.upper())
-                        break  #should only have one row
-                    del row
-                del rows, zonalStatsTable
-                arcpy.Delete_management("%s/zonalStatsTable" % (get_scratch_GDB()))
-                results["intersectionCount"] = totalCount
+                if layerConfig.has_key("statistics"):
+                    results["statistics"] = dict()
+                    logger.debug("Creating zone grid for statistics from area of interest grid")
+                    zoneGrid = arcpy.sa.Times(aoiGrid, 0)
+
+                    statistics = dict()
+                    for statistic in layerConfig["statistics"]:
+                        arcgisStatistic = statistic.upper()
+                        statistics[statistic] = (arcgisStatistic + "IMUM" if arcgisStatistic in ("MIN", "MAX")
+                                                 else arcgisStatistic)
+                    zonalStatsTable = scratch.getGDBPath("zonalStatsTable")
+                    arcpy.BuildRasterAttributeTable_management(zoneGrid)
+                    logger.debug("Executing zonal statistics: %s" % (",".join(statistics.values())))
+                    zonalStatsTable = arcpy.sa.ZonalStatisticsAsTable(zoneGrid, getGridValueField(zoneGrid),
+                                                                      arcpy.Raster(layer.dataSource), zonalStatsTable,
+                                                                      "DATA", "ALL")
+                    del zoneGrid
+
+                    messages.incrementMinorStep()
 
-            else:
-                #clip the target using this grid, snapped to the original grid - watch for alignment issues in aoiGrid - snapRaster is not used there
-                logger.debug("Extracting area of interest from %s" % (layer.name))
-                clipGrid = arcpy.sa.ExtractByMask(projectedGrid, aoiGrid)
+                    totalCount = 0
+                    rows = arcpy.SearchCursor(zonalStatsTable)
+                    if rows:
+                        for row in rows:
+                            totalCount += row.COUNT
+                            for statistic in statistics:
+                                results["statistics"][statistic] = row.getValue(statistic.upper())
+                            break  #should only have one row
+                        del row
+                    del rows, zonalStatsTable
+                    results["intersectionCount"] = totalCount
 
-                messages.incrementMinorStep()
+                else:
+                    #clip the target using this grid, snapped to the original grid - watch for alignment issues in aoiGrid - snapRaster is not used there
+                    logger.debug("Extracting area of interest from %s" % (layer.name))
+                    clipGrid = arcpy.sa.ExtractByMask(projectedGrid, aoiGrid)
 
-                if not clipGrid.isInteger:
-                    #force to single bit data, since we can't build attribute tables of floating point data.
-                    testGrid = arcpy.sa.IsNull(clipGrid)
-                    arcpy.BuildRasterAttributeTable_management(testGrid)
-                    results["intersectionCount"] = getGridCount(testGrid, getGridValueField(testGrid))[1][0]
-                    #testGrid.save(os.path.join(arcpy.env.scratchWorkspace,"isnull")) #for testing
-                    del testGrid
+                    messages.incrementMinorStep()
 
-                    if layerConfig.has_key("classes"):
-                        classCounts = getGridClasses(clipGrid, getGridValueField(clipGrid), layerConfig["classes"])
-                        classResults = []
-                        for classIndex in range(0, len(layerConfig["classes"])):
-                            count = classCounts.get(classIndex, 0)
-                            classResults.append({
-                                'class': layerConfig["classes"][classIndex],
-                                'intersectionCount': count,
-                                'intersectionQuantity': (float(count) * pixelArea)})
-                        results.update({'classes': classResults})
+                    if not clipGrid.isInteger:
+                        #force to single bit data, since we can't build attribute tables of floating point data.
+                        testGrid = arcpy.sa.IsNull(clipGrid)
+                        arcpy.BuildRasterAttributeTable_management(testGrid)
+                        results["intersectionCount"] = getGridCount(testGrid, getGridValueField(testGrid))[1][0]
+                        #testGrid.save(os.path.join(arcpy.env.scratchWorkspace,"isnull")) #for testing
+                        del testGrid
 
-                else:
-                    arcpy.BuildRasterAttributeTable_management(clipGrid)
-                    valueField = getGridValueField(clipGrid)
-                    promoteValueResults = False
-                    if not layerConfig.has_key("attributes"):
-                        promoteValueResults = True
-                        layerConfig["attributes"] = [{'attribute': valueField}]
                         if layerConfig.has_key("classes"):
-                            layerConfig["attributes"][0]['classes'] = layerConfig['classes']
-
-                    summaryFields = dict(
-                        [
-                            (summaryField["attribute"], SummaryField(summaryField, True)) for summaryField in layerConfig.get("attributes", [])
-                        ]
-                    )
-                    if summaryFields:
-                        fieldList = set([field.name for field in arcpy.ListFields(clipGrid)])
-                        diffFields = set(summaryFields.keys()).difference(fieldList)
-                        if diffFields:
-                            raise ValueError("FIELD_NOT_FOUND: Fields do not exist in layer %s: %s" % (
-                            layer.name, ",".join([str(fieldName) for fieldName in diffFields])))
-                        if not promoteValueResults:
-                            results["attributes"] = []
-
-                    #TODO: use python Counter class if available (python > 2.7)
-                    totalCount = 0
-                    rows = arcpy.SearchCursor(clipGrid, "", "")
-                    for row in rows:
-                        totalCount += row.COUNT
-                        for summaryField in summaryFields:
-                            summaryFields[summaryField].addRecord(row.getValue(summaryField), row.COUNT,
-                                                                  row.COUNT * pixelArea)
-                    del rows
-                    results["intersectionCount"] = totalCount
+                            classCounts = getGridClasses(clipGrid, getGridValueField(clipGrid), layerConfig["classes"])
+                            classResults = []
+                            for classIndex in range(0, len(layerConfig["classes"])):
+                                count = classCounts.get(classIndex, 0)
+                                classResults.append({
+                                    'class': layerConfig["classes"][classIndex],
+                                    'intersectionCount': count,
+                                    'intersectionQuantity': (float(count) * pixelArea)})
+                            results.update({'classes': classResults})
 
-                    if promoteValueResults:
-                        key = "classes" if layerConfig.has_key("classes") else "values"
-                        results[key] = summaryFields[valueField].getResults()[key]
                     else:
-                        for summaryField in summaryFields:
-                            results["attributes"].append(summaryFields[summaryField].getResults())
+                        arcpy.BuildRasterAttributeTable_management(clipGrid)
+                        valueField = getGridValueField(clipGrid)
+                        promoteValueResults = False
+                        if not layerConfig.has_key("attributes"):
+                            promoteValueResults = True
+                            layerConfig["attributes"] = [{'attribute': valueField}]
+                            if layerConfig.has_key("classes"):
+                                layerConfig["attributes"][0]['classes'] = layerConfig['classes']
 
-                arcpy.Delete_management(clipGrid)
-                del clipGrid
-            arcpy.Delete_management(aoiGrid)
-            del aoiGrid
+                        summaryFields = dict(
+                            [
+                                (summaryField["attribute"], SummaryField(summaryField, True)) for summaryField in layerConfig.get("attributes", [])
+                            ]
+                        )
+                        if summaryFields:
+                            fieldList = set([field.name for field in arcpy.ListFields(clipGrid)])
+                            diffFields = set(summaryFields.keys()).difference(fieldList)
+                            if diffFields:
+                                raise ValueError("FIELD_NOT_FOUND: Fields do not exist in layer %s: %s" % (
+                                layer.name, ",".join([str(fieldName) for fieldName in diffFields])))
+                            if not promoteValueResults:
+                                results["attributes"] = []
+
+                        columns = getTableColumns(clipGrid, ["COUNT"] + list(summaryFields.keys()))
+                        counts = columns[0].astype(numpy.int64)
+                        for i, summaryField in enumerate(summaryFields):
+                            summaryFields[summaryField].addRecords(columns[i + 1], counts, counts * pixelArea)
+                        results["intersectionCount"] = int(counts.sum())
+
+                        if promoteValueResults:
+                            key = "classes" if layerConfig.has_key("classes") else "values"
+                            results[key] = summaryFields[valueField].getResults()[key]
+                        else:
+                            for summaryField in summaryFields:
+                                results["attributes"].append(summaryFields[summaryField].getResults())
+
+                    arcpy.Delete_management(clipGrid)
+                    del clipGrid
+                del aoiGrid
 
             results["intersectionQuantity"] = float(results["intersectionCount"]) * pixelArea
 
-        try:
-            arcpy.Delete_management(clippedGrid)
-            #this is causing issues on server, maybe getting deleted too soon? TODO: create a delete tool that runs in a try-catch block
-            if projectedGrid is not None:
-                arcpy.Delete_management(projectedGrid)
-        except:
-            pass
+        del projectedGrid
     finally:
-        arcpy.CheckInExtension("Spatial")
+        #failures to delete are only logged; deleting too soon causes issues on server
+        scratch.close()
+        if not _spatialExtensionHeld:
+            arcpy.CheckInExtension("Spatial")
 
     return results
 
 
+def holdSpatialExtension():
+    """
+    Check out the Spatial Analyst extension until releaseSpatialExtension is called, instead of for each raster layer
+    """
+
+    global _spatialExtensionHeld
+    status = arcpy.CheckOutExtension("Spatial")
+    if status != "CheckedOut":
+        raise GPToolError("LICENSE_NOT_AVAILABLE: Spatial Analyst extension (%s)" % (status))
+    _spatialExtensionHeld = True
+
+
+def releaseSpatialExtension():
+    """
+    Check in the Spatial Analyst extension held by holdSpatialExtension
+    """
+
+    global _spatialExtensionHeld
+    if _spatialExtensionHeld:
+        arcpy.CheckInExtension("Spatial")
+        _spatialExtensionHeld = False
+
+
 def tabulateFeatureLayer(srcFC, layer, layerConfig, spatialReference, messages):
     logger.debug("tabulateFeatureLayer: %s" % (layer.name))
 
@@ -658,205 +1117,338 @@ def tabulateFeatureLayer(srcFC, layer, layerConfig, spatialReference, messages):
     arcpy.env.cartographicCoordinateSystem = None
     results = dict()
 
-    lyrInfo = arcpy.Describe(layer.dataSource)
-    #select features from layer using target projection and where clause (if provided)
-    selLyr = arcpy.MakeFeatureLayer_management(layer, "selLyr", layerConfig.get("where", "")).getOutput(0)
-    #must project source features into native projection of layer for selection to work properly
-    projSrcFC = srcFC.project(lyrInfo.spatialReference)
-    arcpy.SelectLayerByLocation_management(selLyr, "INTERSECT", projSrcFC)
-    logger.debug("Selected features from target layer that intersect area of interest")
-    featureCount = int(arcpy.GetCount_management(selLyr).getOutput(0))
-    logger.debug("Found %s intersecting features" % (featureCount))
-
-    messages.incrementMinorStep()
-
-    if featureCount > 0:
-        arcpy.env.cartographicCoordinateSystem = spatialReference
-        selFC = "IN_MEMORY/selFC"
-        #Selected features must be copied into new feature class for projection step, otherwise it uses the entire dataset (lame!)
-        logger.debug("Copying selected features to in-memory feature class")
-        arcpy.CopyFeatures_management(selLyr, selFC)
-
-        messages.incrementMinorStep()
-
-        #project the selection to target projection, and then intersect with source (in target projection)
-        geoTransform = ProjectionUtilities.getGeoTransform(lyrInfo.spatialReference, spatialReference)
-        logger.debug("Projecting selected features from %s" % (layer.name))
-        projFC = FeatureClassWrapper(
-            arcpy.Project_management(selFC, "projFC", spatialReference, geoTransform).getOutput(0))
-        logger.debug("Intersecting selected features with area of interest")
-        intFC = FeatureClassWrapper(arcpy.Intersect_analysis([srcFC.project(spatialReference), projFC.featureClass],
-                                                             "IN_MEMORY/" + "intFC").getOutput(0))
+    scratch = ScratchWorkspace()
+    try:
+        layerSpatialReference = layer.getSpatialReference()
+        #select features from layer using target projection and where clause (if provided)
+        selLyr = arcpy.MakeFeatureLayer_management(layer.dataSource, scratch.getLayerName("selLyr"),
+                                                   layerConfig.get("where", "")).getOutput(0)
+        #must project source features into native projection of layer for selection to work properly
+        projSrcFC = srcFC.project(layerSpatialReference)
+        arcpy.SelectLayerByLocation_management(selLyr, "INTERSECT", projSrcFC)
+        logger.debug("Selected features from target layer that intersect area of interest")
+        featureCount = int(arcpy.GetCount_management(selLyr).getOutput(0))
+        logger.debug("Found %s intersecting features" % (featureCount))
 
         messages.incrementMinorStep()
 
-        featureCount = int(arcpy.GetCount_management(intFC.featureClass).getOutput(0))
         if featureCount > 0:
-            intersectionQuantityAttribute = intFC.getQuantityAttribute()
-            intersectionConversionFactor = intFC.getGeometryConversionFactor(spatialReference)
-            intersectionSummaryFields = dict(
-                [(summaryField["attribute"], SummaryField(summaryField, intersectionQuantityAttribute is not None)) for
-                 summaryField in layerConfig.get("attributes", [])])
-
-            intersectedQuantityAttribute = projFC.getQuantityAttribute()
-            intersectedConversionFactor = projFC.getGeometryConversionFactor(spatialReference)
-            intersectedSummaryFields = copy.deepcopy(intersectionSummaryFields)
-
-            if intersectionSummaryFields:
-                fieldList = set([field.name for field in arcpy.ListFields(intFC.featureClass)])
-                diffFields = set(intersectionSummaryFields.keys()).difference(fieldList)
-                if diffFields:
-                    raise ValueError("FIELD_NOT_FOUND: Fields do not exist in layer %s: %s" % (
-                    layer.name, ",".join([str(fieldName) for fieldName in diffFields])))
-                results["attributes"] = []
-
-            logger.debug("Tallying intersection results")
-            #tally results for intersection
-            rows = arcpy.SearchCursor(intFC.featureClass)
-                #TODO: may want to pare this down to SHAPE and summary fields only
-            total = 0
-            count = 0
-            for row in rows:
-                geometryCount = 1  #Note: NOT number of features within this record in case of multi-part features
-                count += geometryCount
-                quantity = 0
-                if intersectionQuantityAttribute:
-                    quantity = getattr(row.shape, intersectionQuantityAttribute) * intersectionConversionFactor
-                    total += quantity
-                for summaryField in intersectionSummaryFields:
-                    intersectionSummaryFields[summaryField].addRecord(row.getValue(summaryField), geometryCount,
-                                                                      quantity)
-            del row, rows
+            arcpy.env.cartographicCoordinateSystem = spatialReference
+            selFC = scratch.getMemoryPath("selFC")
+            #Selected features must be copied into new feature class for projection step, otherwise it uses the entire dataset (lame!)
+            logger.debug("Copying selected features to in-memory feature class")
+            arcpy.CopyFeatures_management(selLyr, selFC)
 
             messages.incrementMinorStep()
 
-            results["intersectionGeometryType"] = intFC.getGeometryType().lower().replace("polyline", "line")
-            results["intersectionCount"] = count
-            if intersectionQuantityAttribute:
-                results["intersectionQuantity"] = total
-
-            logger.debug("Tallying intersected feature results")
-            #tally results for intersected features
-            rows = arcpy.SearchCursor(projFC.featureClass)
-            total = 0
-            count = 0
-            for row in rows:
-                geometryCount = 1  #row.shape.partCount
-                count += geometryCount
-                quantity = 0
-                if intersectedQuantityAttribute:
-                    quantity = getattr(row.shape, intersectedQuantityAttribute) * intersectedConversionFactor
-                    total += quantity
-                for summaryField in intersectedSummaryFields:
-                    intersectedSummaryFields[summaryField].addRecord(row.getValue(summaryField), geometryCount,
-                                                                     quantity)
-            del row, rows
+            #project the selection to target projection, and then intersect with source (in target projection)
+            geoTransform = ProjectionUtilities.getGeoTransform(layerSpatialReference, spatialReference)
+            logger.debug("Projecting selected features from %s" % (layer.name))
+            projFC = FeatureClassWrapper(arcpy.Project_management(selFC, scratch.getGDBPath("projFC"), spatialReference,
+                                                                  geoTransform).getOutput(0))
+            logger.debug("Intersecting selected features with area of interest")
+            intFC = FeatureClassWrapper(arcpy.Intersect_analysis([srcFC.project(spatialReference), projFC.featureClass],
+                                                                 scratch.getMemoryPath("intFC")).getOutput(0))
 
             messages.incrementMinorStep()
 
-            results["intersectedGeometryType"] = projFC.getGeometryType().lower().replace("polyline", "line")
-            results["intersectedCount"] = count
-            if intersectedQuantityAttribute:
-                results["intersectedQuantity"] = total
+            featureCount = int(arcpy.GetCount_management(intFC.featureClass).getOutput(0))
+            if featureCount > 0:
+                intersectionQuantityAttribute = intFC.getQuantityAttribute()
+                intersectionConversionFactor = intFC.getGeometryConversionFactor(spatialReference)
+                intersectionSummaryFields = dict(
+                    [(summaryField["attribute"], SummaryField(summaryField, intersectionQuantityAttribute is not None))
+                     for summaryField in layerConfig.get("attributes", [])])
+
+                intersectedQuantityAttribute = projFC.getQuantityAttribute()
+                intersectedConversionFactor = projFC.getGeometryConversionFactor(spatialReference)
+                intersectedSummaryFields = copy.deepcopy(intersectionSummaryFields)
+
+                if intersectionSummaryFields:
+                    fieldList = set([field.name for field in arcpy.ListFields(intFC.featureClass)])
+                    diffFields = set(intersectionSummaryFields.keys()).difference(fieldList)
+                    if diffFields:
+                        raise ValueError("FIELD_NOT_FOUND: Fields do not exist in layer %s: %s" % (
+                        layer.name, ",".join([str(fieldName) for fieldName in diffFields])))
+                    results["attributes"] = []
+
+                logger.debug("Tallying intersection results")
+                #tally results for intersection
+                count, total = tallyFeatures(intFC.featureClass, intersectionSummaryFields,
+                                             intersectionQuantityAttribute, intersectionConversionFactor)
 
-            #collate results of intersection and intersected
-            for summaryField in intersectionSummaryFields:
-                summaryFieldResult = {"attribute": summaryField}
-                if intersectionSummaryFields[summaryField].statistics:
-                    summaryFieldResult["statistics"] = intersectionSummaryFields[summaryField].getStatistics(
-                        intersectionSummaryFields[summaryField].statistics)
+                messages.incrementMinorStep()
+
+                results["intersectionGeometryType"] = intFC.getGeometryType().lower().replace("polyline", "line")
+                results["intersectionCount"] = count
+                if intersectionQuantityAttribute:
+                    results["intersectionQuantity"] = total
+
+                logger.debug("Tallying intersected feature results")
+                #tally results for intersected features
+                count, total = tallyFeatures(projFC.featureClass, intersectedSummaryFields,
+                                             intersectedQuantityAttribute, intersectedConversionFactor)
+
+                messages.incrementMinorStep()
+
+                results["intersectedGeometryType"] = projFC.getGeometryType().lower().replace("polyline", "line")
+                results["intersectedCount"] = count
+                if intersectedQuantityAttribute:
+                    results["intersectedQuantity"] = total
+
+                #collate results of intersection and intersected
+                for summaryField in intersectionSummaryFields:
+                    summaryFieldResult = {"attribute": summaryField}
+                    if intersectionSummaryFields[summaryField].statistics:
+                        summaryFieldResult["statistics"] = intersectionSummaryFields[summaryField].getStatistics(
+                            intersectionSummaryFields[summaryField].statistics)
 
-                else:
-                    collatedResults = []
-                    intersectionResults = intersectionSummaryFields[summaryField].results
-                    intersectedResults = intersectedSummaryFields[summaryField].results
-
-                    if intersectionSummaryFields[summaryField].classes:
-                        classes = intersectionSummaryFields[summaryField].classes
-                        for i in range(0, len(classes)):
-                            result = {"class": classes[i], "intersectionCount": intersectionResults[i].count,
-                                      "intersectedCount": intersectedResults[i].count}
-                            if intersectionQuantityAttribute:
-                                result["intersectionQuantity"] = intersectionResults[i].quantity
-                            if intersectedQuantityAttribute:
-                                result["intersectedQuantity"] = intersectedResults[i].quantity
-                            collatedResults.append(result)
-                        summaryFieldResult["classes"] = collatedResults
                     else:
-                        for key in intersectionResults:  #key is class or value
-                            result = {"value": key, "intersectionCount": intersectionResults[key].count,
-                                      "intersectedCount": intersectedResults[key].count}
-                            if intersectionQuantityAttribute:
-                                result["intersectionQuantity"] = intersectionResults[key].quantity
-                            if intersectedQuantityAttribute:
-                                result["intersectedQuantity"] = intersectedResults[key].quantity
-                            collatedResults.append(result)
-                        summaryFieldResult["values"] = collatedResults
-                results["attributes"].append(summaryFieldResult)
-
-            del selFC
-            del projFC
-            del intFC
-            arcpy.Delete_management("projFC")
+                        collatedResults = []
+                        intersectionResults = intersectionSummaryFields[summaryField].results
+                        intersectedResults = intersectedSummaryFields[summaryField].results
+
+                        if intersectionSummaryFields[summaryField].classes:
+                            classes = intersectionSummaryFields[summaryField].classes
+                            for i in range(0, len(classes)):
+                                result = {"class": classes[i], "intersectionCount": intersectionResults[i].count,
+                                          "intersectedCount": intersectedResults[i].count}
+                                if intersectionQuantityAttribute:
+                                    result["intersectionQuantity"] = intersectionResults[i].quantity
+                                if intersectedQuantityAttribute:
+                                    result["intersectedQuantity"] = intersectedResults[i].quantity
+                                collatedResults.append(result)
+                            summaryFieldResult["classes"] = collatedResults
+                        else:
+                            for key in intersectionResults:  #key is class or value
+                                result = {"value": key, "intersectionCount": intersectionResults[key].count,
+                                          "intersectedCount": intersectedResults[key].count}
+                                if intersectionQuantityAttribute:
+                                    result["intersectionQuantity"] = intersectionResults[key].quantity
+                                if intersectedQuantityAttribute:
+                                    result["intersectedQuantity"] = intersectedResults[key].quantity
+                                collatedResults.append(result)
+                            summaryFieldResult["values"] = collatedResults
+                    results["attributes"].append(summaryFieldResult)
+
+                del selFC
+                del projFC
+                del intFC
+
+            else:
+                logger.debug("No Features intersected for this layer: %s" % (layer.name))
+                results["intersectionCount"] = 0
+                results["intersectedCount"] = 0  #no point in tallying features we don't have from intersection
 
         else:
-            logger.debug("No Features intersected for this layer: %s" % (layer.name))
+            logger.debug("No Features selected for this layer: %s" % (layer.name))
             results["intersectionCount"] = 0
-            results["intersectedCount"] = 0  #no point in tallying features we don't have from intersection
+            results["intersectedCount"] = 0
 
-    else:
-        logger.debug("No Features selected for this layer: %s" % (layer.name))
-        results["intersectionCount"] = 0
-        results["intersectedCount"] = 0
+        del selLyr
+    finally:
+        scratch.close()
 
-    del selLyr
     return results
 
 
-def tabulateMapService(srcFC, serviceID, mapServiceConfig, spatialReference, messages):
+def tabulateLayer(srcFC, layerID, layerPath, layerConfig, spatialReference, messages):
     """
+    Tabulate a single layer of a map service.  Errors are reported in the results for the layer.
+
     srcFC: source feature class wrapper
-    mapDocPath: path to the map document behind the map service
-    mapServiceConfig: subset of config for a single map service
+    layerID: ID of layer within map service
+    layerPath: path to data source of layer
+    layerConfig: subset of config for a single layer
     spatialReference: spatial reference object with target projection
     messages: instance of MessageHandler
     """
 
-    results = []
+    resultCache = getResultCache()
+    cacheKey = None
+    if resultCache is not None:
+        #key must be created before tabulating, which may modify layerConfig
+        try:
+            cacheKey = getCacheKey(srcFC.getGeometryHash(), layerPath, layerConfig, spatialReference)
+        except:
+            logger.warning("Could not create cache key for layer %s\n%s" % (layerID, traceback.format_exc()))
+        cachedResults = resultCache.get(cacheKey) if cacheKey else None
+        if cachedResults is not None:
+            logger.debug("Using cached results for layer %s" % (layerID))
+            #advance progress by the steps of tabulating the layer (the caller completes the last step)
+            for step in range(LAYER_MINOR_STEPS - 1):
+                messages.incrementMinorStep()
+            result = {"layerID": layerID}
+            result.update(cachedResults)
+            return result
+
+    #TODO: handle layer definition specified in MXD / MSD
+    layer = None
+    try:
+        #describing the layer may fail (e.g., missing data source); report it for this layer only
+        layer = getMetadataCatalog().getLayer(layerPath)
+        logger.debug("Processing layer %s: %s" % (layerID, layer.name))
+        result = {"layerID": layerID}
+        if layer.isRasterLayer:
+            layerResults = tabulateRasterLayer(srcFC, layer, layerConfig, spatialReference, messages)
+        elif layer.isFeatureLayer:
+            layerResults = tabulateFeatureLayer(srcFC, layer, layerConfig, spatialReference, messages)
+        else:
+            logger.error("Layer type is unsupported %s: %s" % (layerID, layer.name))
+            result["error"] = "unsupported layer type"
+            return result
+        if cacheKey:
+            resultCache.set(cacheKey, layerResults)
+        result.update(layerResults)
+        return result
+    except GPToolError as ex:
+        logger.error("Error processing layer %s: %s\n%s" % (layerID, layer.name if layer else layerPath, ex.message))
+        return {"layerID": layerID, "error": ex.message}
+    except:
+        error = traceback.format_exc()
+        logger.error("Error processing layer %s: %s\n%s" % (layerID, layer.name if layer else layerPath, error))
+        return {"layerID": layerID, "error": error}
+
+
+def tabulateLayerTask(task):
+    """
+    Tabulate a single layer of a map service in a worker process (see parallel.WorkerPool).
+
+    task: tuple of (source feature class wrapper, layerID, layerPath, layerConfig, WKT of target projection)
+    """
+
+    srcFC, layerID, layerPath, layerConfig, spatialReferenceWKT = task
+    spatialReference = ProjectionUtilities.getSpatialReferenceFromWKT(spatialReferenceWKT)
+    return tabulateLayer(srcFC, layerID, layerPath, layerConfig, spatialReference, MessageHandler(NullMessages()))
+
+
+def tabulateLayersInWorkers(srcFC, layerTasks, spatialReference, workers):
+    """
+    Tabulate layers in a pool of worker processes.  The area of interest is projected to the target projection once, and
+    shared with all workers.
+
+    srcFC: source feature class wrapper
+    layerTasks: list of (layerID, layerPath, layerConfig) for each layer
+    spatialReference: spatial reference object with target projection
+    workers: number of worker processes
+    returns iterator over (index of layer within layerTasks, results for layer), in the order that layers complete
+    """
+
+    #project (and persist, if in memory) source features here, so that workers read them instead of projecting them
+    srcFC.project(spatialReference)
+    srcFC.getGeometryParts(spatialReference)
+    if getResultCache() is not None:
+        srcFC.getGeometryHash()
+    spatialReferenceWKT = spatialReference.exportToString()
+    logger.debug("Processing %i layers in %i worker processes" % (len(layerTasks), workers))
+    with WorkerPool(workers) as pool:
+        for index, result in pool.imapUnordered(tabulateLayerTask,
+                                                [(srcFC, layerID, layerPath, layerConfig, spatialReferenceWKT)
+                                                 for layerID, layerPath, layerConfig in layerTasks]):
+            yield index, result
+
+
+def getServiceLayers(serviceID, mapServiceConfig):
+    """
+    Return list of (layerID, layerPath, layerConfig) for each layer in config of map service
+
+    serviceID: ID of map service
+    mapServiceConfig: subset of config for a single map service
+    """
+
     layerPaths = getDataPathsForService(serviceID)
-    messages.setMinorSteps(len(mapServiceConfig['layers']) * 5)
+    layerTasks = []
     for layerConfig in mapServiceConfig['layers']:
-        lyrResults = dict()
         layerID = int(layerConfig["layerID"])
         if not (layerID >= 0 and layerID < len(layerPaths)):
             raise ValueError("LAYER_NOT_FOUND: Layer not found for layerID: %s" % (layerID))
         logger.debug("Layer: %s ==> %s" % (layerID, layerPaths[layerID]))
-        if not arcpy.Exists(layerPaths[layerID]):
+        if not getMetadataCatalog().exists(layerPaths[layerID]):
             raise ValueError("LAYER_NOT_FOUND: Layer data source not found for layerID: %s" % (layerID))
-        layer = arcpy.mapping.Layer(layerPaths[layerID])
-        #TODO: handle layer definition specified in MXD / MSD
+        layerTasks.append((layerID, layerPaths[layerID], layerConfig))
+    return layerTasks
+
+
+def tabulateMapService(srcFC, serviceID, mapServiceConfig, spatialReference, messages):
+    """
+    srcFC: source feature class wrapper
+    mapDocPath: path to the map document behind the map service
+    mapServiceConfig: subset of config for a single map service
+    spatialReference: spatial reference object with target projection
+    messages: instance of MessageHandler
+    """
+
+    layerTasks = getServiceLayers(serviceID, mapServiceConfig)
+    results = []
+    workers = getWorkerCount(len(layerTasks))
+    if workers:
+        messages.setMinorSteps(len(layerTasks))
+        results = [None] * len(layerTasks)
+        for index, result in tabulateLayersInWorkers(srcFC, layerTasks, spatialReference, workers):
+            results[index] = result
+            messages.incrementMinorStep()
+
+    else:
+        messages.setMinorSteps(len(layerTasks) * LAYER_MINOR_STEPS)
+        for layerID, layerPath, layerConfig in layerTasks:
+            results.append(tabulateLayer(srcFC, layerID, layerPath, layerConfig, spatialReference, messages))
+            messages.incrementMinorStep()
+
+    return {"serviceID": serviceID, "layers": results}
+
+
+def tabulateMapServicesInWorkers(srcFC, servicesConfig, spatialReference, workers, messages):
+    """
+    Tabulate the layers of all map services concurrently, in a single pool of worker processes.  Progress of each map
+    service is reported as a fraction of a major step for each layer completed.
+
+    srcFC: source feature class wrapper
+    servicesConfig: list of config for each map service
+    spatialReference: spatial reference object with target projection
+    workers: number of worker processes
+    messages: instance of MessageHandler
+    returns list of results for each map service
+    """
+
+    serviceResults = []
+    layerTasks = []
+    layerIndices = []  #index of map service and layer within map service for each layer task
+    for mapServiceConfig in servicesConfig:
+        serviceID = mapServiceConfig["serviceID"]
         try:
-            logger.debug("Processing layer %s: %s" % (layerID, layer.name))
-            result = {"layerID": layerID}
-            if layer.isRasterLayer:
-                result.update(tabulateRasterLayer(srcFC, layer, layerConfig, spatialReference, messages))
-            elif layer.isFeatureLayer:
-                result.update(tabulateFeatureLayer(srcFC, layer, layerConfig, spatialReference, messages))
-            else:
-                logger.error("Layer type is unsupported %s: %s" % (layerID, layer.name))
-                result["error"] = "unsupported layer type"
-            results.append(result)
-        except GPToolError as ex:
-            logger.error("Error processing layer %s: %s\n%s" % (layerID, layer.name, ex.message))
-            results.append({"layerID": layerID, "error": ex.message})
+            logger.debug("Processing map service: %s" % (serviceID))
+            serviceLayers = getServiceLayers(serviceID, mapServiceConfig)
         except:
             error = traceback.format_exc()
-            logger.error("Error processing layer %s: %s\n%s" % (layerID, layer.name, error))
-            results.append({"layerID": layerID, "error": error})
+            logger.error("Error processing map service: %s\n%s" % (serviceID, error))
+            serviceResults.append({"serviceID": serviceID, "error": error})
+            messages.incrementMajorStep()
+            continue
 
-        messages.incrementMinorStep()
+        serviceResults.append({"serviceID": serviceID, "layers": [None] * len(serviceLayers)})
+        if not serviceLayers:
+            messages.incrementMajorStep()
+        for layerIndex, layerTask in enumerate(serviceLayers):
+            layerTasks.append(layerTask)
+            layerIndices.append((len(serviceResults) - 1, layerIndex))
 
-    return {"serviceID": serviceID, "layers": results}
+    if not layerTasks:
+        return serviceResults
+
+    try:
+        for index, result in tabulateLayersInWorkers(srcFC, layerTasks, spatialReference, workers):
+            serviceIndex, layerIndex = layerIndices[index]
+            layerResults = serviceResults[serviceIndex]["layers"]
+            layerResults[layerIndex] = result
+            messages.incrementMajorStep(1.0 / len(layerResults))
+    except:
+        error = traceback.format_exc()
+        logger.error("Error processing map services in worker processes\n%s" % (error))
+        for serviceIndex, serviceResult in enumerate(serviceResults):
+            if None in serviceResult.get("layers", []):
+                serviceResults[serviceIndex] = {"serviceID": serviceResult["serviceID"], "error": error}
+
+    return serviceResults
 
 
 def tabulateMapServices(srcFC, config, messages):
@@ -893,7 +1485,8 @@ def tabulateMapServices(srcFC, config, messages):
     #setup target projection
     logger.debug("Setting up custom Albers projection")
     geoExtent = srcFC.getExtent(ProjectionUtilities.getSpatialReferenceFromWKID(4326))
-    spatialReference = ProjectionUtilities.createCustomAlbers(geoExtent)
+    spatialReference = ProjectionUtilities.createCustomAlbers(geoExtent, settings.CUSTOM_ALBERS_SNAP_DEGREES,
+                                                              settings.CUSTOM_ALBERS_MAX_SCALE_ERROR)
     messages.incrementMinorStep()
 
     results["area_units"] = "hectares"  #always
@@ -905,17 +1498,25 @@ def tabulateMapServices(srcFC, config, messages):
     results["services"] = []
     messages.incrementMajorStep()
 
-    for mapServiceConfig in config["services"]:
-        serviceID = mapServiceConfig["serviceID"]
-        try:
-            logger.debug("Processing map service: %s" % (serviceID))
-            results["services"].append(
-                tabulateMapService(srcFC, serviceID, mapServiceConfig, spatialReference, messages))
-        except:
-            error = traceback.format_exc()
-            logger.error("Error processing map service: %s\n%s" % (serviceID, error))
-            results["services"].append({"serviceID": serviceID, "error": error})
-        messages.incrementMajorStep()
+    #all layers of all map services share the same pool of worker processes
+    workers = getWorkerCount(sum([len(mapServiceConfig.get("layers", [])) for mapServiceConfig in config["services"]]))
+    if workers:
+        messages.setMinorSteps(0)
+        results["services"] = tabulateMapServicesInWorkers(srcFC, config["services"], spatialReference, workers,
+                                                           messages)
+
+    else:
+        for mapServiceConfig in config["services"]:
+            serviceID = mapServiceConfig["serviceID"]
+            try:
+                logger.debug("Processing map service: %s" % (serviceID))
+                results["services"].append(
+                    tabulateMapService(srcFC, serviceID, mapServiceConfig, spatialReference, messages))
+            except:
+                error = traceback.format_exc()
+                logger.error("Error processing map service: %s\n%s" % (serviceID, error))
+                results["services"].append({"serviceID": serviceID, "error": error})
+            messages.incrementMajorStep()
 
     logger.debug("Elapsed time: %.2f" % (time.time() - start))
     return results
@@ -0,0 +1,62 @@
+import numpy
+import pytest
+from numpy.testing import assert_allclose, assert_array_equal
+
+from utilities.grid import GridTransform
+from utilities.pixel_coverage import getPolygonCoverage, getLineCoverage
+from utilities.tally import tallyValues, ClassBinner
+from utilities.aoi_decomposition import AOIDecomposition
+
+
+GRID = GridTransform(0.0, 16.0, 2.0, 2.0, 8, 8)
+SQUARE = numpy.array([[3.0, 3.0], [3.0, 13.0], [13.0, 13.0], [13.0, 3.0], [3.0, 3.0]])
+VALUES = numpy.random.RandomState(0).randint(0, 5, GRID.shape)
+
+
+def test_polygon_decomposition():
+    decomposition = AOIDecomposition([SQUARE], GRID, "Polygon")
+    expected = numpy.zeros(GRID.shape, dtype=bool)
+    expected[2:6, 2:6] = True
+    assert_array_equal(decomposition.inside, expected)
+    assert_array_equal(decomposition.getFullCells(), expected)
+    expected[1:7, 1:7] ^= True
+    expected[2:6, 2:6] = False
+    assert_array_equal(decomposition.boundary, expected)
+    coverage = decomposition.getCoverage()
+    assert_allclose(coverage, getPolygonCoverage([SQUARE], GRID) * GRID.cellArea)
+    assert_allclose(coverage.sum(), 100.0)
+
+
+def test_overlapping_polygons():
+    decomposition = AOIDecomposition([SQUARE, SQUARE], GRID, "Polygon")
+    assert not decomposition.getFullCells().any()
+    assert_allclose(decomposition.getCoverage().sum(), 200.0)
+
+
+def test_tally():
+    decomposition = AOIDecomposition([SQUARE], GRID, "Polygon")
+    coverage = decomposition.getCoverage()
+    uniqueValues, counts, quantities = decomposition.tallyValues(VALUES, coverage)
+    expected = tallyValues(VALUES, coverage)
+    assert_array_equal(uniqueValues, expected[0])
+    assert_array_equal(counts, expected[1])
+    assert_allclose(quantities, expected[2])
+
+    binner = ClassBinner([[0, 2], [2, 5]])
+    counts, quantities = decomposition.tallyClasses(binner, VALUES, coverage)
+    expected = binner.tally(VALUES, coverage)
+    assert_array_equal(counts, expected[0])
+    assert_allclose(quantities, expected[1])
+
+
+def test_polyline_decomposition():
+    path = numpy.array([[1.0, 1.0], [15.0, 1.0]])
+    decomposition = AOIDecomposition([path], GRID, "Polyline")
+    assert not decomposition.inside.any()
+    assert_array_equal(numpy.flatnonzero(decomposition.boundary), numpy.arange(56, 64))
+    assert_allclose(decomposition.getCoverage(), getLineCoverage([path], GRID))
+
+
+def test_unsupported_geometry():
+    with pytest.raises(ValueError):
+        AOIDecomposition([numpy.array([[1.0, 1.0]])], GRID, "Point")
@@ -0,0 +1,125 @@
+import os
+import gzip
+import json
+import base64
+import socket
+import struct
+import threading
+from cStringIO import StringIO
+from multiprocessing.connection import Client, AuthenticationError
+
+import pytest
+
+import settings
+import daemon
+
+
+@pytest.fixture
+def listener(monkeypatch):
+    monkeypatch.setattr(settings, "DAEMON_CLIENT_TIMEOUT", 0.5)
+    monkeypatch.setattr(settings, "DAEMON_AUTHKEY", "test key")
+    monkeypatch.setattr(settings, "DAEMON_ADDRESS", ("localhost", 0))
+    listener = daemon.createListener()
+    monkeypatch.setattr(settings, "DAEMON_ADDRESS", listener.address)
+    yield listener
+    listener.close()
+
+
+def acceptInThread(listener, handler=None):
+    """Accept one connection and call handler on it in a thread; return list that receives result of handler"""
+
+    results = []
+
+    def accept():
+        try:
+            connection = listener.accept()
+        except Exception as ex:
+            results.append(ex)
+            return
+        try:
+            results.append(handler(connection))
+        except Exception as ex:
+            results.append(ex)
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=accept)
+    thread.start()
+    return thread, results
+
+
+def test_receive_job(listener):
+    thread, results = acceptInThread(listener, daemon._receiveJSON)
+    connection = daemon.connectToDaemon()
+    daemon._sendJSON(connection, {"featureSetPath": "aoi.json", "config": {}})
+    thread.join(5)
+    connection.close()
+    assert results == [{"featureSetPath": "aoi.json", "config": {}}]
+
+
+def test_wrong_authkey(listener):
+    thread, results = acceptInThread(listener)
+    with pytest.raises(AuthenticationError):
+        Client(settings.DAEMON_ADDRESS, authkey="wrong")
+    thread.join(5)
+    assert isinstance(results[0], AuthenticationError)
+
+
+def test_no_authkey(monkeypatch):
+    monkeypatch.setattr(settings, "DAEMON_AUTHKEY", None)
+    assert daemon.connectToDaemon() is None
+    with pytest.raises(ValueError):
+        daemon.serve()
+
+
+def test_client_stalled_during_authentication(listener):
+    thread, results = acceptInThread(listener)
+    client = socket.create_connection(settings.DAEMON_ADDRESS)
+    thread.join(5)
+    client.close()
+    assert not thread.is_alive()
+    assert isinstance(results[0], IOError)
+
+
+def test_client_without_job(listener):
+    thread, results = acceptInThread(listener, daemon._handleConnection)
+    connection = daemon.connectToDaemon()
+    thread.join(5)
+    connection.close()
+    assert not thread.is_alive()
+    assert isinstance(results[0], IOError)
+
+
+def test_client_stalled_within_job(listener):
+    thread, results = acceptInThread(listener, daemon._handleConnection)
+    connection = daemon.connectToDaemon()
+    #length of message, followed by only part of message
+    os.write(connection.fileno(), struct.pack("!i", 100) + '{"featureSetPath": ')
+    thread.join(5)
+    connection.close()
+    assert not thread.is_alive()
+    assert isinstance(results[0], IOError)
+
+
+def test_job_too_large(listener):
+    thread, results = acceptInThread(listener, daemon._handleConnection)
+    connection = daemon.connectToDaemon()
+    os.write(connection.fileno(), struct.pack("!i", daemon.MAX_JOB_BYTES + 1))
+    thread.join(5)
+    connection.close()
+    assert isinstance(results[0], IOError)
+
+
+def test_write_featureset():
+    featureSet = u'{"features": [], "name": "\u00e9t\u00e9"}'
+    compressed = StringIO()
+    gzipFile = gzip.GzipFile(fileobj=compressed, mode="wb")
+    gzipFile.write(featureSet.encode("utf-8"))
+    gzipFile.close()
+    for encoded in (featureSet, base64.b64encode(compressed.getvalue())):
+        path = daemon.writeFeatureSet(encoded)
+        try:
+            with open(path, "rb") as scratchFile:
+                assert json.load(scratchFile) == json.loads(featureSet)
+        finally:
+            os.remove(path)
@@ -0,0 +1,92 @@
+import datetime
+
+import pytest
+
+pytest.importorskip("arcpy")
+
+from utilities import FeatureSetConverter
+
+
+class FakeDa(object):
+    """Records tables created by arcpy.da.NumPyArrayToTable and rows inserted by arcpy.da.InsertCursor"""
+
+    def __init__(self):
+        self.templates = []
+        self.rows = []
+        self.cursorFields = None
+
+    def NumPyArrayToTable(self, array, table):
+        self.templates.append((table, array.dtype))
+
+    def InsertCursor(self, featureClass, fields):
+        self.cursorFields = fields
+        return FakeInsertCursor(self.rows)
+
+
+class FakeInsertCursor(object):
+    def __init__(self, rows):
+        self.rows = rows
+
+    def insertRow(self, row):
+        self.rows.append(row)
+
+
+@pytest.fixture
+def fakeArcpy(monkeypatch):
+    """Replace arcpy functions used by FeatureSetConverter, and return FakeDa and list of fields added with AddField"""
+
+    arcpy = FeatureSetConverter.arcpy
+    da = FakeDa()
+    addedFields = []
+    monkeypatch.setattr(arcpy, "da", da, raising=False)
+    monkeypatch.setattr(arcpy, "CreateFeatureclass_management", lambda *args: None, raising=False)
+    monkeypatch.setattr(arcpy, "Delete_management", lambda *args: None, raising=False)
+    monkeypatch.setattr(arcpy, "AddField_management", lambda *args: addedFields.append(args), raising=False)
+    return da, addedFields
+
+
+def test_schema_template_and_added_fields(fakeArcpy):
+    da, addedFields = fakeArcpy
+    fieldsJSON = [
+        {"name": "OBJECTID", "type": "esriFieldTypeOID"},
+        {"name": u"count", "type": "esriFieldTypeInteger"},
+        {"name": u"area", "type": "esriFieldTypeDouble", "alias": u"area"},
+        {"name": u"value", "type": "esriFieldTypeSingle", "alias": u"Value (m)"},
+        {"name": u"\u00e9l\u00e9vation", "type": "esriFieldTypeSmallInteger"},
+        {"name": u"label", "type": "esriFieldTypeString", "length": 50},
+        {"name": u"date", "type": "esriFieldTypeDate"}
+    ]
+    fields = FeatureSetConverter.createFeatureClassSchema("IN_MEMORY/aoi", "esriGeometryPolygon", None, fieldsJSON)
+    assert fields == [(u"count", "LONG"), (u"area", "DOUBLE"), (u"value", "FLOAT"),
+                      (u"\u00e9l\u00e9vation", "SHORT"), (u"label", "TEXT"), (u"date", "DATE")]
+    #numeric fields without alias and with ASCII names are created from template
+    assert len(da.templates) == 1
+    assert da.templates[0][1].names == ("count", "area")
+    assert [args[1:3] for args in addedFields] == [(u"value", "FLOAT"), (u"\u00e9l\u00e9vation", "SHORT"),
+                                                   (u"label", "TEXT"), (u"date", "DATE")]
+    assert addedFields[0][-1] == u"Value (m)"
+    assert addedFields[2][5] == 50
+
+
+def test_schema_without_template(fakeArcpy):
+    da, addedFields = fakeArcpy
+    fieldsJSON = [{"name": u"label", "type": "esriFieldTypeString"}]
+    FeatureSetConverter.createFeatureClassSchema("IN_MEMORY/aoi", "esriGeometryPoint", None, fieldsJSON)
+    assert da.templates == []
+    assert len(addedFields) == 1
+
+
+def test_insert_features_converts_dates(fakeArcpy):
+    da, addedFields = fakeArcpy
+    fields = [(u"label", "TEXT"), (u"date", "DATE")]
+    features = [
+        {"attributes": {"label": u"a", "date": 86400000 + 1500}, "geometry": {"x": 1.0, "y": 2.0}},
+        {"attributes": {"label": u"b", "date": None}, "geometry": {"x": 3.0, "y": 4.0}},
+        {"geometry": {"x": 5.0, "y": 6.0}}
+    ]
+    count = FeatureSetConverter.insertFeatures("IN_MEMORY/aoi", "esriGeometryPoint", fields, features)
+    assert count == 3
+    assert da.cursorFields == ["SHAPE@JSON", u"label", u"date"]
+    assert [row[1:] for row in da.rows] == [[u"a", datetime.datetime(1970, 1, 2, 0, 0, 1, 500000)],
+                                            [u"b", None],
+                                            [None, None]]
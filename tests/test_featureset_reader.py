@@ -0,0 +1,133 @@
+import json
+import gzip
+import base64
+from cStringIO import StringIO
+
+import numpy
+import pytest
+from numpy.testing import assert_allclose
+
+from utilities.featureset_reader import FeatureSetReader, openFeatureSet, getFeatureParts, getGeometryJSON
+
+
+HEADER = {
+    "geometryType": "esriGeometryPolygon",
+    "spatialReference": {"wkid": 102100, "latestWkid": 3857},
+    "fields": [{"name": "OBJECTID", "type": "esriFieldTypeOID"}, {"name": "NAME", "type": "esriFieldTypeString"}]
+}
+
+FEATURES = [
+    {"attributes": {"OBJECTID": 1, "NAME": "first, \"quoted\" [name]"},
+     "geometry": {"rings": [[[0, 0], [0, 123456.789], [1e5, 0], [0, 0]]]}},
+    {"attributes": {"OBJECTID": 22, "NAME": None}, "geometry": {"rings": []}},
+    {"attributes": {"OBJECTID": 333, "NAME": u"\u00e9t\u00e9"}, "geometry": None}
+]
+
+
+def getFeatureSetJSON(featuresFirst=False, **properties):
+    header = json.dumps(dict(HEADER, **properties))[1:-1]
+    features = '"features": %s' % (json.dumps(FEATURES, indent=2))
+    return "{%s}" % (", ".join([features, header] if featuresFirst else [header, features]))
+
+
+def readFeatureSet(source, **kwargs):
+    reader = FeatureSetReader(source, **kwargs)
+    header = reader.readHeader()
+    return header, list(reader.iterFeatures()), reader.readHeader()
+
+
+@pytest.mark.parametrize("readSize", [1, 7, 1048576])
+def test_read_file_in_chunks(readSize):
+    header, features, finalHeader = readFeatureSet(StringIO(getFeatureSetJSON()), readSize=readSize)
+    assert header == HEADER
+    assert features == FEATURES
+
+
+def test_read_string():
+    header, features, finalHeader = readFeatureSet(getFeatureSetJSON())
+    assert header == HEADER
+    assert features == FEATURES
+
+
+@pytest.mark.parametrize("readSize", [1, 1048576])
+def test_features_before_properties(readSize):
+    header, features, finalHeader = readFeatureSet(StringIO(getFeatureSetJSON(True)), readSize=readSize)
+    assert header == HEADER
+    assert features == FEATURES
+
+
+def test_properties_after_features():
+    featureSet = getFeatureSetJSON()[:-1] + ', "exceededTransferLimit": true}'
+    header, features, finalHeader = readFeatureSet(StringIO(featureSet), readSize=1)
+    assert features == FEATURES
+    assert finalHeader["exceededTransferLimit"] is True
+
+
+def test_number_split_between_reads():
+    header, features, finalHeader = readFeatureSet(StringIO('{"count": 123456789, "scale": -1.5e-3 , "features": []}'),
+                                                   readSize=1)
+    assert header == {"count": 123456789, "scale": -1.5e-3}
+
+
+def test_empty_features():
+    header, features, finalHeader = readFeatureSet(StringIO(' { "features" : [ ] } '), readSize=1)
+    assert header == {}
+    assert features == []
+
+
+@pytest.mark.parametrize("featureSet", ['{"geometryType": "esriGeometryPolygon", "features": [{}',
+                                        '{"geometryType" "esriGeometryPolygon"}', '[]'])
+def test_invalid_json(featureSet):
+    with pytest.raises(ValueError):
+        readFeatureSet(StringIO(featureSet), readSize=1)
+
+
+def test_open_featureset():
+    featureSet = getFeatureSetJSON()
+    assert openFeatureSet(featureSet) is featureSet
+    source = StringIO(featureSet)
+    assert openFeatureSet(source) is source
+
+    compressed = StringIO()
+    gzipFile = gzip.GzipFile(fileobj=compressed, mode="wb")
+    gzipFile.write(featureSet)
+    gzipFile.close()
+    for encoded in (compressed.getvalue(), base64.b64encode(compressed.getvalue()),
+                    unicode(base64.b64encode(compressed.getvalue()))):
+        assert readFeatureSet(openFeatureSet(encoded), readSize=5)[1] == FEATURES
+
+
+@pytest.mark.parametrize("featureSet", ["not a featureset", base64.b64encode("not gzip")])
+def test_open_invalid_featureset(featureSet):
+    with pytest.raises(ValueError):
+        openFeatureSet(featureSet)
+
+
+def test_feature_parts():
+    parts = getFeatureParts("esriGeometryPolyline", {"paths": [[[1, 2, 3], [4, 5, 6]], [[7, 8]]]})
+    assert len(parts) == 2
+    assert_allclose(parts[0], [[1, 2], [4, 5]])
+    assert_allclose(parts[1], [[7, 8]])
+    assert_allclose(getFeatureParts("esriGeometryPoint", {"x": 1, "y": 2})[0], [[1, 2]])
+    assert_allclose(getFeatureParts("esriGeometryMultipoint", {"points": []})[0], numpy.zeros((0, 2)))
+    with pytest.raises(Exception):
+        getFeatureParts("esriGeometryEnvelope", {})
+
+
+def test_dequantize():
+    transform = {"originPosition": "upperLeft", "scale": [0.5, 0.25], "translate": [100, 200]}
+    parts = getFeatureParts("esriGeometryPolygon", {"rings": [[[10, 20], [4, 0], [0, 8], [-4, 0], [0, -8]]]},
+                            transform)
+    assert_allclose(parts[0], [[105, 195], [107, 195], [107, 193], [105, 193], [105, 195]])
+    transform["originPosition"] = "bottomLeft"
+    parts = getFeatureParts("esriGeometryMultipoint", {"points": [[10, 20], [4, 8]]}, transform)
+    assert_allclose(parts[0], [[105, 205], [107, 207]])
+    #points are not delta encoded
+    parts = getFeatureParts("esriGeometryPoint", {"x": 10, "y": 20}, transform)
+    assert_allclose(parts[0], [[105, 205]])
+
+
+def test_geometry_json():
+    parts = [numpy.array([[0.0, 0.0], [0.0, 1.0], [1.0, 0.0], [0.0, 0.0]]), numpy.zeros((0, 2))]
+    assert json.loads(getGeometryJSON("esriGeometryPolygon", parts)) == {"rings": [parts[0].tolist()]}
+    assert json.loads(getGeometryJSON("esriGeometryPoint", [numpy.array([[1.5, 2.5]])])) == {"x": 1.5, "y": 2.5}
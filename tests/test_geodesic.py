@@ -0,0 +1,49 @@
+import math
+from collections import namedtuple
+
+import numpy
+from numpy.testing import assert_allclose
+
+from utilities.grid import GridTransform
+from utilities.geodesic import getAuthalicQ, getBandAreas, GeodesicCellAreas
+
+
+SpatialReference = namedtuple("SpatialReference", ["semiMajorAxis", "flattening", "radiansPerUnit"])
+
+WGS84 = SpatialReference(6378137.0, 1 / 298.257223563, math.pi / 180)
+
+#surface area of the WGS84 ellipsoid, in square meters
+WGS84_AREA = 5.10065621724e14
+
+
+def test_sphere():
+    assert_allclose(getAuthalicQ(numpy.array([0.0, 0.5, 1.0]), 0), [0.0, 1.0, 2.0])
+    radius = 6371000.0
+    assert_allclose(getBandAreas(numpy.array([math.pi / 2]), radius, 0) * 4 * math.pi, 4 * math.pi * radius ** 2)
+
+
+def test_ellipsoid_area():
+    bandAreas = getBandAreas(numpy.array([-math.pi / 2, 0, math.pi / 2]), WGS84.semiMajorAxis, WGS84.flattening)
+    assert_allclose(bandAreas[1], 0)
+    assert_allclose(bandAreas[0], -bandAreas[2])
+    assert_allclose(bandAreas[2] * 4 * math.pi, WGS84_AREA, rtol=1e-11)
+
+
+def test_global_grid():
+    grid = GridTransform(-180.0, 90.0, 1.0, 1.0, 180, 360)
+    cellAreas = GeodesicCellAreas(WGS84).getCellAreas(grid)
+    assert cellAreas.shape == grid.shape
+    assert_allclose(cellAreas.sum(), WGS84_AREA, rtol=1e-11)
+    rowAreas = cellAreas[:, 0]
+    assert_allclose(rowAreas, rowAreas[::-1])
+    assert (numpy.diff(rowAreas[:90]) > 0).all()
+
+
+def test_area_factor():
+    grid = GridTransform(10.0, 50.0, 0.01, 0.01, 3, 2)
+    areas = GeodesicCellAreas(WGS84).getRowAreas(grid)
+    assert_allclose(GeodesicCellAreas(WGS84, 0.0001).getRowAreas(grid), areas * 0.0001)
+    #approximately the area of a rectangle on the sphere
+    radius = 6371007.2
+    assert_allclose(areas[0], radius ** 2 * math.radians(0.01) * (math.sin(math.radians(50)) -
+                                                                  math.sin(math.radians(49.99))), rtol=0.01)
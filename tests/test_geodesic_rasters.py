@@ -0,0 +1,64 @@
+import json
+
+import numpy
+import pytest
+
+arcpy = pytest.importorskip("arcpy")
+
+import settings
+import tabulate
+from messaging import MessageHandler, NullMessages
+from utilities import ProjectionUtilities
+from utilities.FeatureSetConverter import createFeatureClass
+from utilities.feature_class_wrapper import FeatureClassWrapper
+from utilities.metadata_catalog import LayerMetadata
+
+
+def getFeatureSetJSON(geometryType, geometry):
+    return json.dumps({
+        "geometryType": geometryType,
+        "spatialReference": {"wkid": 4326},
+        "fields": [{"name": "OBJECTID", "type": "esriFieldTypeOID", "alias": "OBJECTID"}],
+        "features": [{"attributes": {"OBJECTID": 1}, "geometry": geometry}]
+    })
+
+
+SMALL_POLYGON_JSON = getFeatureSetJSON("esriGeometryPolygon", {
+    "rings": [[[-109.7, 34.3], [-109.7, 34.35], [-109.65, 34.35], [-109.65, 34.3], [-109.7, 34.3]]]})
+SMALL_LINE_JSON = getFeatureSetJSON("esriGeometryPolyline", {"paths": [[[-109.7, 34.3], [-109.65, 34.35]]]})
+
+
+@pytest.fixture
+def geographicRaster(tmpdir):
+    """1 degree square integer raster in WGS84, with pixels of 0.01 degrees"""
+
+    path = str(tmpdir.join("geographic.tif"))
+    values = (numpy.arange(100 * 100, dtype=numpy.int32) % 5).reshape(100, 100)
+    arcpy.NumPyArrayToRaster(values, arcpy.Point(-110, 34), 0.01, 0.01).save(path)
+    arcpy.DefineProjection_management(path, ProjectionUtilities.getSpatialReferenceFromWKID(4326))
+    return LayerMetadata.describe(path)
+
+
+def tabulateRasterLayer(featureSetJSON, layer):
+    srcFC = FeatureClassWrapper(createFeatureClass(featureSetJSON))
+    try:
+        geoExtent = srcFC.getExtent(ProjectionUtilities.getSpatialReferenceFromWKID(4326))
+        spatialReference = ProjectionUtilities.createCustomAlbers(geoExtent)
+        return tabulate.tabulateRasterLayer(srcFC, layer, {}, spatialReference, MessageHandler(NullMessages()))
+    finally:
+        srcFC.delete()
+
+
+@pytest.mark.parametrize("featureSetJSON", [SMALL_POLYGON_JSON, SMALL_LINE_JSON])
+def test_small_aoi_uses_precise_method(monkeypatch, geographicRaster, featureSetJSON):
+    monkeypatch.setattr(settings, "GEOGRAPHIC_AREA_METHOD", "geodesic")
+    results = tabulateRasterLayer(featureSetJSON, geographicRaster)
+    assert results["method"] == "precise"
+
+
+def test_large_aoi_uses_geodesic_pixel_areas(monkeypatch, geographicRaster):
+    monkeypatch.setattr(settings, "GEOGRAPHIC_AREA_METHOD", "geodesic")
+    monkeypatch.setattr(tabulate, "getPreciseMaxPixels", lambda: 1)
+    results = tabulateRasterLayer(SMALL_POLYGON_JSON, geographicRaster)
+    assert results["method"] == "approximate"
+    assert results["projection"] == "native"
@@ -0,0 +1,51 @@
+from utilities.grid import GridTransform
+
+
+GRID = GridTransform(100.0, 200.0, 10.0, 5.0, 20, 30)
+
+
+def test_bounds():
+    assert GRID.shape == (20, 30)
+    assert GRID.xMax == 400.0
+    assert GRID.yMin == 100.0
+    assert GRID.cellArea == 50.0
+
+
+def test_window():
+    window = GRID.window(2, 3, 4, 5)
+    assert window == GridTransform(130.0, 190.0, 10.0, 5.0, 4, 5)
+    assert GRID.getOffset(window) == (2, 3)
+
+
+def test_window_for_extent():
+    #extent is expanded to pixel boundaries
+    assert GRID.getWindowForExtent(125.0, 151.0, 161.0, 189.0) == GRID.window(2, 2, 8, 5)
+
+
+def test_window_for_extent_clip():
+    assert GRID.getWindowForExtent(50.0, 50.0, 150.0, 250.0) == GRID.window(0, 0, 20, 5)
+    assert GRID.getWindowForExtent(50.0, 50.0, 150.0, 250.0, clip=False) == GRID.window(-10, -5, 40, 10)
+    #extent outside grid
+    window = GRID.getWindowForExtent(500.0, 0.0, 600.0, 50.0)
+    assert window.rows == 0 and window.cols == 0
+
+
+def test_blocks():
+    blocks = GRID.getBlocks(8)
+    assert len(blocks) == 3 * 4
+    assert blocks[0] == GRID.window(0, 0, 8, 8)
+    assert blocks[-1] == GRID.window(16, 24, 4, 6)
+    assert sum(block.rows * block.cols for block in blocks) == GRID.rows * GRID.cols
+
+
+def test_block_grid():
+    blockGrid = GRID.getBlockGrid(8)
+    assert blockGrid == GridTransform(100.0, 200.0, 80.0, 40.0, 3, 4)
+    for index, block in enumerate(GRID.getBlocks(8)):
+        assert (block.xMin, block.yMax) == (blockGrid.window(index // 4, index % 4, 1, 1).xMin,
+                                            blockGrid.window(index // 4, index % 4, 1, 1).yMax)
+
+
+def test_grid_coordinates():
+    assert GRID.toGridCoordinates(100.0, 200.0) == (0.0, 0.0)
+    assert GRID.toGridCoordinates(125.0, 187.5) == (2.5, 2.5)
@@ -0,0 +1,113 @@
+import os
+
+import pytest
+
+pytest.importorskip("arcpy")
+
+from utilities import metadata_catalog
+from utilities.metadata_catalog import LayerMetadata, MetadataCatalog
+
+
+@pytest.fixture
+def describeCalls(monkeypatch):
+    """Replace LayerMetadata.describe with metadata of a raster, and return list of data sources described"""
+
+    calls = []
+
+    def describe(cls, dataSource, version=None):
+        calls.append(dataSource)
+        return cls({
+            "dataSource": dataSource,
+            "version": version,
+            "name": os.path.basename(dataSource),
+            "isRasterLayer": True,
+            "isFeatureLayer": False,
+            "extent": [0.0, 0.0, 100.0, 50.0],
+            "spatialReference": "PROJCS['Albers']",
+            "fieldNames": ["OBJECTID", "Value", "Count"],
+            "grid": [0.0, 50.0, 10.0, 10.0, 5, 10],
+            "isInteger": True,
+            "noDataValue": 255,
+            "valueField": "Value"
+        })
+
+    monkeypatch.setattr(LayerMetadata, "describe", classmethod(describe))
+    monkeypatch.setattr(metadata_catalog.arcpy, "Exists", lambda dataSource: False, raising=False)
+    return calls
+
+
+def createDataSource(tmpdir, name, modified=1000000000):
+    path = tmpdir.join(name)
+    path.write("1234")
+    os.utime(str(path), (modified, modified))
+    return str(path)
+
+
+def test_layer_described_once(tmpdir, describeCalls):
+    dataSource = createDataSource(tmpdir, "values.tif")
+    catalog = MetadataCatalog()
+    layer = catalog.getLayer(dataSource)
+    assert catalog.getLayer(dataSource) is layer
+    assert catalog.exists(dataSource)
+    assert describeCalls == [dataSource]
+
+
+def test_layer_described_again_when_changed(tmpdir, describeCalls):
+    dataSource = createDataSource(tmpdir, "values.tif")
+    catalog = MetadataCatalog()
+    catalog.getLayer(dataSource)
+    os.utime(dataSource, (1000000100, 1000000100))
+    assert not catalog.exists(dataSource)
+    layer = catalog.getLayer(dataSource)
+    assert catalog.getLayer(dataSource) is layer
+    assert describeCalls == [dataSource, dataSource]
+
+
+def test_layer_without_version_described_every_time(tmpdir, describeCalls):
+    dataSource = str(tmpdir.join("missing.tif"))
+    catalog = MetadataCatalog()
+    catalog.getLayer(dataSource)
+    catalog.getLayer(dataSource)
+    assert not catalog.exists(dataSource)
+    assert describeCalls == [dataSource, dataSource]
+
+
+def test_persisted_layers(tmpdir, describeCalls):
+    directory = str(tmpdir.join("catalog"))
+    dataSource = createDataSource(tmpdir, "values.tif")
+    layer = MetadataCatalog(directory).getLayer(dataSource)
+
+    persisted = MetadataCatalog(directory).getLayer(dataSource)
+    assert describeCalls == [dataSource]
+    assert persisted.toJSON() == layer.toJSON()
+    assert persisted.grid == layer.grid
+
+    #persisted entries are also validated against the version of the data source
+    os.utime(dataSource, (1000000100, 1000000100))
+    MetadataCatalog(directory).getLayer(dataSource)
+    assert describeCalls == [dataSource, dataSource]
+
+
+def test_persisted_layers_of_several_processes(tmpdir, describeCalls):
+    directory = str(tmpdir.join("catalog"))
+    dataSources = [createDataSource(tmpdir, "first.tif"), createDataSource(tmpdir, "second.tif")]
+    catalogs = [MetadataCatalog(directory), MetadataCatalog(directory)]
+    for catalog, dataSource in zip(catalogs, dataSources):
+        catalog.getLayer(dataSource)
+
+    catalog = MetadataCatalog(directory)
+    for dataSource in dataSources:
+        catalog.getLayer(dataSource)
+    assert describeCalls == dataSources
+    assert len(os.listdir(directory)) == 2
+
+
+def test_invalid_persisted_layer(tmpdir, describeCalls):
+    directory = str(tmpdir.join("catalog"))
+    dataSource = createDataSource(tmpdir, "values.tif")
+    catalog = MetadataCatalog(directory)
+    with open(catalog._getPath(dataSource), "wb") as entryFile:
+        entryFile.write("{")
+    catalog.getLayer(dataSource)
+    assert describeCalls == [dataSource]
+    assert MetadataCatalog(directory).getLayer(dataSource).valueField == "Value"
@@ -0,0 +1,81 @@
+import numpy
+import pytest
+from numpy.testing import assert_allclose
+
+from utilities.moments import RunningStatistics
+
+
+#large mean and a trend, so that blocks have different means
+VALUES = numpy.random.RandomState(0).normal(1000.0, 5.0, 10000) + numpy.linspace(0, 50, 10000)
+
+
+def test_update_in_blocks():
+    statistics = RunningStatistics()
+    for block in numpy.array_split(VALUES, 7):
+        statistics.update(block)
+    assert statistics.count == len(VALUES)
+    assert statistics.min == VALUES.min()
+    assert statistics.max == VALUES.max()
+    assert_allclose(statistics.sum, VALUES.sum())
+    assert_allclose(statistics.mean, VALUES.mean())
+    assert_allclose(statistics.variance, numpy.var(VALUES))
+    assert_allclose(statistics.std, numpy.std(VALUES))
+
+
+def test_merge():
+    first = RunningStatistics()
+    first.update(VALUES[:100])
+    second = RunningStatistics()
+    second.update(VALUES[100:])
+    first.merge(second)
+    first.merge(RunningStatistics())
+    assert first.count == len(VALUES)
+    assert_allclose(first.mean, VALUES.mean())
+    assert_allclose(first.variance, numpy.var(VALUES))
+
+    empty = RunningStatistics()
+    empty.merge(second)
+    assert (empty.min, empty.max) == (second.min, second.max)
+    assert_allclose(empty.variance, numpy.var(VALUES[100:]))
+
+
+def test_weighted():
+    weights = numpy.random.RandomState(1).rand(len(VALUES))
+    statistics = RunningStatistics()
+    for block, blockWeights in zip(numpy.array_split(VALUES, 3), numpy.array_split(weights, 3)):
+        statistics.update(block, blockWeights)
+    mean = numpy.average(VALUES, weights=weights)
+    assert_allclose(statistics.mean, mean)
+    assert_allclose(statistics.variance, numpy.average((VALUES - mean) ** 2, weights=weights))
+    assert_allclose(statistics.sum, VALUES.sum())
+
+
+def test_masked():
+    values = numpy.ma.masked_array([1.0, 100.0, 3.0], mask=[False, True, False])
+    statistics = RunningStatistics()
+    statistics.update(values)
+    assert statistics.getStatistics(["MIN", "max", "SUM", "MEAN", "STD"]) == {
+        "MIN": 1.0, "max": 3.0, "SUM": 4.0, "MEAN": 2.0, "STD": 1.0}
+
+
+def test_from_blocks():
+    blocks = numpy.array_split(VALUES, 5) + [numpy.zeros(0)]
+    statistics = RunningStatistics.fromBlocks([len(block) for block in blocks],
+                                              [block.sum() for block in blocks],
+                                              [((block - block.mean()) ** 2).sum() if len(block) else 0 for block in blocks],
+                                              [block.min() if len(block) else 0 for block in blocks],
+                                              [block.max() if len(block) else 0 for block in blocks])
+    assert statistics.count == len(VALUES)
+    assert statistics.min == VALUES.min()
+    assert statistics.max == VALUES.max()
+    assert_allclose(statistics.mean, VALUES.mean())
+    assert_allclose(statistics.variance, numpy.var(VALUES))
+    assert RunningStatistics.fromBlocks([0], [0], [0], [0], [0]).count == 0
+
+
+def test_no_values():
+    statistics = RunningStatistics()
+    statistics.update(numpy.zeros(0))
+    assert statistics.getStatistics(["MIN", "MEAN", "STD"]) == {"MIN": None, "MEAN": None, "STD": None}
+    with pytest.raises(ValueError):
+        statistics.getStatistics(["MEDIAN"])
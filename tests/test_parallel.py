@@ -0,0 +1,60 @@
+import os
+import logging
+
+import pytest
+
+pytest.importorskip("arcpy")
+
+import tabulate
+from parallel import WorkerPool
+
+
+class RecordingHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def logInWorker(value):
+    logging.getLogger("tests.worker").info("value %s", value)
+    try:
+        raise ValueError(value)
+    except ValueError:
+        logging.getLogger("tests.worker").exception("error %s", value)
+    return os.getpid()
+
+
+def test_worker_records_logged_in_parent():
+    handler = RecordingHandler()
+    workerLogger = logging.getLogger("tests.worker")
+    workerLogger.addHandler(handler)
+    workerLogger.setLevel(logging.INFO)
+    try:
+        with WorkerPool(2) as pool:
+            pids = set(pool.imap(logInWorker, range(4)))
+    finally:
+        workerLogger.removeHandler(handler)
+
+    assert os.getpid() not in pids
+    assert sorted(record.getMessage() for record in handler.records if record.levelno == logging.INFO) == [
+        "value 0", "value 1", "value 2", "value 3"]
+    errors = [record.getMessage() for record in handler.records if record.levelno == logging.ERROR]
+    assert len(errors) == 4
+    assert all("ValueError" in error for error in errors)
+    assert set(record.process for record in handler.records) == pids
+
+
+class FailingCatalog(object):
+    def getLayer(self, layerPath):
+        raise IOError("cannot describe %s" % (layerPath))
+
+
+def test_layer_description_error_reported_for_layer(monkeypatch):
+    monkeypatch.setattr(tabulate, "getResultCache", lambda: None)
+    monkeypatch.setattr(tabulate, "getMetadataCatalog", lambda: FailingCatalog())
+    result = tabulate.tabulateLayer(None, 3, "/data/missing.tif", {}, None, None)
+    assert result["layerID"] == 3
+    assert "cannot describe /data/missing.tif" in result["error"]
@@ -0,0 +1,94 @@
+import numpy
+from numpy.testing import assert_allclose, assert_array_equal
+
+from utilities.grid import GridTransform
+from utilities.pixel_coverage import (getPolygonCoverage, getLineCoverage, getPixelCoverage, getEdgeMask,
+                                      getPolygonEdgeCoverage, getPolygonWinding, getPolygonMask, getPointMask)
+
+
+#4 x 4 grid of unit pixels, from 0, 0 to 4, 4; row 0 is at the top
+GRID = GridTransform(0.0, 4.0, 1.0, 1.0, 4, 4)
+
+
+def getSquare(xMin, yMin, xMax, yMax, clockwise=True):
+    ring = numpy.array([[xMin, yMin], [xMin, yMax], [xMax, yMax], [xMax, yMin], [xMin, yMin]])
+    return ring if clockwise else ring[::-1]
+
+
+def test_unit_square_coverage():
+    coverage = getPolygonCoverage([getSquare(0.5, 0.5, 1.5, 1.5)], GRID)
+    expected = numpy.zeros((4, 4))
+    expected[2:4, 0:2] = 0.25
+    assert_allclose(coverage, expected)
+
+
+def test_coverage_independent_of_orientation():
+    assert_allclose(getPolygonCoverage([getSquare(0.5, 0.5, 1.5, 1.5, False)], GRID),
+                    getPolygonCoverage([getSquare(0.5, 0.5, 1.5, 1.5)], GRID))
+
+
+def test_triangle_coverage():
+    coverage = getPolygonCoverage([numpy.array([[0.0, 0.0], [0.0, 4.0], [4.0, 0.0], [0.0, 0.0]])], GRID)
+    assert_allclose(coverage.sum(), 8.0)
+    #pixels along the diagonal are half covered
+    assert_allclose(numpy.diag(coverage), 0.5)
+    assert coverage[3, 0] == 1.0
+    assert coverage[0, 3] == 0.0
+
+
+def test_inner_ring_coverage():
+    coverage = getPolygonCoverage([getSquare(0, 0, 4, 4), getSquare(1, 1, 3, 3, False)], GRID)
+    expected = numpy.ones((4, 4))
+    expected[1:3, 1:3] = 0
+    assert_allclose(coverage, expected)
+
+
+def test_coverage_outside_grid():
+    #only the part of the polygon within the grid is counted
+    coverage = getPolygonCoverage([getSquare(-2, -2, 1, 1)], GRID)
+    expected = numpy.zeros((4, 4))
+    expected[3, 0] = 1
+    assert_allclose(coverage, expected)
+
+
+def test_pixel_coverage_in_map_units():
+    grid = GridTransform(0.0, 40.0, 10.0, 10.0, 4, 4)
+    coverage = getPixelCoverage([getSquare(5, 5, 15, 15)], grid, "Polygon")
+    assert_allclose(coverage.sum(), 100.0)
+    assert_allclose(coverage[2:4, 0:2], 25.0)
+
+
+def test_line_coverage():
+    coverage = getLineCoverage([numpy.array([[0.0, 0.5], [4.0, 0.5]]), numpy.array([[0.0, 4.0], [2.0, 2.0]])], GRID)
+    expected = numpy.zeros((4, 4))
+    expected[3, :] = 1.0
+    expected[0, 0] = expected[1, 1] = numpy.sqrt(2)
+    assert_allclose(coverage, expected)
+    grid = GridTransform(0.0, 40.0, 10.0, 10.0, 4, 4)
+    assert_allclose(getPixelCoverage([numpy.array([[0.0, 5.0], [40.0, 5.0]])], grid, "Polyline").sum(), 40.0)
+
+
+def test_edge_coverage_matches_coverage():
+    rings = [numpy.array([[0.3, 0.2], [0.7, 3.6], [3.1, 3.9], [3.8, 0.6], [2.0, 1.4], [0.3, 0.2]])]
+    coverage = getPolygonCoverage(rings, GRID)
+    rows, cols, edgeCoverage = getPolygonEdgeCoverage(rings, GRID)
+    assert_allclose(edgeCoverage, coverage[rows, cols])
+    edgeMask = getEdgeMask(rings, GRID)
+    assert_array_equal(numpy.sort(rows * 4 + cols), numpy.flatnonzero(edgeMask))
+
+
+def test_winding_and_mask():
+    rings = [getSquare(0.2, 0.2, 3.8, 3.8), getSquare(1.2, 1.2, 2.8, 2.8, False), getSquare(0.2, 0.2, 1.8, 1.8)]
+    winding = numpy.abs(getPolygonWinding(rings, GRID))
+    expected = numpy.ones((4, 4), dtype=numpy.int64)
+    expected[1:3, 1:3] = 0
+    #overlapping polygons
+    expected[2:4, 0:2] += 1
+    expected[2, 1] = 1
+    assert_array_equal(winding, expected)
+    assert_array_equal(getPolygonMask(rings, GRID), expected != 0)
+
+
+def test_point_mask():
+    mask = getPointMask([numpy.array([[0.5, 0.5], [3.5, 3.5], [10.0, 10.0]])], GRID)
+    assert_array_equal(numpy.argwhere(mask), [[0, 3], [3, 0]])
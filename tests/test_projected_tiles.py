@@ -0,0 +1,108 @@
+import os
+
+import numpy
+import pytest
+from numpy.testing import assert_array_equal
+
+pytest.importorskip("arcpy")
+
+from utilities.grid import GridTransform
+from utilities.projected_tiles import ProjectedTileCache, ProjectedTileReader, _getCompactValues
+
+
+CELL_SIZE = 10.0
+
+#projected extent of layer, not aligned to tiles
+LAYER_GRID = GridTransform(-60.0, 130.0, CELL_SIZE, CELL_SIZE, 23, 19)
+
+
+def getProjectedValues(window):
+    """Return values of layer within window: row * 1000 + column from the origin, masked outside layer and in a pattern"""
+
+    rows = int(round(-window.yMax / CELL_SIZE)) + numpy.arange(window.rows)[:, numpy.newaxis]
+    cols = int(round(window.xMin / CELL_SIZE)) + numpy.arange(window.cols)[numpy.newaxis, :]
+    layerRow = int(round(-LAYER_GRID.yMax / CELL_SIZE))
+    layerCol = int(round(LAYER_GRID.xMin / CELL_SIZE))
+    inLayer = ((rows >= layerRow) & (rows < layerRow + LAYER_GRID.rows) &
+               (cols >= layerCol) & (cols < layerCol + LAYER_GRID.cols))
+    values = (rows * 1000 + cols).astype(numpy.int64)
+    return numpy.ma.masked_array(numpy.where(inLayer, values, 0), mask=~inLayer | ((rows + cols) % 7 == 0))
+
+
+class FakeProjectedTileReader(ProjectedTileReader):
+    """Projects tiles from getProjectedValues instead of the layer"""
+
+    def __init__(self, tileCache):
+        self.tileCache = tileCache
+        self.isInteger = True
+        self.noDataValue = None
+        self.cellSize = CELL_SIZE
+        self.key = "layer"
+        self.grid = LAYER_GRID
+        self.tilesProjected = 0
+        self.tilesRead = 0
+
+    def _projectTile(self, tile):
+        self.tilesProjected += 1
+        return getProjectedValues(tile)
+
+
+def assertMaskedEqual(values, expected):
+    assert_array_equal(numpy.ma.getmaskarray(values), numpy.ma.getmaskarray(expected))
+    assert_array_equal(values.filled(0), expected.filled(0))
+
+
+@pytest.mark.parametrize("window", [LAYER_GRID, LAYER_GRID.window(3, 5, 11, 7), LAYER_GRID.window(-4, -6, 30, 30),
+                                    LAYER_GRID.window(20, 17, 8, 8)])
+def test_read(tmpdir, window):
+    reader = FakeProjectedTileReader(ProjectedTileCache(str(tmpdir), 10 ** 9, 8))
+    assertMaskedEqual(reader.read(window), getProjectedValues(window))
+    tilesProjected = reader.tilesProjected
+    assert tilesProjected > 0
+    #tiles are read from cache the second time
+    assertMaskedEqual(reader.read(window), getProjectedValues(window))
+    assert reader.tilesProjected == tilesProjected
+    assert reader.tilesRead == tilesProjected
+
+
+def test_read_outside_layer(tmpdir):
+    reader = FakeProjectedTileReader(ProjectedTileCache(str(tmpdir), 10 ** 9, 8))
+    values = reader.read(LAYER_GRID.window(-20, 0, 10, 10))
+    assert values.shape == (10, 10)
+    assert values.mask.all()
+    assert reader.tilesProjected == 0
+
+
+def test_tiles_without_key_are_not_cached(tmpdir):
+    reader = FakeProjectedTileReader(ProjectedTileCache(str(tmpdir), 10 ** 9, 8))
+    reader.key = None
+    assertMaskedEqual(reader.read(LAYER_GRID), getProjectedValues(LAYER_GRID))
+    assert reader.tilesRead == 0
+    assert os.listdir(str(tmpdir)) == []
+
+
+def test_evict_least_recently_used(tmpdir):
+    tileCache = ProjectedTileCache(str(tmpdir), 0, 8)
+    tile = getProjectedValues(GridTransform(0.0, 0.0, CELL_SIZE, CELL_SIZE, 8, 8))
+    for col in range(3):
+        tileCache.setTile("layer", 0, col, tile, True)
+    tileSize = sum(os.path.getsize(path) for path in tileCache._getPaths("layer", 0, 0))
+    for col, modified in enumerate([1000000300, 1000000100, 1000000200]):
+        os.utime(tileCache._getPaths("layer", 0, col)[0], (modified, modified))
+
+    tileCache.maxBytes = 2 * tileSize
+    tileCache.evict()
+    assert tileCache.getTile("layer", 0, 1) is None
+    assert not os.path.exists(tileCache._getPaths("layer", 0, 1)[1])
+    values, mask = tileCache.getTile("layer", 0, 0)
+    assertMaskedEqual(numpy.ma.masked_array(values, mask=mask), tile)
+    assert tileCache.getTile("layer", 0, 2) is not None
+
+
+def test_compact_values():
+    values = numpy.ma.masked_array([1, 200, -5], mask=[False, False, True])
+    compact = _getCompactValues(values, True)
+    assert compact.dtype == numpy.uint8
+    assert_array_equal(compact, [1, 200, 0])
+    assert _getCompactValues(numpy.ma.masked_array([0.5, 1.25]), False).dtype == numpy.float32
+    assert _getCompactValues(numpy.ma.masked_array([0.1]), False).dtype == numpy.float64
@@ -0,0 +1,107 @@
+import math
+from collections import namedtuple
+
+import numpy
+import pytest
+from numpy.testing import assert_allclose
+
+from tool_exceptions import GPToolError
+from utilities.projection_engine import (parseWKT, getCoordinateSystem, AlbersSystem, WebMercatorSystem, Transformer,
+                                         getTransformer, getPartsExtent)
+
+
+SpatialReference = namedtuple("SpatialReference", ["wkt"])
+SpatialReference.exportToString = lambda self: self.wkt
+
+NAD27 = ("GEOGCS['GCS_North_American_1927',DATUM['D_North_American_1927',SPHEROID['Clarke_1866',6378206.4,"
+         "294.9786982]],PRIMEM['Greenwich',0.0],UNIT['Degree',0.0174532925199433]]")
+
+#Snyder, Map Projections: A Working Manual, p. 292
+SNYDER_ALBERS = ("PROJCS['Snyder_Albers'," + NAD27 + ",PROJECTION['Albers'],PARAMETER['False_Easting',0.0],"
+                 "PARAMETER['False_Northing',0.0],PARAMETER['Central_Meridian',-96.0],"
+                 "PARAMETER['Standard_Parallel_1',29.5],PARAMETER['Standard_Parallel_2',45.5],"
+                 "PARAMETER['Latitude_Of_Origin',23.0],UNIT['Meter',1.0]];-16901100 -6972200 266467840.990852;"
+                 "#;#;0.001;#;#;IsHighPrecision")
+
+WGS84 = ("GEOGCS['GCS_WGS_1984',DATUM['D_WGS_1984',SPHEROID['WGS_1984',6378137.0,298.257223563]],"
+         "PRIMEM['Greenwich',0.0],UNIT['Degree',0.0174532925199433]]")
+
+WEB_MERCATOR = ("PROJCS['WGS_1984_Web_Mercator_Auxiliary_Sphere'," + WGS84 + ",PROJECTION['Mercator_Auxiliary_Sphere'],"
+                "PARAMETER['False_Easting',0.0],PARAMETER['False_Northing',0.0],PARAMETER['Central_Meridian',0.0],"
+                "PARAMETER['Standard_Parallel_1',0.0],PARAMETER['Auxiliary_Sphere_Type',0.0],UNIT['Meter',1.0]]")
+
+WGS84_UTM = ("PROJCS['WGS_1984_UTM_Zone_10N'," + WGS84 + ",PROJECTION['Transverse_Mercator'],"
+             "PARAMETER['False_Easting',500000.0],PARAMETER['False_Northing',0.0],PARAMETER['Central_Meridian',-123.0],"
+             "PARAMETER['Scale_Factor',0.9996],PARAMETER['Latitude_Of_Origin',0.0],UNIT['Meter',1.0]]")
+
+
+def test_parse_wkt():
+    properties = parseWKT(SNYDER_ALBERS)
+    assert properties["type"] == "Projected"
+    assert properties["datum"] == "D_North_American_1927"
+    assert properties["semiMajorAxis"] == 6378206.4
+    assert_allclose(properties["flattening"], 1 / 294.9786982)
+    assert_allclose(properties["radiansPerUnit"], math.pi / 180)
+    assert properties["projection"] == "Albers"
+    assert properties["metersPerUnit"] == 1.0
+    assert properties["parameters"]["standard_parallel_2"] == 45.5
+    assert parseWKT(WGS84)["type"] == "Geographic"
+    assert parseWKT("PROJCS['Unknown']") is None
+
+
+def test_get_coordinate_system():
+    assert isinstance(getCoordinateSystem(SNYDER_ALBERS), AlbersSystem)
+    assert isinstance(getCoordinateSystem(WEB_MERCATOR), WebMercatorSystem)
+    assert getCoordinateSystem(WGS84_UTM) is None
+
+
+def test_snyder_albers_example():
+    transformer = Transformer(getCoordinateSystem(NAD27), getCoordinateSystem(SNYDER_ALBERS))
+    x, y = transformer.transform([-75.0], [35.0])
+    assert_allclose(x, [1885472.7], atol=0.1)
+    assert_allclose(y, [1535925.0], atol=0.1)
+    assert_allclose(getCoordinateSystem(SNYDER_ALBERS).getScaleFactors(numpy.radians([29.5, 45.5])), [1, 1])
+
+
+def test_albers_round_trip():
+    albers = getCoordinateSystem(SNYDER_ALBERS)
+    longitudes, latitudes = numpy.meshgrid(numpy.radians(numpy.linspace(-170, 10, 19)),
+                                           numpy.radians(numpy.linspace(-89, 89, 19)))
+    x, y = albers.fromGeographic(longitudes, latitudes)
+    inverseLongitudes, inverseLatitudes = albers.toGeographic(x, y)
+    assert_allclose(inverseLongitudes, longitudes, atol=1e-10)
+    assert_allclose(inverseLatitudes, latitudes, atol=1e-10)
+
+
+def test_web_mercator():
+    transformer = Transformer(getCoordinateSystem(WGS84), getCoordinateSystem(WEB_MERCATOR))
+    x, y = transformer.transform([180.0, 0.0, -90.0], [0.0, 45.0, -45.0])
+    assert_allclose(x, [20037508.342789244, 0, -10018754.171394622])
+    assert_allclose(y, [0, 5621521.486192066, -5621521.486192066], atol=1e-6)
+    part = numpy.array([[10.0, 20.0], [-30.0, -40.0]])
+    inverse = Transformer(getCoordinateSystem(WEB_MERCATOR), getCoordinateSystem(WGS84))
+    assert_allclose(inverse.transformPart(transformer.transformPart(part)), part)
+
+
+def test_get_transformer():
+    assert getTransformer(SpatialReference(WGS84), SpatialReference(WEB_MERCATOR)) is not None
+    #requires a geographic transformation
+    assert getTransformer(SpatialReference(WGS84), SpatialReference(SNYDER_ALBERS)) is None
+    assert getTransformer(SpatialReference(WGS84), SpatialReference(WGS84_UTM)) is None
+
+
+def test_parts_extent():
+    assert getPartsExtent([numpy.array([[1.0, 5.0], [2.0, -1.0]]), numpy.array([[-3.0, 4.0]])]) == (-3.0, -1.0, 2.0, 5.0)
+    #empty parts are skipped
+    assert getPartsExtent([numpy.zeros((0, 2)), numpy.array([[1.0, 2.0]])]) == (1.0, 2.0, 1.0, 2.0)
+
+
+@pytest.mark.parametrize("parts", [
+    [],
+    [numpy.zeros((0, 2))],
+    [numpy.array([[1.0, 2.0], [numpy.inf, 3.0]])],
+    [numpy.array([[1.0, numpy.nan]])]
+])
+def test_parts_extent_invalid(parts):
+    with pytest.raises(GPToolError):
+        getPartsExtent(parts)
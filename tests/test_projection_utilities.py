@@ -0,0 +1,34 @@
+import math
+from collections import namedtuple
+
+import pytest
+
+pytest.importorskip("arcpy")
+
+from utilities.ProjectionUtilities import getCustomAlbersParameters, getCustomAlbersWKT, getAlbersScaleError
+
+
+Extent = namedtuple("Extent", ["XMin", "YMin", "XMax", "YMax"])
+
+
+def test_custom_albers_parameters():
+    assert getCustomAlbersParameters(Extent(-120, 30, -100, 48)) == (-110.0, 33.0, 45.0)
+
+
+def test_snapped_custom_albers_parameters():
+    centralMeridian, lat1, lat2 = getCustomAlbersParameters(Extent(-120.3, 30.2, -100.1, 48.4), 5, 0.01)
+    assert (centralMeridian, lat1, lat2) == (-110.0, 30.0, 50.0)
+
+
+@pytest.mark.parametrize("extent", [Extent(10, -1, 12, 1), Extent(10, -0.5, 12, 1.3), Extent(10, -1.3, 12, 0.5)])
+def test_snapped_custom_albers_parameters_near_equator(extent):
+    centralMeridian, lat1, lat2 = getCustomAlbersParameters(extent, 1, 0.01)
+    assert lat1 != -lat2
+    assert lat1 <= extent.YMin + (extent.YMax - extent.YMin) / 6.0
+    assert lat2 >= extent.YMax - (extent.YMax - extent.YMin) / 6.0
+    scaleError = getAlbersScaleError(getCustomAlbersWKT(centralMeridian, lat1, lat2), extent.YMin, extent.YMax)
+    assert not math.isnan(scaleError) and scaleError < 0.01
+
+
+def test_albers_scale_error_symmetric_parallels():
+    assert math.isnan(getAlbersScaleError(getCustomAlbersWKT(11, -1, 1), -1, 1))
@@ -0,0 +1,95 @@
+import os
+import json
+import time
+from collections import namedtuple
+
+import pytest
+
+pytest.importorskip("arcpy")
+
+import settings
+from utilities.result_cache import getCacheKey, ResultCache
+
+
+SpatialReference = namedtuple("SpatialReference", ["wkt"])
+SpatialReference.exportToString = lambda self: self.wkt
+
+ALBERS = SpatialReference("PROJCS['Albers']")
+
+
+@pytest.fixture
+def dataSource(tmpdir):
+    path = tmpdir.join("values.tif")
+    path.write("1234")
+    os.utime(str(path), (1000000000, 1000000000))
+    return str(path)
+
+
+def getKey(dataSource, geometryHash="aoi", layerConfig=None, spatialReference=ALBERS):
+    return getCacheKey(geometryHash, dataSource, layerConfig or {"pixelCount": True}, spatialReference)
+
+
+def test_key_is_stable(dataSource):
+    assert getKey(dataSource) == getKey(dataSource)
+    #order of configuration does not matter
+    assert (getKey(dataSource, layerConfig={"pixelCount": True, "statistics": ["MEAN"]}) ==
+            getKey(dataSource, layerConfig={"statistics": ["MEAN"], "pixelCount": True}))
+
+
+def test_key_changes_with_request(dataSource):
+    key = getKey(dataSource)
+    assert getKey(dataSource, geometryHash="other aoi") != key
+    assert getKey(dataSource, layerConfig={"pixelCount": False}) != key
+    assert getKey(dataSource, spatialReference=SpatialReference("PROJCS['Other']")) != key
+
+
+@pytest.mark.parametrize("name,value", [("PRECISE_MAX_PIXELS", 1), ("PRECISE_COVERAGE_METHOD", "fishnet"),
+                                        ("RASTER_STREAMING", False), ("GEOGRAPHIC_AREA_METHOD", "project")])
+def test_key_changes_with_settings(dataSource, monkeypatch, name, value):
+    key = getKey(dataSource)
+    monkeypatch.setattr(settings, name, value)
+    assert getKey(dataSource) != key
+
+
+def test_key_changes_with_data_source_version(dataSource):
+    key = getKey(dataSource)
+    os.utime(dataSource, (1000000100, 1000000100))
+    modifiedKey = getKey(dataSource)
+    assert modifiedKey != key
+    with open(dataSource, "ab") as dataFile:
+        dataFile.write("5")
+    os.utime(dataSource, (1000000100, 1000000100))
+    assert getKey(dataSource) not in (key, modifiedKey)
+    #auxiliary files are part of the data source
+    with open(dataSource + ".aux.xml", "wb") as auxFile:
+        auxFile.write("<PAMDataset/>")
+    assert getKey(dataSource) not in (key, modifiedKey)
+
+
+def test_no_key_without_version(tmpdir):
+    assert getKey(str(tmpdir.join("missing.tif"))) is None
+
+
+def test_get_and_set(tmpdir):
+    cache = ResultCache(str(tmpdir.join("cache")), 1000000)
+    assert cache.get("key") is None
+    cache.set("key", {"area": 1.5, "classes": [1, 2]})
+    assert cache.get("key") == {"area": 1.5, "classes": [1, 2]}
+    #values that cannot be serialized are not cached
+    cache.set("other", {"area": object()})
+    assert cache.get("other") is None
+    assert sorted(os.listdir(cache.directory)) == ["key.json"]
+
+
+def test_evict_least_recently_used(tmpdir):
+    value = {"values": "x" * 100}
+    cache = ResultCache(str(tmpdir.join("cache")), int(2.5 * len(json.dumps(value))))
+    now = time.time()
+    cache.set("a", value)
+    os.utime(cache._getPath("a"), (now - 200, now - 200))
+    cache.set("b", value)
+    os.utime(cache._getPath("b"), (now - 100, now - 100))
+    #reading a marks it as most recently used, so b is evicted
+    assert cache.get("a") == value
+    cache.set("c", value)
+    assert sorted(os.listdir(cache.directory)) == ["a.json", "c.json"]
@@ -0,0 +1,94 @@
+import numpy
+from numpy.testing import assert_allclose, assert_array_equal
+
+from utilities.tally import getTallyMethod, tallyValues, ClassBinner, sumByValue
+
+
+def assertTally(values, weights, expectedValues, expectedCounts, expectedSums=None):
+    uniqueValues, counts, sums = tallyValues(values, weights)
+    assert_array_equal(uniqueValues, expectedValues)
+    assert_array_equal(counts, expectedCounts)
+    if expectedSums is None:
+        assert sums is None
+    else:
+        assert_allclose(sums, expectedSums)
+
+
+def test_tally_bincount():
+    values = numpy.array([[5, -3, 5], [5, -3, 7]], dtype=numpy.int16)
+    assert getTallyMethod(values.ravel()) == "bincount"
+    assertTally(values, None, [-3, 5, 7], [2, 3, 1])
+    assertTally(values, numpy.arange(6).reshape(2, 3), [-3, 5, 7], [2, 3, 1], [5, 5, 5])
+    assert tallyValues(values)[0].dtype == numpy.int16
+
+
+def test_tally_sort():
+    values = numpy.array([10 ** 9, 0, 10 ** 9, -10 ** 9], dtype=numpy.int64)
+    assert getTallyMethod(values) == "sort"
+    assertTally(values, None, [-10 ** 9, 0, 10 ** 9], [1, 1, 2])
+    assertTally(values, [1.0, 2.0, 3.0, 4.0], [-10 ** 9, 0, 10 ** 9], [1, 1, 2], [4.0, 2.0, 4.0])
+
+
+def test_tally_unique():
+    values = numpy.array([1.5, 0.5, 1.5])
+    assert getTallyMethod(values) == "unique"
+    assertTally(values, None, [0.5, 1.5], [1, 2])
+    assertTally(values, [1.0, 2.0, 3.0], [0.5, 1.5], [1, 2], [2.0, 4.0])
+
+
+def test_tally_methods_agree():
+    values = numpy.random.RandomState(0).randint(0, 50, 1000)
+    weights = numpy.random.RandomState(1).rand(1000)
+    expected = tallyValues(values.astype(numpy.float64), weights)
+    for method in (values, values * 10 ** 7):
+        uniqueValues, counts, sums = tallyValues(method, weights)
+        assert_array_equal(uniqueValues, numpy.unique(method))
+        assert_array_equal(counts, expected[1])
+        assert_allclose(sums, expected[2])
+
+
+def test_tally_masked():
+    values = numpy.ma.masked_array([1, 2, 2, 3], mask=[False, True, False, True])
+    assertTally(values, [1.0, 2.0, 3.0, 4.0], [1, 2], [1, 1], [1.0, 3.0])
+    assertTally(numpy.ma.masked_all((2, 2), dtype=numpy.int32), [[1.0, 1.0], [1.0, 1.0]], [], [], [])
+
+
+CLASS_BREAKS = [[0, 10], [5, 15], [20, 30]]
+
+
+def test_classify():
+    binner = ClassBinner(CLASS_BREAKS)
+    assert_array_equal(binner.classify([1, 7, 10, 12, 15, 17, 25, 30, -1, numpy.nan]),
+                       [0, 0, 1, 1, -1, -1, 2, -1, -1, -1])
+    assert binner.getClass(7) == 0
+    assert binner.getClass(17) is None
+    assert binner.getClass("7") is None
+    assert binner.getClass(True) is None
+
+
+def test_class_tally():
+    binner = ClassBinner(CLASS_BREAKS)
+    values = numpy.array([1, 7, 12, 17, 25, numpy.nan])
+    weights = numpy.array([1.0, 2.0, 4.0, 8.0, 16.0, 32.0])
+    counts, sums = binner.tally(values, weights)
+    assert_array_equal(counts, [2, 2, 1])
+    assert_allclose(sums, [3.0, 6.0, 16.0])
+    counts, sums = binner.tally(values, weights, firstClassOnly=True)
+    assert_array_equal(counts, [2, 1, 1])
+    assert_allclose(sums, [3.0, 4.0, 16.0])
+    counts, sums = binner.tally(values)
+    assert_array_equal(counts, [2, 2, 1])
+    assert sums is None
+
+
+def test_class_tally_unsorted_classes():
+    #classes are tallied in the order they are given
+    counts = ClassBinner([[20, 30], [0, 10]]).tally(numpy.array([5, 25, 26]))[0]
+    assert_array_equal(counts, [2, 1])
+
+
+def test_sum_by_value():
+    uniqueValues, counts, sums = sumByValue(["b", "a", "b"], [1, 2, 3], [0.5, 1.0, 1.5])
+    assert list(uniqueValues) == ["a", "b"]
+    assert_array_equal(counts, [2, 4])
+    assert_allclose(sums, [1.0, 2.0])
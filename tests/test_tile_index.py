@@ -0,0 +1,107 @@
+import numpy
+import pytest
+from numpy.testing import assert_allclose, assert_array_equal
+
+pytest.importorskip("arcpy")
+
+from utilities import tile_index
+from utilities.grid import GridTransform
+from utilities.pixel_coverage import getPolygonMask
+from utilities.tally import tallyValues, sumByValue
+from utilities.tile_index import TileIndex, buildTileIndex
+
+
+GRID = GridTransform(0.0, 400.0, 10.0, 10.0, 40, 50)
+RINGS = [numpy.array([[35.0, 30.0], [60.0, 380.0], [450.0, 365.0], [400.0, 45.0], [35.0, 30.0]])]
+
+
+class ArrayReader(object):
+    """Reads windows of an array in place of RasterWindowReader"""
+
+    def __init__(self, values):
+        self.values = values
+        self.grid = GRID
+        self.isInteger = numpy.issubdtype(values.dtype, numpy.integer)
+
+    def read(self, window):
+        row, col = self.grid.getOffset(window)
+        return self.values[row:row + window.rows, col:col + window.cols]
+
+
+def getValues(isInteger):
+    random = numpy.random.RandomState(0)
+    data = random.randint(-3, 8, GRID.shape) if isInteger else random.normal(100.0, 10.0, GRID.shape)
+    return numpy.ma.masked_array(data, mask=random.rand(*GRID.shape) < 0.1)
+
+
+def buildIndex(tmpdir, monkeypatch, values):
+    dataSource = tmpdir.join("values.tif")
+    dataSource.write("1234")
+    monkeypatch.setattr(tile_index, "RasterWindowReader", lambda dataSource: ArrayReader(values))
+    return TileIndex(buildTileIndex(str(dataSource), str(tmpdir.join("indexes")), (16, 4)))
+
+
+def getTileMask(tileIndex, insideTiles):
+    """Return number of inside tiles that contain each pixel"""
+
+    counts = numpy.zeros(GRID.shape, dtype=numpy.int64)
+    for tileSize, tiles in insideTiles:
+        tileCols = tileIndex.getTileGrid(tileSize).cols
+        for tile in tiles:
+            row, col = tile // tileCols * tileSize, tile % tileCols * tileSize
+            counts[row:row + tileSize, col:col + tileSize] += 1
+    return counts
+
+
+def test_decompose(tmpdir, monkeypatch):
+    tileIndex = buildIndex(tmpdir, monkeypatch, getValues(True))
+    assert tileIndex.tileSizes == [16, 4]
+    assert tileIndex.grid == GRID
+    window = GRID.getWindowForExtent(35.0, 30.0, 450.0, 380.0)
+    insideTiles, numPixels, blocks = tileIndex.decompose(RINGS, window)
+    assert [tileSize for tileSize, tiles in insideTiles] == [16, 4]
+    assert all(len(tiles) for tileSize, tiles in insideTiles)
+
+    tileCounts = getTileMask(tileIndex, insideTiles)
+    assert tileCounts.max() == 1
+    assert numPixels == tileCounts.sum()
+    blockCounts = numpy.zeros(GRID.shape, dtype=numpy.int64)
+    for block in blocks:
+        row, col = GRID.getOffset(block)
+        blockCounts[max(row, 0):row + block.rows, max(col, 0):col + block.cols] += 1
+    assert blockCounts.max() == 1
+    assert not (tileCounts & blockCounts).any()
+
+    #tiles are entirely within the area of interest; blocks that are read cover the rest of it
+    polygonMask = getPolygonMask(RINGS, GRID)
+    assert not (tileCounts.astype(bool) & ~polygonMask).any()
+    assert not (polygonMask & ~(tileCounts.astype(bool) | blockCounts.astype(bool))).any()
+
+
+def test_value_counts(tmpdir, monkeypatch):
+    values = getValues(True)
+    tileIndex = buildIndex(tmpdir, monkeypatch, values)
+    insideTiles = tileIndex.decompose(RINGS, GRID)[0]
+    inside = getTileMask(tileIndex, insideTiles).astype(bool)
+
+    assert tileIndex.getCount(insideTiles) == values[inside].count()
+    uniqueValues, counts = sumByValue(*tileIndex.getValueCounts(insideTiles))[:2]
+    expectedValues, expectedCounts = tallyValues(values[inside])[:2]
+    assert_array_equal(uniqueValues, expectedValues)
+    assert_array_equal(counts, expectedCounts)
+
+
+@pytest.mark.parametrize("isInteger", [True, False])
+def test_statistics(tmpdir, monkeypatch, isInteger):
+    values = getValues(isInteger)
+    tileIndex = buildIndex(tmpdir, monkeypatch, values)
+    insideTiles = tileIndex.decompose(RINGS, GRID)[0]
+    insideValues = values[getTileMask(tileIndex, insideTiles).astype(bool)].compressed()
+
+    statistics = tileIndex.getStatistics(insideTiles)
+    assert statistics.count == len(insideValues)
+    assert statistics.min == insideValues.min()
+    assert statistics.max == insideValues.max()
+    assert_allclose(statistics.sum, insideValues.sum())
+    assert_allclose(statistics.mean, insideValues.mean())
+    assert_allclose(statistics.variance, numpy.var(insideValues))
@@ -3,7 +3,12 @@ Converts a featureset in JSON into a feature class in memory
 """
 
 
-import arcpy,os,json
+import arcpy,os,datetime
+import numpy
+
+from utilities.scratch import getUniqueName
+from utilities.ProjectionUtilities import getSpatialReferenceFromWKID
+from utilities.featureset_reader import FeatureSetReader,openFeatureSet,getFeatureParts,getGeometryJSON
 
 
 
@@ -19,6 +24,13 @@ esriFieldTypesMap["esriFieldTypeDouble"]="DOUBLE"
 esriFieldTypesMap["esriFieldTypeDate"]="DATE"
 esriFieldTypesMap["esriFieldTypeOID"]="LONG"
 
+#numpy data types of numeric fields that can be created together from a template table (see createFeatureClassSchema)
+fieldNumpyTypesMap=dict()
+fieldNumpyTypesMap["SHORT"]=numpy.int16
+fieldNumpyTypesMap["LONG"]=numpy.int32
+fieldNumpyTypesMap["FLOAT"]=numpy.float32
+fieldNumpyTypesMap["DOUBLE"]=numpy.float64
+
 
 
 def getFeatureGeometry(geomType,geometry):
@@ -57,62 +69,135 @@ def getFeatureGeometry(geomType,geometry):
         raise Exception("GEOMETRY_TYPE_NOT_IMPLEMENTED: This geometry type is not implemented %s"%(geomType))
 
 
+def getFieldValue(fieldType,value):
+    """
+    Convert an attribute value from featureset JSON to the value inserted into a field.
+
+    :param fieldType: field type (e.g., DATE)
+    :param value: attribute value; dates are milliseconds since epoch
+    """
+
+    if fieldType=="DATE" and value is not None:
+        return datetime.datetime(1970,1,1)+datetime.timedelta(milliseconds=value)
+    return value
+
+
+def isASCII(name):
+    """
+    Return True if name of field can be used in a numpy dtype (which requires str names in Python 2)
+    """
+
+    try:
+        name.encode("ascii")
+    except UnicodeError:
+        return False
+    return True
+
+
+def createFeatureClassSchema(featureClass,geomType,sr,fieldsJSON):
+    """
+    Create a feature class with the fields of a featureset.  Numeric fields without an alias (or whose alias is their
+    name) and with ASCII names are created together with the feature class, from an empty template table (created with
+    arcpy.da.NumPyArrayToTable), which cannot set aliases.  Other fields (text, dates, GUIDs, fields with aliases, and
+    fields with non-ASCII names) are added one at a time, with their length and alias.  FID and OBJECTID fields are not
+    created.
+
+    :param featureClass: path of feature class
+    :param geomType: ArcGIS JSON geometry type
+    :param sr: spatial reference of feature class
+    :param fieldsJSON: list of fields from featureset JSON
+    :return: list of (name, type) of fields created
+    """
+
+    fields=[]
+    templateTypes=[]
+    otherFields=[]
+    for fieldJSON in fieldsJSON:
+        fieldType=esriFieldTypesMap[fieldJSON["type"]]
+        name=fieldJSON["name"]
+        if name in ("FID","OBJECTID"):
+            continue
+        fields.append((name,fieldType))
+        if fieldNumpyTypesMap.has_key(fieldType) and fieldJSON.get("alias",name)==name and isASCII(name):
+            templateTypes.append((str(name),fieldNumpyTypesMap[fieldType]))
+        else:
+            otherFields.append(fieldJSON)
+
+    path,fcName=os.path.split(featureClass)
+    template=""
+    if templateTypes:
+        template="IN_MEMORY/%s"%(getUniqueName("fieldsTemplate"))
+        arcpy.da.NumPyArrayToTable(numpy.zeros(0,dtype=templateTypes),template)
+    try:
+        arcpy.CreateFeatureclass_management(path,fcName,geomType.replace("esriGeometry",""),template,"","",sr)
+    finally:
+        if template:
+            arcpy.Delete_management(template)
+
+    for fieldJSON in otherFields:
+        name=fieldJSON["name"]
+        fieldLength=""
+        if fieldJSON.has_key("length"):
+            fieldLength=int(fieldJSON["length"])
+        arcpy.AddField_management(featureClass,name,esriFieldTypesMap[fieldJSON["type"]],"","",fieldLength,
+                                  fieldJSON.get("alias",name))
+    return fields
+
+
+def insertFeatures(featureClass,geomType,fields,features,transform=None):
+    """
+    Insert features into feature class as tuples, with a single arcpy.da.InsertCursor.
+
+    :param featureClass: feature class created by createFeatureClassSchema
+    :param geomType: ArcGIS JSON geometry type
+    :param fields: list of (name, type) of fields, from createFeatureClassSchema
+    :param features: iterable of features from featureset JSON (attributes and geometry)
+    :param transform: transform of featureset JSON if coordinates are quantized
+    :return: number of features inserted
+    """
+
+    count=0
+    rows=arcpy.da.InsertCursor(featureClass,["SHAPE@JSON"]+[name for name,fieldType in fields])
+    try:
+        for feature in features:
+            attributes=feature.get("attributes") or dict()
+            geometryJSON=getGeometryJSON(geomType,getFeatureParts(geomType,feature["geometry"],transform))
+            rows.insertRow([geometryJSON]+[getFieldValue(fieldType,attributes.get(name)) for name,fieldType in fields])
+            count+=1
+    finally:
+        del rows
+    return count
+
 
-def createFeatureClass(featureSet,name="drawingFC"):
+def createFeatureClass(featureSet,name=None):
     """
     Create an in-memory feature class from a featureset JSON.
 
-    :param featureSet: the featureset JSON string.
-    :param name: name of output feature class (always in memory)
+    :param featureSet: the featureset JSON string, or file-like object to read featureset JSON from.  Features are read
+        and inserted one at a time (see FeatureSetReader).  Quantized and gzip-compressed featuresets are detected
+        automatically (see openFeatureSet).
+    :param name: name of output feature class (always in memory).  If not provided, a unique name is used so that
+        concurrent requests do not overwrite each other's features.
 
     .. note:: the original feature IDs (FID / OBJECTID) are not preserved in feature class, as they are built up fresh
         during construction of feature class.
     """
 
-    srcFeatureJSON=json.loads(featureSet)
+    reader=FeatureSetReader(openFeatureSet(featureSet))
+    srcFeatureJSON=reader.readHeader()
     geomType=srcFeatureJSON["geometryType"]
-    srcFeatures=srcFeatureJSON["features"]
-    fieldsJSON=srcFeatureJSON["fields"]
 
     #set the projection to be web mercator?  want to create the return dataset in WGS84
-    sr = arcpy.SpatialReference()
-    sr.factoryCode = int(srcFeatureJSON["spatialReference"]["wkid"])
-    sr.create()
+    sr = getSpatialReferenceFromWKID(srcFeatureJSON["spatialReference"]["wkid"])
 
+    if name is None:
+        name=getUniqueName("drawingFC")
     drawingFC="IN_MEMORY/%s"%(name)
 
     #create dataset
     if arcpy.Exists(drawingFC):
         arcpy.Delete_management(drawingFC)
-    path,fcName=os.path.split(drawingFC)
-    arcpy.CreateFeatureclass_management(path,fcName, geomType.replace("esriGeometry",""),"","","",sr)
-
-    #add fields
-    fields=[]
-    for fieldJSON in fieldsJSON:              
-        fieldType=esriFieldTypesMap[fieldJSON["type"]]               
-        name=fieldJSON["name"]
-        alias=fieldJSON.get("alias",name)
-        fieldLength=""
-        fieldPrecision=""
-        fieldScale=""
-        if fieldJSON.has_key("length"):
-            fieldLength=int(fieldJSON["length"])
-
-        if not name in ("FID","OBJECTID"):
-            arcpy.AddField_management(drawingFC,name,fieldType,fieldPrecision,fieldScale,fieldLength,alias)
-            fields.append(name)
-                                   
-    rows=arcpy.InsertCursor(drawingFC)
-    ID=1
-    for feature in srcFeatures:
-        row=rows.newRow()
-        row.shape=getFeatureGeometry(geomType,feature["geometry"])
-        for name in fields:
-            row.setValue(name,feature["attributes"][name])
-        rows.insertRow(row)
-        ID+=1
-    del row,rows
+    fields=createFeatureClassSchema(drawingFC,geomType,sr,srcFeatureJSON["fields"])
+    insertFeatures(drawingFC,geomType,fields,reader.iterFeatures(),srcFeatureJSON.get("transform"))
 
     return drawingFC
-
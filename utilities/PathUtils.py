@@ -8,6 +8,8 @@ import json
 import os
 import re
 import logging
+import threading
+from multiprocessing.pool import ThreadPool
 from xml.etree.ElementTree import fromstring
 from zipfile import ZipFile
 
@@ -18,11 +20,53 @@ logger = logging.getLogger(__name__)
 
 DYNAMIC_DIR_RE = re.compile(r"\${\S+}")
 
+#Resolved layer paths for each service: serviceID => (versions of files used to resolve paths, layer paths)
+_servicePathsCache=dict()
+_servicePathsLock=threading.Lock()
+
 
 def get_scratch_GDB():
     return os.path.join(arcpy.env.scratchWorkspace, "scratch.gdb")
 
 
+def getDataSourceVersion(path):
+    """
+    Return version of a data source, based on modification time and size of the files behind it, or None if it cannot
+    be determined (e.g., data in an enterprise geodatabase).  Datasets within a file geodatabase are versioned by the
+    files of the geodatabase, so that any change to the geodatabase changes the version.  File based datasets include
+    their auxiliary files (e.g., .dbf of shapefiles, .aux.xml of rasters).
+
+    :param path: path to data source
+    """
+
+    if not os.path.exists(path):
+        #dataset within a file geodatabase (or a feature dataset within it)
+        path = os.path.dirname(path)
+        while path and not path.lower().endswith(".gdb"):
+            parent = os.path.dirname(path)
+            if parent == path:
+                return None
+            path = parent
+        if not path or not os.path.isdir(path):
+            return None
+
+    if os.path.isfile(path):
+        directory, fileName = os.path.split(path)
+        baseName = os.path.splitext(fileName)[0] + "."
+        filePaths = [os.path.join(directory, otherName) for otherName in os.listdir(directory)
+                     if otherName.startswith(baseName)]
+        modified = 0
+    else:
+        filePaths = [os.path.join(path, fileName) for fileName in os.listdir(path)]
+        modified = os.path.getmtime(path)
+    size = 0
+    for filePath in filePaths:
+        if os.path.isfile(filePath):
+            modified = max(modified, os.path.getmtime(filePath))
+            size += os.path.getsize(filePath)
+    return "%r:%i" % (modified, size)
+
+
 def extractLayerPathFromMSDLayerXML(msd,xmlPath):
     '''
     Extracts layer data source from layer XML files stored in MSD.
@@ -59,39 +103,81 @@ def extractLayerPathFromMSDLayerXML(msd,xmlPath):
     return layers
 
 
-def getDataPathsForService(serviceID):
+def _getServiceConfigFilename(serviceID):
     '''
-    Extract paths for data layers in map service..
+    Return path of JSON config file of map service
 
-    :param serviceID:
-    :return: return list of layers paths (or None for group layers); order in this list = layerID
+    :param serviceID: ID of map service, including folder (if any)
     '''
 
-    layers=[]
-
     servicePath=""
     if serviceID.count("/"):
         lastIndex=serviceID.rfind("/")
         servicePath=serviceID[:lastIndex]
         serviceID=serviceID[(lastIndex+1):]
 
+    return os.path.normpath(os.path.join(settings.ARCGIS_SVC_CONFIG_DIR, "services", servicePath,"%s.MapServer/%s.MapServer.json"%(serviceID,serviceID)))
+
+
+def _getFileVersions(paths):
+    return [(path,os.path.getmtime(path),os.path.getsize(path)) for path in paths]
+
+
+def getDataPathsForService(serviceID):
+    '''
+    Extract paths for data layers in map service.  Paths are cached, and resolved again if the config file of the
+    service or its MSD file have changed.
+
+    :param serviceID:
+    :return: return list of layers paths (or None for group layers); order in this list = layerID
+    '''
+
+    cached=_servicePathsCache.get(serviceID)
+    if cached is not None:
+        versions,layers=cached
+        try:
+            if _getFileVersions([version[0] for version in versions])==versions:
+                return list(layers)
+        except OSError:
+            pass #file was removed, resolve again
+
+    filePaths,layers=_resolveDataPathsForService(serviceID)
+    with _servicePathsLock:
+        _servicePathsCache[serviceID]=(_getFileVersions(filePaths),layers)
+    return list(layers)
+
+
+def _resolveDataPathsForService(serviceID):
+    '''
+    Extract paths for data layers in map service from its config file and MSD.
+
+    :param serviceID:
+    :return: tuple of (paths of files used to resolve layer paths, list of layer paths)
+    '''
+
+    layers=[]
+
     #json file contains pointer to MSD file
-    configJSONFilename=os.path.normpath(os.path.join(settings.ARCGIS_SVC_CONFIG_DIR, "services", servicePath,"%s.MapServer/%s.MapServer.json"%(serviceID,serviceID)))
+    configJSONFilename=_getServiceConfigFilename(serviceID)
     if not os.path.exists(configJSONFilename):
         raise ReferenceError("Map service config file not found: %s, make sure the service is published and serviceID is valid"%(configJSONFilename))
 
     configJSON=json.loads(open(configJSONFilename).read())
+    filePaths=[configJSONFilename]
 
     filePath = configJSON['properties']['filePath']
     if DYNAMIC_DIR_RE.search(filePath):
         # Real path is injected at runtime.  Ugh!
         # Attempt to determine from server config
-        dirConfig = json.loads(open(os.path.join(settings.ARCGIS_SVC_CONFIG_DIR, "serverdirs", "arcgisinput.json")).read())
+        dirConfigFilename = os.path.join(settings.ARCGIS_SVC_CONFIG_DIR, "serverdirs", "arcgisinput.json")
+        dirConfig = json.loads(open(dirConfigFilename).read())
+        filePaths.append(dirConfigFilename)
         dataRootDir = dirConfig['physicalPath']
         filePath = filePath.replace(DYNAMIC_DIR_RE.search(filePath).group(), dataRootDir)
 
 
     msdPath=os.path.normpath(filePath)
+    filePaths.append(msdPath)
     msd=ZipFile(msdPath)
     #doc info file contains pointer to layers XML file
     layersXMLPath=fromstring(msd.open("DocumentInfo.xml").read()).findtext("ActiveMapRepositoryPath").replace("CIMPATH=","")
@@ -99,4 +185,42 @@ def getDataPathsForService(serviceID):
     layers.pop(0) #remove the root node for the map document
     msd.close()
 
-    return layers
+    return filePaths,layers
+
+
+def prewarmServicePaths(workers=8):
+    '''
+    Resolve and cache the data paths of all map services found in ARCGIS_SVC_CONFIG_DIR, using a pool of threads.
+    Services that cannot be resolved are logged and skipped.
+
+    :param workers: number of threads
+    :return: number of services resolved
+    '''
+
+    servicesDir=os.path.join(settings.ARCGIS_SVC_CONFIG_DIR, "services")
+    serviceIDs=[]
+    for dirPath,dirNames,fileNames in os.walk(servicesDir):
+        for dirName in dirNames:
+            if dirName.endswith(".MapServer"):
+                folder=os.path.relpath(dirPath,servicesDir).replace(os.sep,"/")
+                serviceID=dirName[:-len(".MapServer")]
+                serviceIDs.append(serviceID if folder=="." else "%s/%s"%(folder,serviceID))
+        #no need to scan within map service directories
+        dirNames[:]=[dirName for dirName in dirNames if not dirName.endswith(".MapServer")]
+
+    def resolve(serviceID):
+        try:
+            getDataPathsForService(serviceID)
+            return True
+        except Exception as ex:
+            logger.warning("Could not resolve data paths for service %s: %s"%(serviceID,ex))
+            return False
+
+    pool=ThreadPool(max(1,min(workers,len(serviceIDs))))
+    try:
+        numResolved=sum(pool.map(resolve,serviceIDs))
+    finally:
+        pool.close()
+        pool.join()
+    logger.debug("Resolved data paths for %i of %i map services"%(numResolved,len(serviceIDs)))
+    return numResolved
@@ -4,12 +4,203 @@ General utilities for helping deal with projection related information
 
 import re
 import os
+import math
+import hashlib
+import logging
+from collections import OrderedDict
 import arcpy
+import numpy
 from tool_exceptions import GPToolError
+from utilities.scratch import getUniqueName
+from utilities import projection_engine
+
+logger = logging.getLogger(__name__)
 
 # Names of projections that can be used for area calculations
 VALID_AREA_PROJECTION_NAMES = ("Albers", "Transverse_Mercator", "Lambert_Azimuthal_Equal_Area")
 
+# Number of points along each edge of an extent when projecting it, so that curved edges are bounded
+EXTENT_DENSIFY_POINTS = 33
+
+# Maximum number of projected extents remembered by projectExtent
+EXTENT_CACHE_SIZE = 1024
+
+# Well-known text of custom Albers projections, with central meridian and standard parallels to be filled in
+CUSTOM_ALBERS_WKT = u"PROJCS['Custom_Albers_WGS84',GEOGCS['GCS_WGS_1984',DATUM['D_WGS_1984',SPHEROID['WGS_1984',6378137.0,298.257223563]],PRIMEM['Greenwich',0.0],UNIT['Degree',0.0174532925199433]],PROJECTION['Albers'],PARAMETER['False_Easting',0.0],PARAMETER['False_Northing',0.0],PARAMETER['Central_Meridian',%s],PARAMETER['Standard_Parallel_1',%s],PARAMETER['Standard_Parallel_2',%s],PARAMETER['Latitude_Of_Origin',0.0],UNIT['Meter',1.0]];-22505900 -5535700 200107510.802523;-100000 10000;-100000 10000;0.001;0.001;0.001;IsHighPrecision"
+
+# Maximum number of spatial reference objects whose keys are remembered by identity
+SPATIAL_REFERENCE_IDENTITY_CACHE_SIZE = 256
+
+_projectedExtents = OrderedDict()
+
+
+class SpatialReferenceRegistry(object):
+    """
+    Process-wide registry of spatial references and their derived properties (WKT, GCS, unit factors, geographic
+    transformations and in-memory transformers), so that each is derived once per spatial reference (or pair of spatial
+    references) instead of on every call.
+
+    Spatial references are identified by WKID (factory code), or by a fingerprint (SHA-1) of their WKT if they do not
+    have one.  The first spatial reference object registered for each key is interned, and returned for that key
+    thereafter; interned objects are shared, and must not be modified.  Keys of recently used objects are also
+    remembered by identity, so spatial reference objects should not be modified once they have been used.
+    """
+
+    def __init__(self):
+        self._spatialReferences=dict()
+        #id of object -> (object, key); holding the object ensures its id is not reused while it is in the cache
+        self._identityKeys=OrderedDict()
+        self._wkts=dict()
+        self._wktKeys=dict()
+        self._gcs=dict()
+        self._unitFactors=dict()
+        self._geoTransforms=dict()
+        self._transformers=dict()
+
+    def getKey(self,spatialReference):
+        """
+        Return key of spatial reference, registering it if necessary
+
+        :param spatialReference: ArcGIS spatial reference object
+        """
+
+        identity=self._identityKeys.get(id(spatialReference))
+        if identity is not None:
+            return identity[1]
+
+        factoryCode=spatialReference.factoryCode
+        if factoryCode:
+            key="wkid:%i"%(factoryCode)
+        else:
+            wkt=spatialReference.exportToString()
+            key=self._wktKeys.get(wkt)
+            if key is None:
+                key="wkt:%s"%(hashlib.sha1(wkt.encode("utf-8")).hexdigest())
+                self._wktKeys[wkt]=key
+                self._wkts[key]=wkt
+        if not self._spatialReferences.has_key(key):
+            self._spatialReferences[key]=spatialReference
+        if len(self._identityKeys)>=SPATIAL_REFERENCE_IDENTITY_CACHE_SIZE:
+            self._identityKeys.popitem(last=False)
+        self._identityKeys[id(spatialReference)]=(spatialReference,key)
+        return key
+
+    def getSpatialReference(self,spatialReference):
+        """
+        Return the interned spatial reference object equivalent to spatialReference
+        """
+
+        return self._spatialReferences[self.getKey(spatialReference)]
+
+    def fromWKID(self,WKID):
+        """
+        Return interned spatial reference object for WKID
+
+        :param WKID: ESRI Well Known ID
+        """
+
+        key="wkid:%i"%(int(WKID))
+        if not self._spatialReferences.has_key(key):
+            spatialReference=arcpy.SpatialReference()
+            spatialReference.factoryCode=int(WKID)
+            spatialReference.create()
+            self._spatialReferences[key]=spatialReference
+        return self._spatialReferences[key]
+
+    def fromWKT(self,wkt):
+        """
+        Return interned spatial reference object for well-known text
+
+        :param wkt: well-known text, as exported by exportToString
+        """
+
+        key=self._wktKeys.get(wkt)
+        if key is None:
+            spatialReference=arcpy.SpatialReference()
+            spatialReference.loadFromString(wkt)
+            key=self.getKey(spatialReference)
+            self._wktKeys[wkt]=key
+        return self._spatialReferences[key]
+
+    def getWKT(self,spatialReference):
+        """
+        Return well-known text of spatial reference
+        """
+
+        key=self.getKey(spatialReference)
+        if not self._wkts.has_key(key):
+            self._wkts[key]=self._spatialReferences[key].exportToString()
+        return self._wkts[key]
+
+    def getGCS(self,spatialReference):
+        key=self.getKey(spatialReference)
+        if not self._gcs.has_key(key):
+            self._gcs[key]=_parseGCS(self.getWKT(spatialReference))
+        return self._gcs[key]
+
+    def getUnitFactors(self,spatialReference):
+        key=self.getKey(spatialReference)
+        if not self._unitFactors.has_key(key):
+            self._unitFactors[key]=_getUnitFactors(self._spatialReferences[key].linearUnitName)
+        return self._unitFactors[key]
+
+    def getGeoTransform(self,srcSR,targetSR):
+        key=(self.getKey(srcSR),self.getKey(targetSR))
+        if not self._geoTransforms.has_key(key):
+            self._geoTransforms[key]=_findGeoTransform(srcSR,targetSR)
+        return self._geoTransforms[key]
+
+    def getTransformer(self,srcSR,targetSR):
+        key=(self.getKey(srcSR),self.getKey(targetSR))
+        if not self._transformers.has_key(key):
+            self._transformers[key]=projection_engine.getTransformer(self._spatialReferences[key[0]],
+                                                                     self._spatialReferences[key[1]])
+        return self._transformers[key]
+
+
+_registry=SpatialReferenceRegistry()
+
+
+def getSpatialReferenceRegistry():
+    """
+    Return the spatial reference registry of this process
+    """
+
+    return _registry
+
+
+def getSpatialReferenceKey(spatialReference):
+    """
+    Return a key that identifies the spatial reference (WKID, or fingerprint of WKT)
+
+    :param spatialReference: ArcGIS spatial reference object
+    """
+
+    return _registry.getKey(spatialReference)
+
+
+def getSpatialReferenceFromWKT(wkt):
+    """
+    Returns a (shared) spatial reference object for well-known text
+
+    :param wkt: well-known text, as exported by exportToString
+    :return: spatial reference object
+    """
+
+    return _registry.fromWKT(wkt)
+
+
+def getTransformer(srcSR,targetSR):
+    """
+    Return projection_engine Transformer to project coordinates between spatial references in memory, or None if they
+    must be projected by arcpy
+
+    :param srcSR: source ArcGIS spatial reference object
+    :param targetSR: target ArcGIS spatial reference object
+    """
+
+    return _registry.getTransformer(srcSR,targetSR)
+
 
 def getGCS(spatialReference):
     """
@@ -17,7 +208,11 @@ def getGCS(spatialReference):
 
     :param spatialReference: ArcGIS spatial reference object
     """
-    wkt=spatialReference.exportToString()
+
+    return _registry.getGCS(spatialReference)
+
+
+def _parseGCS(wkt):
     gcsMatch=re.search("(?<=GEOGCS\[').*?(?=')",wkt)
     if not gcsMatch:
         raise GPToolError("GCS_NOT_SUPPORTED: valid GCS not found in WKT: %s"%(wkt))
@@ -34,11 +229,14 @@ def getProjUnitFactors(spatialReference):
     .. note:: Limited to projections based on Meter and Foot_US
     """
 
+    return _registry.getUnitFactors(spatialReference)
+
+
+def _getUnitFactors(unit):
     factors={
         "Meter":[0.001,0.0001,1],
         "Foot_US": [0.0003048,0.00003048,0.3048]
     }
-    unit=spatialReference.linearUnitName
     if not factors.has_key(unit):
         raise GPToolError("UNITS_NOT_SUPPORTED: units not implemented for %s"%(unit))
     return factors[unit]
@@ -94,6 +292,10 @@ def getGeoTransform(srcSR,targetSR):
     .. note:: limited to the geographic coordinate systems supported by getWGS84GeoTransform
     """
 
+    return _registry.getGeoTransform(srcSR,targetSR)
+
+
+def _findGeoTransform(srcSR,targetSR):
     if srcSR.factoryCode and srcSR.factoryCode==targetSR.factoryCode:
         return ""
 
@@ -117,58 +319,177 @@ def getGeoTransform(srcSR,targetSR):
 
 def projectExtent(extent,srcSR,targetSR):
     """
-    Project the extent to the target spatial reference, and return the projected extent.  Creates a temporary feature
-    class based on bounding box of source.
+    Project the extent to the target spatial reference, and return the projected extent.  Edges of the extent are
+    densified to EXTENT_DENSIFY_POINTS points each, since edges are curved in many projections, and the points are
+    projected in memory (see projection_engine; arcpy geometry is used if a geographic transformation is required).
+    Projected extents are remembered for the most recent EXTENT_CACHE_SIZE combinations of extent and spatial
+    references.
 
     :param extent: source extent
     :param srcSR: source ArcGIS spatial reference object
     :param targetSR: target ArcGIS spatial reference object
     """
 
-    array=arcpy.Array()
-    array.add(arcpy.Point(extent.XMin,extent.YMin))
-    array.add(arcpy.Point(extent.XMin,extent.YMax))
-    array.add(arcpy.Point(extent.XMax,extent.YMin))
-    array.add(arcpy.Point(extent.XMax,extent.YMax))
-    fc=arcpy.Multipoint(array,srcSR)
-    projFC=arcpy.Project_management(fc, os.path.join(arcpy.env.scratchWorkspace, "scratch.gdb","tempProj"),
-                                    targetSR,getGeoTransform(srcSR,targetSR),srcSR).getOutput(0)
-    extent = arcpy.mapping.Layer(projFC).getExtent()
-    arcpy.Delete_management(projFC)
-    return extent
+    key=(extent.XMin,extent.YMin,extent.XMax,extent.YMax,getSpatialReferenceKey(srcSR),getSpatialReferenceKey(targetSR))
+    bounds=_projectedExtents.pop(key,None)
+    if bounds is None:
+        bounds=_projectExtentBounds(extent,srcSR,targetSR)
+        if len(_projectedExtents)>=EXTENT_CACHE_SIZE:
+            _projectedExtents.popitem(last=False)
+    #most recently used last
+    _projectedExtents[key]=bounds
+    return arcpy.Extent(*bounds)
 
 
-def createCustomAlbers(extent):
+def getDensifiedExtentEdges(extent,points=EXTENT_DENSIFY_POINTS):
     """
-    Given an extent in geographic coordinates, create a custom Albers projection centered over the extent that minimizes
-    area distortions.  Uses 1/6 inset from YMin and YMax to define latitude bounds, and centerline between XMin and XMax
-    to define central meridian.
+    Return arrays of x and y coordinates of points along the edges of an extent, including its corners
+
+    :param extent: extent
+    :param points: number of points along each edge
+    """
+
+    xs=numpy.linspace(extent.XMin,extent.XMax,points)
+    ys=numpy.linspace(extent.YMin,extent.YMax,points)
+    x=numpy.concatenate((xs,xs,numpy.repeat(extent.XMin,points),numpy.repeat(extent.XMax,points)))
+    y=numpy.concatenate((numpy.repeat(extent.YMin,points),numpy.repeat(extent.YMax,points),ys,ys))
+    return x,y
+
+
+def _projectExtentBounds(extent,srcSR,targetSR):
+    """
+    Return bounds (xMin, yMin, xMax, yMax) of the densified edges of extent, in the target spatial reference
+    """
+
+    x,y=getDensifiedExtentEdges(extent)
+    transformer=getTransformer(srcSR,targetSR)
+    if transformer is not None:
+        x,y=transformer.transform(x,y)
+        return float(x.min()),float(y.min()),float(x.max()),float(y.max())
+
+    geoTransform=getGeoTransform(srcSR,targetSR)
+    fc=arcpy.Multipoint(arcpy.Array([arcpy.Point(float(px),float(py)) for px,py in zip(x,y)]),srcSR)
+    if ";" not in geoTransform:
+        if geoTransform:
+            projExtent=fc.projectAs(targetSR,geoTransform).extent
+        else:
+            projExtent=fc.projectAs(targetSR).extent
+    else:
+        #chained geographic transformations are only supported by the geoprocessing tool
+        projFC=arcpy.Project_management(fc, os.path.join(arcpy.env.scratchWorkspace, "scratch.gdb",getUniqueName("tempProj")),
+                                        targetSR,geoTransform,srcSR).getOutput(0)
+        projExtent=arcpy.mapping.Layer(projFC).getExtent()
+        arcpy.Delete_management(projFC)
+    return projExtent.XMin,projExtent.YMin,projExtent.XMax,projExtent.YMax
+
+
+def getCustomAlbersWKT(centralMeridian,lat1,lat2):
+    """
+    Return well-known text of custom Albers projection (WGS 1984)
+
+    :param centralMeridian: central meridian, in degrees
+    :param lat1: first standard parallel, in degrees
+    :param lat2: second standard parallel, in degrees
+    """
+
+    return CUSTOM_ALBERS_WKT%(repr(float(centralMeridian)),repr(float(lat1)),repr(float(lat2)))
+
+
+def getAlbersScaleError(wkt,yMin,yMax):
+    """
+    Return the maximum scale error (e.g., 0.01 for 1%) of an Albers projection between two latitudes, in either
+    direction.  Areas are preserved everywhere; this is the distortion of distances and shapes.  Not finite if the
+    standard parallels are symmetric about the equator.
+
+    :param wkt: well-known text of Albers projection
+    :param yMin: minimum latitude, in degrees
+    :param yMax: maximum latitude, in degrees
+    """
+
+    latitudes=numpy.radians(numpy.linspace(yMin,yMax,EXTENT_DENSIFY_POINTS))
+    with numpy.errstate(divide="ignore",invalid="ignore"):
+        albers=projection_engine.getCoordinateSystem(wkt)
+        scaleFactors=albers.getScaleFactors(latitudes)
+    return float(numpy.maximum(scaleFactors,1.0/scaleFactors).max()-1)
+
+
+def getCustomAlbersParameters(extent,snapDegrees=None,maxScaleError=None):
+    """
+    Return central meridian and standard parallels of a custom Albers projection centered over the extent.  Uses 1/6
+    inset from YMin and YMax to define latitude bounds, and centerline between XMin and XMax to define central meridian,
+    rounded to 0.1 degree.
+
+    If snapDegrees is provided, parameters are snapped to multiples of snapDegrees instead (standard parallels outward),
+    so that nearby extents share the same projection.  Standard parallels symmetric about the equator (which define a
+    degenerate cone) are avoided by moving one of them a further step away from the equator.  Snapped parameters are
+    only used if their scale error within the extent (see getAlbersScaleError) exceeds that of the unsnapped parameters
+    by at most maxScaleError.
 
     :param extent: extent in geographic coordinates
-    :return: custom Albers spatial reference
+    :param snapDegrees: optional grid to snap parameters to, in degrees
+    :param maxScaleError: maximum additional scale error of snapped parameters
+    :return: tuple of central meridian, first and second standard parallels, in degrees
     """
 
-    spatialReference=arcpy.SpatialReference()
     centralMeridian=((extent.XMax-extent.XMin)/2.0) + extent.XMin
     inset=(extent.YMax - extent.YMin) / 6.0
     lat1=extent.YMin + inset
     lat2=extent.YMax - inset
     assert centralMeridian>-180 and centralMeridian<180 and lat1>-90 and lat1<90 and lat2>-90 and lat2<90
-    spatialReference.loadFromString(u"PROJCS['Custom_Albers_WGS84',GEOGCS['GCS_WGS_1984',DATUM['D_WGS_1984',SPHEROID['WGS_1984',6378137.0,298.257223563]],PRIMEM['Greenwich',0.0],UNIT['Degree',0.0174532925199433]],PROJECTION['Albers'],PARAMETER['False_Easting',0.0],PARAMETER['False_Northing',0.0],PARAMETER['Central_Meridian',%.1f],PARAMETER['Standard_Parallel_1',%.1f],PARAMETER['Standard_Parallel_2',%.1f],PARAMETER['Latitude_Of_Origin',0.0],UNIT['Meter',1.0]];-22505900 -5535700 200107510.802523;-100000 10000;-100000 10000;0.001;0.001;0.001;IsHighPrecision"%(centralMeridian,lat1,lat2))
-    return spatialReference
+    parameters=(round(centralMeridian,1),round(lat1,1),round(lat2,1))
+    if not snapDegrees:
+        return parameters
+
+    snappedLat1=math.floor(min(lat1,lat2)/snapDegrees)*snapDegrees
+    snappedLat2=math.ceil(max(lat1,lat2)/snapDegrees)*snapDegrees
+    if snappedLat1==snappedLat2:
+        snappedLat2+=snapDegrees
+    if snappedLat1==-snappedLat2:
+        if extent.YMin+extent.YMax<0:
+            snappedLat1-=snapDegrees
+        else:
+            snappedLat2+=snapDegrees
+    snapped=(round(centralMeridian/snapDegrees)*snapDegrees,snappedLat1,snappedLat2)
+    if not (-180<snapped[0]<180 and -90<snapped[1]<90 and -90<snapped[2]<90):
+        return parameters
+
+    if maxScaleError is not None:
+        scaleError=getAlbersScaleError(getCustomAlbersWKT(*snapped),extent.YMin,extent.YMax)
+        unsnappedError=getAlbersScaleError(getCustomAlbersWKT(*parameters),extent.YMin,extent.YMax)
+        if not numpy.isfinite(scaleError) or scaleError-unsnappedError>maxScaleError:
+            logger.debug("Scale error of snapped custom Albers parameters %s is %.4f (%.4f unsnapped), using %s"%(
+                snapped,scaleError,unsnappedError,parameters))
+            return parameters
+    return snapped
+
+
+def createCustomAlbers(extent,snapDegrees=None,maxScaleError=None):
+    """
+    Given an extent in geographic coordinates, create a custom Albers projection centered over the extent that minimizes
+    area distortions (see getCustomAlbersParameters).
+
+    The spatial reference is shared through the spatial reference registry, so requests with the same parameters (e.g.,
+    snapped parameters of nearby extents) get the same object, and getSpatialReferenceKey can be used as a stable cache
+    key for data projected to it.
+
+    :param extent: extent in geographic coordinates
+    :param snapDegrees: optional grid to snap parameters to, in degrees
+    :param maxScaleError: maximum scale error of snapped parameters
+    :return: custom Albers spatial reference
+    """
+
+    return getSpatialReferenceFromWKT(getCustomAlbersWKT(*getCustomAlbersParameters(extent,snapDegrees,maxScaleError)))
 
 
 def getSpatialReferenceFromWKID(WKID):
     """
-    Returns a spatial reference object for WKID
+    Returns a (shared) spatial reference object for WKID
 
     :param WKID: ESRI Well Known ID
     :return: spatial reference object
     """
-    spatialReference=arcpy.SpatialReference()
-    spatialReference.factoryCode=4326
-    spatialReference.create()
-    return spatialReference
+
+    return _registry.fromWKID(WKID)
 
 
 def isValidAreaProjection(spatialReference):
@@ -0,0 +1,132 @@
+"""
+Decomposition of the cells of a grid (pixels, or blocks of pixels) into cells entirely inside the area of interest,
+cells on its boundary, and cells entirely outside it.
+
+No edge of the area of interest passes through cells that are not on the boundary, so the winding number of the area of
+interest is the same everywhere within them: they are either entirely inside (covered by one or more polygons) or
+entirely outside.  Only boundary cells need the exact area or length of the area of interest within them, which is the
+expensive part of the precise method; cells entirely inside are counted at the full area of the cell.
+"""
+
+import logging
+
+import numpy
+
+from utilities.pixel_coverage import getEdgeMask, getPolygonWinding, getPolygonEdgeCoverage, getLineCoverage
+from utilities.tally import tallyValues, sumByValue
+
+
+logger = logging.getLogger(__name__)
+
+
+class AOIDecomposition(object):
+    """
+    Cells of a grid classified against the area of interest:
+
+    * inside: boolean array of cells entirely within polygons of the area of interest
+    * boundary: boolean array of cells that contain part of an edge of the area of interest (all cells crossed by lines)
+
+    Cells that are in neither are entirely outside the area of interest.
+    """
+
+    def __init__(self, parts, grid, geometryType):
+        """
+        :param parts: list of arrays of x, y coordinates of each ring or path, in spatial reference of grid
+        :param grid: GridTransform of grid
+        :param geometryType: Polygon or Polyline
+        """
+
+        self.parts = parts
+        self.grid = grid
+        self.geometryType = geometryType
+        if geometryType == "Polygon":
+            self._winding = numpy.abs(getPolygonWinding(parts, grid))
+            self.boundary = getEdgeMask(parts, grid, closeRings=True)
+            self.inside = (self._winding != 0) & ~self.boundary
+        elif geometryType == "Polyline":
+            self._winding = None
+            self.boundary = getEdgeMask(parts, grid)
+            self.inside = numpy.zeros(grid.shape, dtype=bool)
+        else:
+            raise ValueError("GEOMETRY_TYPE_NOT_SUPPORTED: decomposition is not supported for geometry type %s" %
+                             (geometryType))
+        logger.debug("%i cells inside and %i cells on boundary of area of interest" %
+                     (self.inside.sum(), self.boundary.sum()))
+
+    def getFullCells(self):
+        """
+        Return boolean array of cells entirely within a single polygon, which are covered by the full area of the cell
+        """
+
+        if self._winding is None:
+            return self.inside
+        return self.inside & (self._winding == 1)
+
+    def getCoverage(self, boundaryCoverage=None):
+        """
+        Return the area (polygons) or length (polylines) of the area of interest within each cell, in units of the
+        spatial reference of grid.  Cells inside polygons are given the area of the cell (times the number of
+        overlapping polygons); only boundary cells are calculated exactly.
+
+        :param boundaryCoverage: optional array of grid.shape with the area or length within boundary cells, calculated
+            by another method (e.g., intersecting with a fishnet); values of other cells are ignored.  Calculated in
+            memory if not provided.
+        :return: array of grid.shape
+        """
+
+        if self.geometryType == "Polyline":
+            if boundaryCoverage is None:
+                return getLineCoverage(self.parts, self.grid)
+            return numpy.where(self.boundary, boundaryCoverage, 0)
+
+        coverage = self._winding * self.grid.cellArea
+        if boundaryCoverage is None:
+            rows, cols, edgeCoverage = getPolygonEdgeCoverage(self.parts, self.grid)
+            coverage[rows, cols] = edgeCoverage * self.grid.cellArea
+        else:
+            coverage[self.boundary] = boundaryCoverage[self.boundary]
+        return coverage
+
+    def tallyValues(self, values, quantities):
+        """
+        Tally the number of cells and sum of quantities for each unique value.  Cells entirely within a single polygon
+        are tallied without weights, at the quantity of a full cell; only the remaining cells are weighted by their
+        quantities.
+
+        :param values: array of grid.shape of cell values (may be a masked array, masked values are excluded)
+        :param quantities: array of grid.shape of quantities within each cell, from getCoverage (may be converted to
+            other units)
+        :return: tuple of (unique values, counts, sum of quantities) arrays, sorted by value
+        """
+
+        full = self.getFullCells()
+        if not full.any():
+            return tallyValues(values, quantities)
+
+        fullQuantity = float(quantities.flat[full.argmax()])
+        fullValues, fullCounts = tallyValues(values[full])[:2]
+        partial = ~full
+        partialValues, partialCounts, partialQuantities = tallyValues(values[partial], quantities[partial])
+        return sumByValue(numpy.concatenate((fullValues, partialValues)),
+                          numpy.concatenate((fullCounts, partialCounts)),
+                          numpy.concatenate((fullCounts * fullQuantity, partialQuantities)))
+
+    def tallyClasses(self, classBinner, values, quantities):
+        """
+        Tally the number of cells and sum of quantities within each class, in the same way as tallyValues.
+
+        :param classBinner: ClassBinner of classes
+        :param values: array of grid.shape of cell values (may be a masked array, masked values are excluded)
+        :param quantities: array of grid.shape of quantities within each cell, from getCoverage
+        :return: tuple of (counts, sum of quantities) arrays with an entry for each class
+        """
+
+        full = self.getFullCells()
+        if not full.any():
+            return classBinner.tally(values, quantities)
+
+        fullQuantity = float(quantities.flat[full.argmax()])
+        fullCounts = classBinner.tally(values[full])[0]
+        partial = ~full
+        partialCounts, partialQuantities = classBinner.tally(values[partial], quantities[partial])
+        return fullCounts + partialCounts, fullCounts * fullQuantity + partialQuantities
@@ -1,13 +1,37 @@
 import arcpy
 import os
+import json
+import hashlib
 import logging
+import numpy
 from utilities import ProjectionUtilities
+from utilities.projection_engine import getPartsExtent
 from utilities.PathUtils import get_scratch_GDB
 
 
 logger = logging.getLogger(__name__)
 
 
+def getPartsQuantity(parts, geometryType):
+    """
+    Return the total area (polygons) or length (polylines) of parts, in units of their coordinates
+
+    :param parts: list of arrays of x, y coordinates of each ring or path; outer rings in clockwise order
+    :param geometryType: Polygon or Polyline
+    """
+
+    total = 0.0
+    for part in parts:
+        x = part[:, 0]
+        y = part[:, 1]
+        if geometryType == "Polygon":
+            #shoelace formula; clockwise outer rings are negative, counter-clockwise inner rings positive
+            total -= (numpy.dot(x, numpy.roll(y, -1)) - numpy.dot(numpy.roll(x, -1), y)) / 2.0
+        else:
+            total += numpy.hypot(numpy.diff(x), numpy.diff(y)).sum()
+    return float(total)
+
+
 class FeatureClassWrapper:
     """
     convenience class to provide cached access to descriptive properties and projected variants of feature class
@@ -24,6 +48,23 @@ class FeatureClassWrapper:
         self._prjLUT = dict()
         self._prjCache = dict()
         self._extentPrjCache = dict()
+        self._partsPrjCache = dict()
+        self._geometryHash = None
+
+    def __getstate__(self):
+        """
+        Return state for pickling (e.g., to pass to worker processes), excluding arcpy objects which cannot be pickled.
+        Feature class and its projected variants must not be in IN_MEMORY workspace.
+        """
+
+        state = self.__dict__.copy()
+        state["_info"] = None
+        state["_spatialReference"] = None
+        state["_extentPrjCache"] = dict()
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
 
     def getCount(self):
         if self._numFeatures is None:
@@ -51,6 +92,10 @@ class FeatureClassWrapper:
             if self._prjCache.has_key(projectionKey):
                 #use previously projected version
                 self._extentPrjCache[projKey] = arcpy.mapping.Layer(self._prjCache[projectionKey]).getExtent()
+            elif projectFeaturesFirst and self._getTransformer(targetSpatialReference) is not None:
+                #bounds of the vertices, projected in memory
+                self._extentPrjCache[projKey] = arcpy.Extent(
+                    *getPartsExtent(self.getGeometryParts(targetSpatialReference)))
             elif projectFeaturesFirst:
                 self.project(targetSpatialReference)
                 self._extentPrjCache[projKey] = arcpy.mapping.Layer(self._prjCache[projectionKey]).getExtent()
@@ -67,13 +112,19 @@ class FeatureClassWrapper:
         return self._info
 
     def _getProjID(self, spatialReference):
-        key = spatialReference.factoryCode
-        if not key:
-            key = "hash%s" % (hash(spatialReference.exportToString()))
+        key = ProjectionUtilities.getSpatialReferenceKey(spatialReference)
         if not self._prjLUT.has_key(key):
             self._prjLUT[key] = len(self._prjLUT.keys())
         return self._prjLUT[key]
 
+    def _getTransformer(self, targetSpatialReference):
+        """
+        Return Transformer to project coordinates to target spatial reference in memory, or None if they must be
+        projected by arcpy
+        """
+
+        return ProjectionUtilities.getTransformer(self.getSpatialReference(), targetSpatialReference)
+
     def project(self, targetSpatialReference):
         projKey = "%s_%s" % (self.name, self._getProjID(targetSpatialReference))
 
@@ -104,6 +155,72 @@ class FeatureClassWrapper:
                                                                geoTransform).getOutput(0)
         return self._prjCache[projKey]
 
+    def delete(self):
+        """
+        Delete the feature class and the projected variants created by this wrapper (e.g., once a request is complete)
+        """
+
+        for path in set(self._prjCache.values() + [self.featureClass]):
+            if arcpy.Exists(path):
+                arcpy.Delete_management(path)
+        self._prjCache = dict()
+        self._extentPrjCache = dict()
+        self._partsPrjCache = dict()
+
+    def getGeometryParts(self, targetSpatialReference=None):
+        """
+        Return the rings (polygons), paths (polylines), or points (points, multipoints) of all features as a list of
+        numpy arrays of x, y coordinates, in the target projection.  Inner rings are returned as separate rings, in ESRI
+        (counter-clockwise) orientation.
+
+        Coordinates are projected in memory where possible (see projection_engine), otherwise features are projected by
+        arcpy first.
+        """
+
+        if targetSpatialReference is None:
+            targetSpatialReference = self.getSpatialReference()
+        projKey = self._getProjID(targetSpatialReference)
+        nativeKey = self._getProjID(self.getSpatialReference())
+        if not self._partsPrjCache.has_key(projKey) and projKey != nativeKey:
+            transformer = self._getTransformer(targetSpatialReference)
+            if transformer is not None:
+                logger.debug("Projecting coordinates of %s to %s in memory" % (self.name, targetSpatialReference.name))
+                self._partsPrjCache[projKey] = [transformer.transformPart(part) for part in self.getGeometryParts()]
+        if not self._partsPrjCache.has_key(projKey):
+            partsKey = "paths" if self.getGeometryType() == "Polyline" else "rings"
+            parts = []
+            rows = arcpy.da.SearchCursor(self.project(targetSpatialReference), ["SHAPE@JSON"])
+            for row in rows:
+                #JSON representation is parsed natively, much faster than iterating over arcpy.Point objects
+                geometry = json.loads(row[0])
+                if geometry.get("x") not in (None, "NaN"):
+                    parts.append(numpy.array([[geometry["x"], geometry["y"]]], dtype=numpy.float64))
+                elif geometry.get("points"):
+                    parts.append(numpy.array(geometry["points"], dtype=numpy.float64)[:, :2])
+                else:
+                    for part in geometry.get(partsKey, []):
+                        parts.append(numpy.array(part, dtype=numpy.float64)[:, :2])
+            del rows
+            self._partsPrjCache[projKey] = parts
+        return self._partsPrjCache[projKey]
+
+    def getGeometryHash(self):
+        """
+        Return a hash of the geometry type, spatial reference, and coordinates of all features, which identifies the
+        geometry regardless of the name or location of the feature class
+        """
+
+        if self._geometryHash is None:
+            digest = hashlib.sha1()
+            digest.update(self.getGeometryType())
+            digest.update(ProjectionUtilities.getSpatialReferenceRegistry().getWKT(
+                self.getSpatialReference()).encode("utf-8"))
+            for part in self.getGeometryParts():
+                digest.update(str(len(part)))
+                digest.update(numpy.ascontiguousarray(part, dtype=numpy.float64).tostring())
+            self._geometryHash = digest.hexdigest()
+        return self._geometryHash
+
     def getQuantityAttribute(self):
         if self.getGeometryType() == "Polyline":
             return "length"
@@ -130,6 +247,9 @@ class FeatureClassWrapper:
             return None
         if not targetSpatialReference:
             targetSpatialReference = self.getSpatialReference()
+        if self._getTransformer(targetSpatialReference) is not None:
+            return getPartsQuantity(self.getGeometryParts(targetSpatialReference), self.getGeometryType()) * \
+                self.getGeometryConversionFactor(targetSpatialReference)
         projFC = self.project(targetSpatialReference)
         quantityAttribute = self.getQuantityAttribute()
         rows = arcpy.SearchCursor(projFC)
@@ -0,0 +1,280 @@
+"""
+Incremental reader of featureset JSON (ArcGIS REST FeatureSet), which parses the properties of a featureset and then one
+feature at a time, and conversion of feature geometries into numpy arrays of coordinates.  Featuresets may be plain JSON,
+JSON with quantized coordinates, or gzip-compressed JSON (see openFeatureSet).
+"""
+
+
+import json,base64,gzip
+from cStringIO import StringIO
+import numpy
+
+
+
+################# Globals ###########################
+#number of characters read at a time from a featureset file (see FeatureSetReader)
+FEATURE_SET_READ_SIZE=1048576
+
+#first bytes of gzip-compressed data
+GZIP_MAGIC="\x1f\x8b"
+
+#keys of the coordinates of each geometry type in featureset JSON
+geometryPartsKeys=dict()
+geometryPartsKeys["esriGeometryMultipoint"]="points"
+geometryPartsKeys["esriGeometryPolyline"]="paths"
+geometryPartsKeys["esriGeometryPolygon"]="rings"
+
+
+
+def _toCoordinateArray(coordinates):
+    """
+    Convert a list of coordinates ([x, y], [x, y, z], ...) to an array of x, y coordinates
+    """
+
+    if not coordinates:
+        return numpy.zeros((0,2),dtype=numpy.float64)
+    return numpy.array(coordinates,dtype=numpy.float64).reshape(len(coordinates),-1)[:,:2]
+
+
+def _dequantize(coordinates,transform,deltaEncoded=True):
+    """
+    Convert quantized coordinates to coordinates in the spatial reference of featureset.
+
+    :param coordinates: array of x, y quantized coordinates
+    :param transform: transform of quantized featureset JSON (originPosition, scale, translate)
+    :param deltaEncoded: True if each coordinate after the first is the difference from the previous coordinate
+    """
+
+    if deltaEncoded:
+        coordinates=numpy.cumsum(coordinates,axis=0)
+    xScale,yScale=transform["scale"][:2]
+    xTranslate,yTranslate=transform["translate"][:2]
+    if transform.get("originPosition","upperLeft")=="upperLeft":
+        yScale=-yScale
+    coordinates[:,0]=coordinates[:,0]*xScale+xTranslate
+    coordinates[:,1]=coordinates[:,1]*yScale+yTranslate
+    return coordinates
+
+
+def getFeatureParts(geomType,geometry,transform=None):
+    """
+    Extract the coordinates of a geometry from featureset JSON into numpy arrays (z and m values are dropped).
+
+    :param geomType: ArcGIS JSON geometry type: esriGeometryPoint, esriGeometryMultipoint, esriGeometryPolyline, esriGeometryPolygon
+    :param geometry: the geometry object extracted from JSON
+    :param transform: transform of featureset JSON if coordinates are quantized.  The coordinates of each multipoint,
+        path and ring are delta encoded: the first coordinate is quantized, each following coordinate is the difference
+        from the previous one.
+    :return: list of arrays of x, y coordinates of each ring or path (a single array for points and multipoints)
+    """
+
+    if geomType=="esriGeometryPoint":
+        parts=[numpy.array([[geometry["x"],geometry["y"]]],dtype=numpy.float64)]
+        if transform:
+            parts=[_dequantize(parts[0],transform,False)]
+        return parts
+    elif geomType=="esriGeometryMultipoint":
+        parts=[_toCoordinateArray(geometry["points"])]
+    elif geometryPartsKeys.has_key(geomType):
+        parts=[_toCoordinateArray(part) for part in geometry[geometryPartsKeys[geomType]]]
+    else:
+        raise Exception("GEOMETRY_TYPE_NOT_IMPLEMENTED: This geometry type is not implemented %s"%(geomType))
+    if transform:
+        parts=[_dequantize(part,transform) for part in parts]
+    return parts
+
+
+def getGeometryJSON(geomType,parts):
+    """
+    Return ArcGIS JSON of a geometry, built from whole coordinate arrays.  Inserted with the SHAPE@JSON token, the
+    geometry is constructed natively instead of from an arcpy.Point for every coordinate.
+
+    :param geomType: ArcGIS JSON geometry type: esriGeometryPoint, esriGeometryMultipoint, esriGeometryPolyline, esriGeometryPolygon
+    :param parts: list of arrays of x, y coordinates, from getFeatureParts
+    """
+
+    if geomType=="esriGeometryPoint":
+        return json.dumps({"x":float(parts[0][0,0]),"y":float(parts[0][0,1])})
+    elif geomType=="esriGeometryMultipoint":
+        return json.dumps({"points":parts[0].tolist()})
+    elif geometryPartsKeys.has_key(geomType):
+        return json.dumps({geometryPartsKeys[geomType]:[part.tolist() for part in parts if len(part)]})
+    else:
+        raise Exception("GEOMETRY_TYPE_NOT_IMPLEMENTED: This geometry type is not implemented %s"%(geomType))
+
+
+class FeatureSetReader(object):
+    """
+    Incremental reader of featureset JSON.  The fields, spatial reference and other properties of the featureset are
+    parsed first (readHeader), then the features one at a time (iterFeatures), so that the whole featureset is never
+    parsed into memory at once.  If features precede the other properties in the JSON, they are held in memory until the
+    properties are read; the transform of quantized featuresets must precede features.
+    """
+
+    def __init__(self,source,readSize=FEATURE_SET_READ_SIZE):
+        """
+        :param source: featureset JSON string, or file-like object to read featureset JSON from
+        :param readSize: number of characters read from file at a time
+        """
+
+        self.decoder=json.JSONDecoder()
+        self.readSize=readSize
+        self.header=None
+        if isinstance(source,basestring):
+            self.file=None
+            self.buffer=source
+        else:
+            self.file=source
+            self.buffer=""
+        self.position=0
+        #features read before the other properties of featureset
+        self.features=[]
+        #True if reader is positioned at the start of features
+        self.atFeatures=False
+
+    def _read(self,size=None):
+        """
+        Read more of file into buffer, dropping the part of buffer already parsed.  Return False at end of file.
+        """
+
+        if self.file is None:
+            return False
+        data=self.file.read(size or self.readSize)
+        if not data:
+            self.file=None
+            return False
+        self.buffer=self.buffer[self.position:]+data
+        self.position=0
+        return True
+
+    def _nextChar(self):
+        """
+        Return next character that is not whitespace, without consuming it
+        """
+
+        while True:
+            while self.position<len(self.buffer) and self.buffer[self.position].isspace():
+                self.position+=1
+            if self.position<len(self.buffer):
+                return self.buffer[self.position]
+            if not self._read():
+                raise ValueError("Unexpected end of featureset JSON")
+
+    def _expect(self,chars):
+        """
+        Consume next character, which must be one of chars
+        """
+
+        char=self._nextChar()
+        if not char in chars:
+            raise ValueError("Expected one of '%s' at character %i of featureset JSON, found '%s'"%(chars,self.position,char))
+        self.position+=1
+        return char
+
+    def _decode(self):
+        """
+        Decode next JSON value, reading more of file until the value is complete
+        """
+
+        self._nextChar()
+        while True:
+            try:
+                value,end=self.decoder.raw_decode(self.buffer,self.position)
+                #a number at the end of buffer may continue in the part of file not yet read
+                if end<len(self.buffer) or self.file is None:
+                    self.position=end
+                    return value
+            except ValueError:
+                if self.file is None:
+                    raise
+            #grow reads with buffer so that a large value is not decoded over and over again
+            self._read(max(self.readSize,len(self.buffer)-self.position))
+
+    def _iterArray(self):
+        """
+        Iterate over values of a JSON array
+        """
+
+        self._expect("[")
+        if self._nextChar()=="]":
+            self.position+=1
+            return
+        while True:
+            yield self._decode()
+            if self._expect(",]")=="]":
+                return
+
+    def _readProperties(self,first=False):
+        """
+        Read properties of featureset up to features, or to the end of featureset if features have been read
+
+        :param first: True if reading the first property of featureset (not preceded by ",")
+        """
+
+        while True:
+            if first:
+                first=False
+                if self._nextChar()=="}":
+                    self.position+=1
+                    return
+            elif self._expect(",}")=="}":
+                return
+            key=self._decode()
+            self._expect(":")
+            if key=="features":
+                if self.header.has_key("geometryType") and self.header.has_key("fields") and self.header.has_key("spatialReference"):
+                    self.atFeatures=True
+                    return
+                self.features.extend(self._iterArray())
+            else:
+                self.header[key]=self._decode()
+
+    def readHeader(self):
+        """
+        Return dictionary of properties of featureset (geometryType, spatialReference, fields, etc) other than features
+        """
+
+        if self.header is None:
+            self.header=dict()
+            self._expect("{")
+            self._readProperties(True)
+        return self.header
+
+    def iterFeatures(self):
+        """
+        Iterate over features of featureset, parsing one feature at a time
+        """
+
+        self.readHeader()
+        self.features.reverse()
+        while self.features:
+            yield self.features.pop()
+        if self.atFeatures:
+            self.atFeatures=False
+            for feature in self._iterArray():
+                yield feature
+            self._readProperties()
+
+
+def openFeatureSet(featureSet):
+    """
+    Detect the format of a featureset and return featureset JSON for FeatureSetReader.  A featureset may be JSON
+    (optionally with quantized coordinates, see getFeatureParts), or gzip-compressed JSON, either as bytes or encoded in
+    base64 (e.g., when passed as a string parameter of a tool).
+
+    :param featureSet: featureset string, or file-like object to read featureset JSON from
+    :return: featureset JSON string, or file-like object to read featureset JSON from
+    """
+
+    if not isinstance(featureSet,basestring) or featureSet.lstrip().startswith("{"):
+        return featureSet
+    if isinstance(featureSet,unicode):
+        featureSet=featureSet.encode("ascii")
+    if not featureSet.startswith(GZIP_MAGIC):
+        try:
+            featureSet=base64.b64decode(featureSet)
+        except TypeError:
+            raise ValueError("Featureset is not JSON, gzip-compressed JSON, or base64-encoded gzip-compressed JSON")
+        if not featureSet.startswith(GZIP_MAGIC):
+            raise ValueError("Featureset is not JSON, gzip-compressed JSON, or base64-encoded gzip-compressed JSON")
+    return gzip.GzipFile(fileobj=StringIO(featureSet),mode="rb")
@@ -0,0 +1,86 @@
+"""
+Exact areas of the pixels of rasters in geographic coordinates (latitude and longitude), on the ellipsoid of their
+geographic coordinate system.
+
+The area of the ellipsoid between the equator and a latitude is a closed form function of latitude (it is proportional
+to the sine of the authalic latitude), so all pixels in a row of a geographic raster have the same area, which is
+calculated once per row.  This allows geographic rasters to be tabulated on their native grid, instead of projecting them
+to an equal area projection first.
+"""
+
+import math
+
+import numpy
+
+
+def getAuthalicQ(sinLatitudes, eccentricitySquared):
+    """
+    Return q (Snyder, Map Projections: A Working Manual, eq. 3-12) for each latitude, which is proportional to the area
+    of the ellipsoid between the equator and the latitude (2 * sin(latitude) on a sphere).
+
+    :param sinLatitudes: array of sines of latitudes
+    :param eccentricitySquared: squared eccentricity of ellipsoid (0 for a sphere)
+    """
+
+    if eccentricitySquared <= 0:
+        return 2.0 * sinLatitudes
+
+    eccentricity = math.sqrt(eccentricitySquared)
+    esin = eccentricity * sinLatitudes
+    return (1 - eccentricitySquared) * (sinLatitudes / (1 - esin ** 2) -
+                                        numpy.log((1 - esin) / (1 + esin)) / (2 * eccentricity))
+
+
+def getBandAreas(latitudes, semiMajorAxis, flattening):
+    """
+    Return the area of the ellipsoid between the equator and each latitude, for one radian of longitude (negative south
+    of the equator).
+
+    :param latitudes: array of latitudes, in radians
+    :param semiMajorAxis: semi-major axis of ellipsoid
+    :param flattening: flattening of ellipsoid (0 for a sphere)
+    :return: array of areas, in square units of semiMajorAxis
+    """
+
+    sinLatitudes = numpy.sin(numpy.clip(latitudes, -math.pi / 2, math.pi / 2))
+    return semiMajorAxis ** 2 * getAuthalicQ(sinLatitudes, flattening * (2 - flattening)) / 2.0
+
+
+class GeodesicCellAreas(object):
+    """
+    Areas of the pixels of a geographic grid, on the ellipsoid of its spatial reference
+    """
+
+    def __init__(self, spatialReference, areaFactor=1.0):
+        """
+        :param spatialReference: arcpy geographic spatial reference of grid
+        :param areaFactor: factor to convert square units of the ellipsoid (meters) to the units of results (e.g.,
+            0.0001 for hectares)
+        """
+
+        self.semiMajorAxis = spatialReference.semiMajorAxis
+        self.flattening = spatialReference.flattening
+        self.radiansPerUnit = spatialReference.radiansPerUnit
+        self.areaFactor = areaFactor
+
+    def getRowAreas(self, grid):
+        """
+        Return the area of a pixel in each row of grid
+
+        :param grid: GridTransform of grid, in geographic coordinates
+        :return: array of grid.rows areas
+        """
+
+        edges = (grid.yMax - numpy.arange(grid.rows + 1) * grid.cellHeight) * self.radiansPerUnit
+        bandAreas = getBandAreas(edges, self.semiMajorAxis, self.flattening)
+        return (bandAreas[:-1] - bandAreas[1:]) * grid.cellWidth * self.radiansPerUnit * self.areaFactor
+
+    def getCellAreas(self, grid):
+        """
+        Return the area of each pixel of grid
+
+        :param grid: GridTransform of grid, in geographic coordinates
+        :return: array of grid.shape areas
+        """
+
+        return numpy.repeat(self.getRowAreas(grid)[:, numpy.newaxis], grid.cols, axis=1)
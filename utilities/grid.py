@@ -0,0 +1,121 @@
+"""
+Utilities for describing the regular grid of pixels behind a raster dataset
+"""
+
+import math
+from collections import namedtuple
+
+
+class GridTransform(namedtuple("GridTransform", ["xMin", "yMax", "cellWidth", "cellHeight", "rows", "cols"])):
+    """
+    Position and dimensions of a regular grid of pixels, in the coordinates of its spatial reference.
+
+    Grid coordinates start at 0 in the upper left corner; rows increase downward and columns increase to the right.
+    """
+
+    __slots__ = ()
+
+    @property
+    def shape(self):
+        return self.rows, self.cols
+
+    @property
+    def xMax(self):
+        return self.xMin + self.cols * self.cellWidth
+
+    @property
+    def yMin(self):
+        return self.yMax - self.rows * self.cellHeight
+
+    @property
+    def cellArea(self):
+        return self.cellWidth * self.cellHeight
+
+    def window(self, row, col, rows, cols):
+        """
+        Return the transform of a window within this grid.
+
+        :param row: upper row of window
+        :param col: left column of window
+        :param rows: number of rows in window
+        :param cols: number of columns in window
+        """
+
+        return GridTransform(self.xMin + col * self.cellWidth, self.yMax - row * self.cellHeight,
+                             self.cellWidth, self.cellHeight, rows, cols)
+
+    def getWindowForExtent(self, xMin, yMin, xMax, yMax, clip=True):
+        """
+        Return the window of this grid (aligned to its pixels) that covers an extent.
+
+        :param xMin: minimum x of extent, in spatial reference of grid
+        :param yMin: minimum y of extent, in spatial reference of grid
+        :param xMax: maximum x of extent, in spatial reference of grid
+        :param yMax: maximum y of extent, in spatial reference of grid
+        :param clip: if True, the window is limited to the bounds of this grid
+        """
+
+        col = int(math.floor((xMin - self.xMin) / self.cellWidth))
+        row = int(math.floor((self.yMax - yMax) / self.cellHeight))
+        endCol = int(math.ceil((xMax - self.xMin) / self.cellWidth))
+        endRow = int(math.ceil((self.yMax - yMin) / self.cellHeight))
+        if clip:
+            col, row = max(col, 0), max(row, 0)
+            endCol, endRow = min(endCol, self.cols), min(endRow, self.rows)
+        return self.window(row, col, max(endRow - row, 0), max(endCol - col, 0))
+
+    def getOffset(self, other):
+        """
+        Return the offset (rows, cols) of the upper left corner of another grid aligned to this one
+
+        :param other: GridTransform aligned to pixels of this grid
+        """
+
+        return (int(round((self.yMax - other.yMax) / self.cellHeight)),
+                int(round((other.xMin - self.xMin) / self.cellWidth)))
+
+    def getBlocks(self, blockSize):
+        """
+        Split this grid into blocks of at most blockSize rows and columns.
+
+        :param blockSize: maximum number of rows and columns in each block
+        :return: list of GridTransform for each block, in row major order
+        """
+
+        blocks = []
+        for row in range(0, self.rows, blockSize):
+            for col in range(0, self.cols, blockSize):
+                blocks.append(self.window(row, col, min(blockSize, self.rows - row), min(blockSize, self.cols - col)))
+        return blocks
+
+    def getBlockGrid(self, blockSize):
+        """
+        Return the grid of blocks of this grid (as from getBlocks), in which each block is a single cell.  Blocks along
+        the right and bottom edges extend beyond this grid.
+
+        :param blockSize: number of rows and columns in each block
+        """
+
+        return GridTransform(self.xMin, self.yMax, self.cellWidth * blockSize, self.cellHeight * blockSize,
+                             int(math.ceil(self.rows / float(blockSize))), int(math.ceil(self.cols / float(blockSize))))
+
+    def toGridCoordinates(self, x, y):
+        """
+        Convert map coordinates to fractional grid coordinates (column, row).
+
+        :param x: x coordinate(s) in spatial reference of grid
+        :param y: y coordinate(s) in spatial reference of grid
+        """
+
+        return (x - self.xMin) / self.cellWidth, (self.yMax - y) / self.cellHeight
+
+
+def getGridTransform(raster):
+    """
+    Return the grid transform for an arcpy Raster object
+
+    :param raster: arcpy.Raster
+    """
+
+    return GridTransform(raster.extent.XMin, raster.extent.YMax, raster.meanCellWidth, raster.meanCellHeight,
+                         raster.height, raster.width)
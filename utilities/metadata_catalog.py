@@ -0,0 +1,233 @@
+"""
+Catalog of descriptive metadata of layer data sources, so that data sources are not described again for every request.
+
+Metadata are validated against the version of the data source (modification time and size of the files behind it)
+each time they are used, and shared by all requests in a process.  Metadata can also be persisted to a directory of JSON
+files (METADATA_CATALOG_DIR in settings), so that they are shared by processes and survive restarts.
+"""
+
+import os
+import json
+import uuid
+import hashlib
+import logging
+
+import arcpy
+
+import settings
+from utilities.grid import GridTransform, getGridTransform
+from utilities.PathUtils import getDataSourceVersion
+from utilities.ProjectionUtilities import getSpatialReferenceFromWKT
+
+
+logger = logging.getLogger(__name__)
+
+_metadataCatalog = None
+
+
+class LayerMetadata(object):
+    """
+    Metadata of a layer data source: name, type, extent, spatial reference, field names, and for rasters, grid
+    dimensions, data type, NoData value, and value field.
+
+    Can be used in place of arcpy.mapping.Layer for name, dataSource, isRasterLayer, and isFeatureLayer.
+    """
+
+    def __init__(self, values):
+        """
+        :param values: dictionary of metadata, as created by describe or returned by toJSON
+        """
+
+        self.dataSource = values["dataSource"]
+        self.version = values["version"]
+        self.name = values["name"]
+        self.isRasterLayer = values["isRasterLayer"]
+        self.isFeatureLayer = values["isFeatureLayer"]
+        self.extent = values["extent"]
+        self.spatialReferenceWKT = values["spatialReference"]
+        self.fieldNames = values["fieldNames"]
+        self.shapeType = values.get("shapeType")
+        self.grid = GridTransform(*values["grid"]) if values.get("grid") else None
+        self.isInteger = values.get("isInteger")
+        self.noDataValue = values.get("noDataValue")
+        self.valueField = values.get("valueField")
+        self._spatialReference = None
+
+    @classmethod
+    def describe(cls, dataSource, version=None):
+        """
+        Describe a data source
+
+        :param dataSource: path to data source
+        :param version: version of data source, from getDataSourceVersion
+        """
+
+        logger.debug("Describing data source: %s" % (dataSource))
+        layer = arcpy.mapping.Layer(dataSource)
+        info = arcpy.Describe(dataSource)
+        values = {
+            "dataSource": dataSource,
+            "version": version,
+            "name": layer.name,
+            "isRasterLayer": layer.isRasterLayer,
+            "isFeatureLayer": layer.isFeatureLayer,
+            "extent": [info.extent.XMin, info.extent.YMin, info.extent.XMax, info.extent.YMax],
+            "spatialReference": info.spatialReference.exportToString(),
+            "fieldNames": [field.name for field in arcpy.ListFields(dataSource)]
+        }
+        if layer.isRasterLayer:
+            raster = arcpy.Raster(dataSource)
+            values["grid"] = list(getGridTransform(raster))
+            values["isInteger"] = raster.isInteger
+            values["noDataValue"] = raster.noDataValue
+            values["valueField"] = "VALUE"
+            for fieldName in values["fieldNames"]:
+                #case changes based on format
+                if fieldName.lower() == "value":
+                    values["valueField"] = fieldName
+            del raster
+        elif layer.isFeatureLayer:
+            values["shapeType"] = info.shapeType
+        del layer
+        return cls(values)
+
+    def toJSON(self):
+        values = {
+            "dataSource": self.dataSource,
+            "version": self.version,
+            "name": self.name,
+            "isRasterLayer": self.isRasterLayer,
+            "isFeatureLayer": self.isFeatureLayer,
+            "extent": self.extent,
+            "spatialReference": self.spatialReferenceWKT,
+            "fieldNames": self.fieldNames
+        }
+        if self.shapeType:
+            values["shapeType"] = self.shapeType
+        if self.grid:
+            values.update({"grid": list(self.grid), "isInteger": self.isInteger, "noDataValue": self.noDataValue,
+                           "valueField": self.valueField})
+        return values
+
+    def getExtent(self):
+        return arcpy.Extent(*self.extent)
+
+    def getSpatialReference(self):
+        if self._spatialReference is None:
+            self._spatialReference = getSpatialReferenceFromWKT(self.spatialReferenceWKT)
+        return self._spatialReference
+
+    def __getstate__(self):
+        return self.toJSON()
+
+    def __setstate__(self, state):
+        self.__init__(state)
+
+
+class MetadataCatalog(object):
+    """
+    Catalog of metadata of data sources, validated against the version of each data source when used.  Data sources
+    without a version (e.g., in enterprise geodatabases) are described every time.
+
+    Metadata can be persisted to a directory, with one JSON file per data source, so that processes writing metadata
+    of different data sources at the same time never overwrite each other's entries.
+    """
+
+    def __init__(self, directory=None):
+        """
+        :param directory: optional directory used to persist catalog, created if necessary
+        """
+
+        self.directory = directory
+        self._entries = dict()
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+    def _getPath(self, dataSource):
+        if isinstance(dataSource, unicode):
+            dataSource = dataSource.encode("utf-8")
+        return os.path.join(self.directory, "%s.json" % (hashlib.sha1(dataSource).hexdigest()))
+
+    def _read(self, dataSource):
+        path = self._getPath(dataSource)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "rb") as entryFile:
+                values = json.loads(entryFile.read())
+            if values["dataSource"] == dataSource:
+                return LayerMetadata(values)
+        except (IOError, OSError, ValueError, KeyError, TypeError) as ex:
+            logger.warning("Could not read metadata catalog entry %s: %s" % (path, ex))
+        return None
+
+    def _write(self, entry):
+        #write to a temporary file first, so that readers never see partial entries
+        path = self._getPath(entry.dataSource)
+        tempPath = "%s.%s.tmp" % (path, uuid.uuid4().hex)
+        try:
+            with open(tempPath, "wb") as entryFile:
+                entryFile.write(json.dumps(entry.toJSON()))
+            if os.path.exists(path):
+                os.remove(path)
+            os.rename(tempPath, path)
+        except (IOError, OSError) as ex:
+            logger.warning("Could not write metadata catalog entry %s: %s" % (path, ex))
+            if os.path.exists(tempPath):
+                os.remove(tempPath)
+
+    def _getEntry(self, dataSource, version):
+        """
+        Return LayerMetadata for data source from catalog (in this process, or persisted by any process), or None if not
+        in catalog or if it has changed
+        """
+
+        if version is None:
+            return None
+        entry = self._entries.get(dataSource)
+        if (entry is None or entry.version != version) and self.directory:
+            entry = self._read(dataSource)
+            if entry is not None:
+                self._entries[dataSource] = entry
+        if entry is not None and entry.version == version:
+            return entry
+        return None
+
+    def getLayer(self, dataSource):
+        """
+        Return LayerMetadata for data source, describing it if not in catalog or if it has changed
+
+        :param dataSource: path to data source
+        """
+
+        version = getDataSourceVersion(dataSource)
+        entry = self._getEntry(dataSource, version)
+        if entry is None:
+            entry = LayerMetadata.describe(dataSource, version)
+            if version is not None:
+                self._entries[dataSource] = entry
+                if self.directory:
+                    self._write(entry)
+        return entry
+
+    def exists(self, dataSource):
+        """
+        Return True if data source exists.  Uses catalog if data source is in catalog and has not changed.
+
+        :param dataSource: path to data source
+        """
+
+        if self._getEntry(dataSource, getDataSourceVersion(dataSource)) is not None:
+            return True
+        return arcpy.Exists(dataSource)
+
+
+def getMetadataCatalog():
+    """
+    Return the metadata catalog for this process, persisted to METADATA_CATALOG_DIR in settings (if set)
+    """
+
+    global _metadataCatalog
+    if _metadataCatalog is None or _metadataCatalog.directory != settings.METADATA_CATALOG_DIR:
+        _metadataCatalog = MetadataCatalog(settings.METADATA_CATALOG_DIR)
+    return _metadataCatalog
@@ -0,0 +1,163 @@
+"""
+Statistics of values accumulated in a single pass over blocks of values, such as windows of a raster.
+
+Statistics are stored as running moments (count, sum of weights, weighted mean, and weighted sum of squared deviations
+from the mean), which are updated from each block and merged using the parallel algorithm of Chan et al., so that
+statistics of separate blocks (or of separate processes) can be combined exactly, without revisiting the values and
+without the loss of precision of summing squares.
+"""
+
+import math
+
+import numpy
+
+
+#Statistics that can be calculated from running moments
+STATISTICS = ("MIN", "MAX", "SUM", "MEAN", "STD")
+
+
+class RunningStatistics(object):
+    """
+    Count, minimum, maximum, sum, weighted mean, and weighted (population) variance of values.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.weight = 0.0
+        self.sum = 0.0
+        self.mean = 0.0
+        self.m2 = 0.0  #weighted sum of squared deviations from mean
+        self.min = None
+        self.max = None
+
+    def update(self, values, weights=None):
+        """
+        Add values to statistics.
+
+        :param values: array of numeric values (may be a masked array, masked values are excluded)
+        :param weights: optional array of weights of same shape as values (e.g., proportion of each pixel within area
+            of interest), used for mean and variance.  Each value has a weight of 1 if not provided.
+        """
+
+        mask = numpy.ma.getmask(values)
+        values = numpy.ma.getdata(values).ravel()
+        if weights is not None:
+            weights = numpy.ma.getdata(weights).ravel().astype(numpy.float64)
+        if mask is not numpy.ma.nomask:
+            valid = ~mask.ravel()
+            values = values[valid]
+            if weights is not None:
+                weights = weights[valid]
+        if not len(values):
+            return
+
+        block = RunningStatistics()
+        block.count = len(values)
+        block.min = values.min().item()
+        block.max = values.max().item()
+        values = values.astype(numpy.float64)
+        block.sum = float(values.sum())
+        if weights is None:
+            block.weight = float(block.count)
+            block.mean = block.sum / block.weight
+            block.m2 = float(((values - block.mean) ** 2).sum())
+        else:
+            block.weight = float(weights.sum())
+            if block.weight > 0:
+                block.mean = float((values * weights).sum()) / block.weight
+                block.m2 = float((weights * (values - block.mean) ** 2).sum())
+        self.merge(block)
+
+    def merge(self, other):
+        """
+        Combine statistics of another set of values into these statistics.
+
+        :param other: RunningStatistics
+        """
+
+        if not other.count:
+            return
+        if not self.count:
+            self.min = other.min
+            self.max = other.max
+        else:
+            self.min = min(self.min, other.min)
+            self.max = max(self.max, other.max)
+
+        weight = self.weight + other.weight
+        if weight > 0:
+            delta = other.mean - self.mean
+            self.mean += delta * other.weight / weight
+            self.m2 += other.m2 + delta * delta * self.weight * other.weight / weight
+        self.weight = weight
+        self.count += other.count
+        self.sum += other.sum
+
+    @classmethod
+    def fromBlocks(cls, counts, sums, m2s, mins, maxs):
+        """
+        Combine statistics of many blocks of unweighted values at once, such as tiles of a raster summarized in advance.
+
+        :param counts: array of number of values in each block
+        :param sums: array of sum of values in each block
+        :param m2s: array of sum of squared deviations from the mean of each block
+        :param mins: array of minimum value in each block
+        :param maxs: array of maximum value in each block
+        :return: RunningStatistics of all values
+        """
+
+        statistics = cls()
+        counts = numpy.asarray(counts, dtype=numpy.int64)
+        present = counts > 0
+        if not present.any():
+            return statistics
+        counts = counts[present]
+        sums = numpy.asarray(sums, dtype=numpy.float64)[present]
+        statistics.count = int(counts.sum())
+        statistics.weight = float(statistics.count)
+        statistics.sum = float(sums.sum())
+        statistics.mean = statistics.sum / statistics.weight
+        means = sums / counts
+        statistics.m2 = float(numpy.asarray(m2s, dtype=numpy.float64)[present].sum() +
+                              (counts * (means - statistics.mean) ** 2).sum())
+        statistics.min = numpy.asarray(mins)[present].min().item()
+        statistics.max = numpy.asarray(maxs)[present].max().item()
+        return statistics
+
+    @property
+    def variance(self):
+        if self.weight <= 0:
+            return None
+        return max(self.m2 / self.weight, 0.0)
+
+    @property
+    def std(self):
+        variance = self.variance
+        return math.sqrt(variance) if variance is not None else None
+
+    def getStatistics(self, statisticsList):
+        """
+        Return dictionary of requested statistics (MIN, MAX, SUM, MEAN, STD, case insensitive).  Statistics are None if
+        there are no values.
+
+        :param statisticsList: list of statistic names
+        """
+
+        statistics = dict()
+        for statistic in statisticsList:
+            name = statistic.upper()
+            if not name in STATISTICS:
+                raise ValueError("STATISTIC_NOT_SUPPORTED: %s" % (statistic))
+            if not self.count:
+                statistics[statistic] = None
+            elif name == "MIN":
+                statistics[statistic] = self.min
+            elif name == "MAX":
+                statistics[statistic] = self.max
+            elif name == "SUM":
+                statistics[statistic] = self.sum
+            elif name == "MEAN":
+                statistics[statistic] = self.mean if self.weight > 0 else None
+            elif name == "STD":
+                statistics[statistic] = self.std
+        return statistics
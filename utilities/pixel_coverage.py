@@ -0,0 +1,316 @@
+"""
+Exact per-pixel coverage of polygons and lines, calculated in memory using numpy.
+
+Each edge of the area of interest is split where it crosses grid lines, so that every resulting segment lies within a
+single pixel.  Lines are tallied by the length of these segments.  Polygons are tallied by integrating the area between
+each segment and the bottom of its pixel, plus the full height of every pixel below it in the same column (accumulated
+with a cumulative sum).  Rings are expected to follow ESRI orientation (outer rings clockwise, inner rings
+counter-clockwise) so that inner rings are subtracted.
+"""
+
+import numpy
+
+
+def _getSegments(parts, closeRings):
+    """
+    Return start and end coordinates of every edge in parts, as arrays of x0, y0, x1, y1
+    """
+
+    starts = []
+    ends = []
+    for part in parts:
+        part = numpy.asarray(part, dtype=numpy.float64)[:, :2]
+        if closeRings and len(part) and (part[0] != part[-1]).any():
+            part = numpy.vstack((part, part[:1]))
+        if len(part) < 2:
+            continue
+        starts.append(part[:-1])
+        ends.append(part[1:])
+    if not starts:
+        empty = numpy.zeros(0)
+        return empty, empty, empty, empty
+    starts = numpy.concatenate(starts)
+    ends = numpy.concatenate(ends)
+    return starts[:, 0], starts[:, 1], ends[:, 0], ends[:, 1]
+
+
+def _getCrossings(start, end, maxLine):
+    """
+    Return segment index and segment parameter (0-1) of every crossing of integer grid lines 0..maxLine
+    """
+
+    low = numpy.minimum(start, end)
+    high = numpy.maximum(start, end)
+    first = numpy.maximum(numpy.floor(low) + 1, 0)
+    last = numpy.minimum(numpy.ceil(high) - 1, maxLine)
+    counts = numpy.maximum(last - first + 1, 0).astype(numpy.int64)
+    total = counts.sum()
+    if not total:
+        return numpy.zeros(0, dtype=numpy.int64), numpy.zeros(0)
+    indices = numpy.repeat(numpy.arange(len(start)), counts)
+    offsets = numpy.arange(total) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+    lines = first[indices] + offsets
+    return indices, (lines - start[indices]) / (end[indices] - start[indices])
+
+
+def splitSegments(parts, grid, closeRings=False):
+    """
+    Split the edges of parts where they cross rows or columns of grid, so that each segment lies within a single pixel.
+
+    :param parts: list of arrays of x, y coordinates of each ring or path, in spatial reference of grid
+    :param grid: GridTransform of target grid
+    :param closeRings: if True, close any ring whose last vertex does not match its first vertex
+    :return: tuple of (u0, v0, u1, v1, row, col) arrays in grid coordinates (columns, rows) of each segment, with the
+        row and column of the pixel containing it
+    """
+
+    x0, y0, x1, y1 = _getSegments(parts, closeRings)
+    u0, v0 = grid.toGridCoordinates(x0, y0)
+    u1, v1 = grid.toGridCoordinates(x1, y1)
+
+    numSegments = len(u0)
+    colIndices, colParams = _getCrossings(u0, u1, grid.cols)
+    rowIndices, rowParams = _getCrossings(v0, v1, grid.rows)
+    indices = numpy.concatenate((numpy.arange(numSegments), numpy.arange(numSegments), colIndices, rowIndices))
+    params = numpy.concatenate((numpy.zeros(numSegments), numpy.ones(numSegments), colParams, rowParams))
+    order = numpy.lexsort((params, indices))
+    indices = indices[order]
+    params = params[order]
+
+    #consecutive parameters along the same edge bound a segment within a single pixel
+    same = indices[1:] == indices[:-1]
+    segment = indices[:-1][same]
+    startParam = params[:-1][same]
+    endParam = params[1:][same]
+    du = (u1 - u0)[segment]
+    dv = (v1 - v0)[segment]
+    su0 = u0[segment] + startParam * du
+    sv0 = v0[segment] + startParam * dv
+    su1 = u0[segment] + endParam * du
+    sv1 = v0[segment] + endParam * dv
+    col = numpy.floor((su0 + su1) / 2.0).astype(numpy.int64)
+    row = numpy.floor((sv0 + sv1) / 2.0).astype(numpy.int64)
+    return su0, sv0, su1, sv1, row, col
+
+
+def getPolygonCoverage(rings, grid):
+    """
+    Calculate the fraction of each pixel covered by polygon rings.
+
+    :param rings: list of arrays of x, y coordinates of each ring, in spatial reference of grid
+    :param grid: GridTransform of target grid
+    :return: array of grid.shape with proportion of each pixel within polygons (exceeds 1 where polygons overlap)
+    """
+
+    rows, cols = grid.shape
+    u0, v0, u1, v1, row, col = splitSegments(rings, grid, closeRings=True)
+    inColumn = (col >= 0) & (col < cols)
+    du = (u1 - u0)[inColumn]
+    vMean = ((v0 + v1) / 2.0)[inColumn]
+    row = row[inColumn]
+    col = col[inColumn]
+
+    #area between segment and bottom of its own pixel
+    inRow = (row >= 0) & (row < rows)
+    partial = numpy.bincount(row[inRow] * cols + col[inRow], weights=du[inRow] * ((row[inRow] + 1) - vMean[inRow]),
+                             minlength=rows * cols)
+
+    #full pixel height for every pixel below the segment, accumulated down each column
+    belowRow = numpy.maximum(row + 1, 0)
+    hasBelow = belowRow < rows
+    full = numpy.bincount(belowRow[hasBelow] * cols + col[hasBelow], weights=du[hasBelow], minlength=rows * cols)
+
+    coverage = partial.reshape(rows, cols) + numpy.cumsum(full.reshape(rows, cols), axis=0)
+    if coverage.sum() < 0:
+        #rings follow the opposite orientation
+        coverage = -coverage
+    #remove floating point residue in pixels the rings only touch
+    coverage[numpy.abs(coverage) < 1e-12] = 0
+    return coverage
+
+
+def getLineCoverage(paths, grid):
+    """
+    Calculate the length of lines within each pixel.
+
+    :param paths: list of arrays of x, y coordinates of each path, in spatial reference of grid
+    :param grid: GridTransform of target grid
+    :return: array of grid.shape with length of lines within each pixel, in units of spatial reference of grid
+    """
+
+    rows, cols = grid.shape
+    u0, v0, u1, v1, row, col = splitSegments(paths, grid)
+    inGrid = (row >= 0) & (row < rows) & (col >= 0) & (col < cols)
+    length = numpy.hypot((u1 - u0)[inGrid] * grid.cellWidth, (v1 - v0)[inGrid] * grid.cellHeight)
+    return numpy.bincount(row[inGrid] * cols + col[inGrid], weights=length, minlength=rows * cols).reshape(rows, cols)
+
+
+def getPixelCoverage(parts, grid, geometryType):
+    """
+    Calculate the exact area (polygons) or length (polylines) of the area of interest within each pixel of grid.
+
+    :param parts: list of arrays of x, y coordinates of each ring or path, in spatial reference of grid
+    :param grid: GridTransform of target grid
+    :param geometryType: Polygon or Polyline
+    :return: array of grid.shape with area or length within each pixel, in units of spatial reference of grid
+    """
+
+    if geometryType == "Polygon":
+        return getPolygonCoverage(parts, grid) * grid.cellArea
+    elif geometryType == "Polyline":
+        return getLineCoverage(parts, grid)
+    raise ValueError("GEOMETRY_TYPE_NOT_SUPPORTED: pixel coverage is not supported for geometry type %s" % (geometryType))
+
+
+def getEdgeMask(parts, grid, closeRings=False):
+    """
+    Find pixels that contain part of an edge of the area of interest.  The winding number of the area of interest is the
+    same at every point within any other pixel, so those pixels are either entirely inside or entirely outside it.
+
+    :param parts: list of arrays of x, y coordinates of each ring or path, in spatial reference of grid
+    :param grid: GridTransform of target grid
+    :param closeRings: if True, close any ring whose last vertex does not match its first vertex
+    :return: boolean array of grid.shape
+    """
+
+    u0, v0, u1, v1, row, col = splitSegments(parts, grid, closeRings)
+    inGrid = (row >= 0) & (row < grid.rows) & (col >= 0) & (col < grid.cols)
+    mask = numpy.zeros(grid.shape, dtype=bool)
+    mask[row[inGrid], col[inGrid]] = True
+    return mask
+
+
+def getPolygonEdgeCoverage(rings, grid):
+    """
+    Calculate the fraction of each pixel covered by polygon rings, only for pixels that contain edges of the rings.  Uses
+    the same integration as getPolygonCoverage, but the full pixel heights of the segments above each pixel in its
+    column are accumulated from segments sorted by column, instead of over every pixel of the grid.
+
+    :param rings: list of arrays of x, y coordinates of each ring, in spatial reference of grid
+    :param grid: GridTransform of target grid
+    :return: tuple of (row, col, coverage) arrays with an entry for each pixel that contains edges
+    """
+
+    rows, cols = grid.shape
+    u0, v0, u1, v1, row, col = splitSegments(rings, grid, closeRings=True)
+    #rings follow the opposite orientation if the signed area between the rings and the top of the grid is negative
+    orientation = -1 if ((u1 - u0) * (v0 + v1)).sum() > 0 else 1
+    inColumn = (col >= 0) & (col < cols)
+    du = (u1 - u0)[inColumn]
+    vMean = ((v0 + v1) / 2.0)[inColumn]
+    row = row[inColumn]
+    col = col[inColumn]
+
+    #area between segment and bottom of its own pixel
+    inRow = (row >= 0) & (row < rows)
+    segmentCells = row[inRow] * cols + col[inRow]
+    cells = numpy.unique(segmentCells)
+    partial = numpy.bincount(numpy.searchsorted(cells, segmentCells),
+                             weights=du[inRow] * ((row[inRow] + 1) - vMean[inRow]), minlength=len(cells))
+
+    #full pixel height for every pixel below each segment in the same column: sum the segments of the column that are in
+    #rows above the pixel (including above the grid)
+    keys = col * (rows + 1) + numpy.clip(row + 1, 0, rows)
+    order = numpy.argsort(keys, kind="mergesort")
+    keys = keys[order]
+    accumulated = numpy.concatenate(([0], numpy.cumsum(du[order])))
+    cellRows = cells // cols
+    cellCols = cells % cols
+    full = (accumulated[numpy.searchsorted(keys, cellCols * (rows + 1) + cellRows, side="right")] -
+            accumulated[numpy.searchsorted(keys, cellCols * (rows + 1), side="left")])
+
+    coverage = (partial + full) * orientation
+    #remove floating point residue in pixels the rings only touch
+    coverage[numpy.abs(coverage) < 1e-12] = 0
+    return cellRows, cellCols, coverage
+
+
+def getPolygonWinding(rings, grid):
+    """
+    Calculate the winding number of polygon rings at the center of each pixel: 0 outside polygons and within inner
+    rings, and the number of overlapping polygons elsewhere (negative if rings follow the opposite orientation).
+
+    :param rings: list of arrays of x, y coordinates of each ring, in spatial reference of grid
+    :param grid: GridTransform of target grid
+    :return: integer array of grid.shape
+    """
+
+    rows, cols = grid.shape
+    x0, y0, x1, y1 = _getSegments(rings, True)
+    u0, v0 = grid.toGridCoordinates(x0, y0)
+    u1, v1 = grid.toGridCoordinates(x1, y1)
+
+    #find every crossing of an edge with the horizontal line through pixel centers (row + 0.5)
+    indices, params = _getCrossings(v0 - 0.5, v1 - 0.5, rows - 1)
+    lineRows = numpy.round(v0[indices] - 0.5 + params * (v1 - v0)[indices]).astype(numpy.int64)
+    u = u0[indices] + params * (u1 - u0)[indices]
+    direction = numpy.sign(v1 - v0)[indices]
+
+    #an edge with a vertex exactly on a center line is counted at the vertex with the lower row coordinate only, so that
+    #the crossing is counted once where consecutive edges meet
+    for vStart, vEnd, sign in ((v0, v1, 1), (v1, v0, -1)):
+        onLine = (numpy.floor(vStart - 0.5) == vStart - 0.5) & (vEnd > vStart)
+        onLine &= (vStart - 0.5 >= 0) & (vStart - 0.5 <= rows - 1)
+        lineRows = numpy.concatenate((lineRows, (vStart[onLine] - 0.5).astype(numpy.int64)))
+        u = numpy.concatenate((u, (u0 if sign == 1 else u1)[onLine]))
+        direction = numpy.concatenate((direction, numpy.sign(v1 - v0)[onLine]))
+
+    #each crossing changes the winding number of all pixel centers to its right
+    firstCol = numpy.clip(numpy.ceil(u - 0.5), 0, cols).astype(numpy.int64)
+    winding = numpy.bincount(lineRows * (cols + 1) + firstCol, weights=direction, minlength=rows * (cols + 1))
+    winding = numpy.cumsum(winding.reshape(rows, cols + 1), axis=1)[:, :cols]
+    return numpy.round(winding).astype(numpy.int64)
+
+
+def getPolygonMask(rings, grid):
+    """
+    Rasterize polygon rings: find pixels whose center is within polygons (non-zero winding, so that inner rings are
+    excluded and overlapping polygons are not).
+
+    :param rings: list of arrays of x, y coordinates of each ring, in spatial reference of grid
+    :param grid: GridTransform of target grid
+    :return: boolean array of grid.shape
+    """
+
+    return getPolygonWinding(rings, grid) != 0
+
+
+def getPointMask(points, grid):
+    """
+    Rasterize points: find pixels that contain points
+
+    :param points: list of arrays of x, y coordinates of points, in spatial reference of grid
+    :param grid: GridTransform of target grid
+    :return: boolean array of grid.shape
+    """
+
+    mask = numpy.zeros(grid.shape, dtype=bool)
+    if not len(points):
+        return mask
+    points = numpy.concatenate([numpy.asarray(point, dtype=numpy.float64)[:, :2] for point in points])
+    u, v = grid.toGridCoordinates(points[:, 0], points[:, 1])
+    col = numpy.floor(u).astype(numpy.int64)
+    row = numpy.floor(v).astype(numpy.int64)
+    inGrid = (row >= 0) & (row < grid.rows) & (col >= 0) & (col < grid.cols)
+    mask[row[inGrid], col[inGrid]] = True
+    return mask
+
+
+def getPixelMask(parts, grid, geometryType):
+    """
+    Rasterize the area of interest onto grid: pixels with centers inside polygons, pixels crossed by lines, or pixels
+    containing points.
+
+    :param parts: list of arrays of x, y coordinates of each ring, path, or set of points, in spatial reference of grid
+    :param grid: GridTransform of target grid
+    :param geometryType: Polygon, Polyline, Point, or Multipoint
+    :return: boolean array of grid.shape
+    """
+
+    if geometryType == "Polygon":
+        return getPolygonMask(parts, grid)
+    elif geometryType == "Polyline":
+        return getLineCoverage(parts, grid) > 0
+    elif geometryType in ("Point", "Multipoint"):
+        return getPointMask(parts, grid)
+    raise ValueError("GEOMETRY_TYPE_NOT_SUPPORTED: rasterization is not supported for geometry type %s" % (geometryType))
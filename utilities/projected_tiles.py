@@ -0,0 +1,423 @@
+"""
+Cache of raster layers projected to target projections, stored on local disk as tiles.
+
+Layers that are not in a projection valid for calculating areas must be projected before they are tabulated.  Instead
+of clipping and projecting the layer for every request, the layer is projected one tile at a time onto a fixed grid in
+the target projection (aligned to the origin of the projection, with a cell size derived from that of the layer), and
+each tile is kept as a .npy file that can be memory mapped.  Requests assemble the tiles that cover their area of
+interest, so that a layer is projected once per tile instead of once per request; this is most effective when the
+target projection is shared between requests (see CUSTOM_ALBERS_SNAP_DEGREES in settings).
+
+Tiles are keyed by the layer data source and its version (modification time and size of the files behind it), the
+target projection, the cell size, and the tile size, so stale tiles are never used.  Tiles are evicted in least recently
+used order when the total size of the cache exceeds PROJECTED_TILE_CACHE_MAX_BYTES (settings).
+"""
+
+import os
+import math
+import time
+import uuid
+import hashlib
+import logging
+
+import arcpy
+import numpy
+
+import settings
+from utilities import ProjectionUtilities
+from utilities.grid import GridTransform
+from utilities.raster_windows import RasterWindowReader
+from utilities.scratch import ScratchWorkspace
+
+
+logger = logging.getLogger(__name__)
+
+#Increment when the format of tiles changes, to invalidate previously cached tiles
+CACHE_VERSION = 1
+
+#Number of pixels of the layer added around each tile when clipping the layer to project it, so that resampling near the
+#edges of tiles uses the same pixels as resampling the whole layer
+CLIP_PADDING = 2
+
+_projectedTileCache = None
+
+
+def getProjectedCellSize(layer, spatialReference):
+    """
+    Return the cell size of a raster layer when projected to a spatial reference: the side of a square with the same
+    area as a pixel of the layer (at the center of the layer, for layers in geographic coordinates), rounded to 6
+    significant digits so that it is stable.
+
+    :param layer: LayerMetadata of raster layer
+    :param spatialReference: target spatial reference
+    :return: cell size, in units of spatialReference
+    """
+
+    layerSpatialReference = layer.getSpatialReference()
+    grid = layer.grid
+    if layerSpatialReference.type == "Geographic":
+        radiansPerUnit = layerSpatialReference.radiansPerUnit
+        latitude = (grid.yMin + grid.yMax) / 2.0 * radiansPerUnit
+        semiMajorAxis = layerSpatialReference.semiMajorAxis
+        cellArea = (grid.cellWidth * radiansPerUnit * semiMajorAxis * math.cos(latitude) *
+                    grid.cellHeight * radiansPerUnit * semiMajorAxis)
+    else:
+        cellArea = grid.cellArea * layerSpatialReference.metersPerUnit ** 2
+    metersPerUnit = ProjectionUtilities.getProjUnitFactors(spatialReference)[2]
+    return float("%.6g" % (math.sqrt(cellArea) / metersPerUnit))
+
+
+def _getCompactValues(values, isInteger):
+    """
+    Return the values of a masked array in the smallest data type that holds them exactly, with masked values set to 0
+    """
+
+    data = values.filled(0)
+    if isInteger:
+        if not values.count():
+            return data.astype(numpy.uint8)
+        return data.astype(numpy.promote_types(numpy.min_scalar_type(int(values.min())),
+                                               numpy.min_scalar_type(int(values.max()))))
+    compact = data.astype(numpy.float32)
+    if (compact == data).all():
+        return compact
+    return data
+
+
+class ProjectedTileCache(object):
+    """
+    Tiles of projected rasters in a directory, with one subdirectory per combination of layer version, target projection,
+    cell size, and tile size.  Each tile is stored as <row>_<col>.npy (values), and <row>_<col>.mask.npy (True where
+    there is no data) if any of its pixels have no data.  Reading a tile marks it as recently used by updating the
+    modification time of its values file.
+    """
+
+    def __init__(self, directory, maxBytes, tileSize):
+        """
+        :param directory: directory for tiles, created if necessary
+        :param maxBytes: maximum total size of tile files
+        :param tileSize: number of rows and columns of each tile
+        """
+
+        self.directory = directory
+        self.maxBytes = maxBytes
+        self.tileSize = tileSize
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+    def getKey(self, layer, spatialReference, cellSize):
+        """
+        Return key of the tiles of a layer projected to a spatial reference, or None if the layer has no version (and
+        cannot be cached)
+
+        :param layer: LayerMetadata of raster layer
+        :param spatialReference: target spatial reference
+        :param cellSize: cell size of projected tiles
+        """
+
+        if layer.version is None:
+            return None
+        digest = hashlib.sha1()
+        for value in (CACHE_VERSION, os.path.normcase(os.path.abspath(layer.dataSource)), layer.version,
+                      ProjectionUtilities.getSpatialReferenceKey(spatialReference), repr(cellSize), self.tileSize):
+            digest.update(unicode(value).encode("utf-8"))
+            digest.update("\0")
+        return digest.hexdigest()
+
+    def _getPaths(self, key, row, col):
+        basePath = os.path.join(self.directory, key, "%i_%i" % (row, col))
+        return "%s.npy" % (basePath), "%s.mask.npy" % (basePath)
+
+    def getTile(self, key, row, col):
+        """
+        Return (values, mask) of a tile, memory mapped, or None if not in cache.  mask is None if all pixels have data.
+
+        :param key: key of tiles, from getKey
+        :param row: row of tile
+        :param col: column of tile
+        """
+
+        valuesPath, maskPath = self._getPaths(key, row, col)
+        try:
+            values = numpy.load(valuesPath, mmap_mode="r")
+            mask = numpy.load(maskPath, mmap_mode="r") if os.path.exists(maskPath) else None
+            os.utime(valuesPath, None)
+            return values, mask
+        except (IOError, OSError, ValueError):
+            return None
+
+    def _write(self, path, array):
+        #write to a temporary file first, so that concurrent readers never see partial tiles
+        tempPath = "%s.%s.tmp" % (path, uuid.uuid4().hex)
+        try:
+            with open(tempPath, "wb") as tileFile:
+                numpy.save(tileFile, array)
+            if os.path.exists(path):
+                os.remove(path)
+            os.rename(tempPath, path)
+        finally:
+            if os.path.exists(tempPath):
+                os.remove(tempPath)
+
+    def setTile(self, key, row, col, values, isInteger):
+        """
+        Store a tile.  Failures are logged, not raised.
+
+        :param key: key of tiles, from getKey
+        :param row: row of tile
+        :param col: column of tile
+        :param values: masked array of values of tile
+        :param isInteger: True if values are integers
+        """
+
+        valuesPath, maskPath = self._getPaths(key, row, col)
+        try:
+            tileDirectory = os.path.dirname(valuesPath)
+            if not os.path.exists(tileDirectory):
+                os.makedirs(tileDirectory)
+            #mask is written first, so that a values file is never found without its mask
+            mask = numpy.ma.getmaskarray(values)
+            if mask.any():
+                self._write(maskPath, mask)
+            elif os.path.exists(maskPath):
+                os.remove(maskPath)
+            self._write(valuesPath, _getCompactValues(values, isInteger))
+        except (IOError, OSError) as ex:
+            logger.warning("Could not cache projected tile: %s" % (ex))
+
+    def evict(self):
+        """
+        Delete least recently used tiles until total size is within limit
+        """
+
+        entries = []
+        totalBytes = 0
+        for directory, directoryNames, fileNames in os.walk(self.directory):
+            for fileName in fileNames:
+                if not fileName.endswith(".npy") or fileName.endswith(".mask.npy"):
+                    continue
+                valuesPath = os.path.join(directory, fileName)
+                maskPath = "%s.mask.npy" % (valuesPath[:-len(".npy")])
+                try:
+                    size = os.path.getsize(valuesPath)
+                    if os.path.exists(maskPath):
+                        size += os.path.getsize(maskPath)
+                    entries.append((os.path.getmtime(valuesPath), size, valuesPath, maskPath))
+                    totalBytes += size
+                except OSError:
+                    continue
+
+        if totalBytes <= self.maxBytes:
+            return
+        entries.sort()
+        start = time.time()
+        numEvicted = 0
+        for modified, size, valuesPath, maskPath in entries:
+            if totalBytes <= self.maxBytes:
+                break
+            try:
+                #values first, so that a values file is never found without its mask
+                os.remove(valuesPath)
+                if os.path.exists(maskPath):
+                    os.remove(maskPath)
+                totalBytes -= size
+                numEvicted += 1
+            except OSError:
+                #may be in use (memory mapped) by another process
+                continue
+        logger.debug("Evicted %i projected tiles in %.2f seconds" % (numEvicted, time.time() - start))
+
+
+class ProjectedTileReader(object):
+    """
+    Reads windows of a raster layer projected to a target spatial reference, assembled from cached tiles (projecting
+    tiles that are not cached yet).  Has the same interface as RasterWindowReader: windows must be aligned to the pixels
+    of grid, but may extend beyond it; pixels outside the projected layer are masked out.
+    """
+
+    def __init__(self, tileCache, layer, spatialReference):
+        """
+        :param tileCache: ProjectedTileCache
+        :param layer: LayerMetadata of raster layer
+        :param spatialReference: target spatial reference
+        """
+
+        self.tileCache = tileCache
+        self.layer = layer
+        self.spatialReference = spatialReference
+        self.metadata = layer
+        #attribute table of layer applies to projected values, since projection uses nearest neighbor resampling
+        self.raster = layer.dataSource
+        self.isInteger = layer.isInteger
+        self.noDataValue = layer.noDataValue
+        self.cellSize = getProjectedCellSize(layer, spatialReference)
+        self.key = tileCache.getKey(layer, spatialReference, self.cellSize)
+        self.tilesProjected = 0
+        self.tilesRead = 0
+
+        #grid covering the projected extent of the layer, aligned to the origin of the target projection
+        extent = ProjectionUtilities.projectExtent(layer.getExtent(), layer.getSpatialReference(), spatialReference)
+        col = int(math.floor(extent.XMin / self.cellSize))
+        row = int(math.floor(-extent.YMax / self.cellSize))
+        endCol = int(math.ceil(extent.XMax / self.cellSize))
+        endRow = int(math.ceil(-extent.YMin / self.cellSize))
+        self.grid = GridTransform(col * self.cellSize, -row * self.cellSize, self.cellSize, self.cellSize,
+                                  endRow - row, endCol - col)
+
+    def _getTileGrid(self, row, col):
+        tileSize = self.tileCache.tileSize
+        return GridTransform(col * tileSize * self.cellSize, -row * tileSize * self.cellSize, self.cellSize,
+                             self.cellSize, tileSize, tileSize)
+
+    def _projectTile(self, tile):
+        """
+        Project the part of the layer covered by a tile
+
+        :param tile: GridTransform of tile
+        :return: masked array of tile.shape
+        """
+
+        empty = numpy.ma.masked_array(numpy.zeros(tile.shape, dtype=numpy.uint8), mask=True)
+        layerGrid = self.layer.grid
+        layerSpatialReference = self.layer.getSpatialReference()
+        sourceExtent = ProjectionUtilities.projectExtent(arcpy.Extent(tile.xMin, tile.yMin, tile.xMax, tile.yMax),
+                                                         self.spatialReference, layerSpatialReference)
+        padding = CLIP_PADDING * max(layerGrid.cellWidth, layerGrid.cellHeight)
+        xMin, xMax = max(sourceExtent.XMin - padding, layerGrid.xMin), min(sourceExtent.XMax + padding, layerGrid.xMax)
+        yMin, yMax = max(sourceExtent.YMin - padding, layerGrid.yMin), min(sourceExtent.YMax + padding, layerGrid.yMax)
+        if xMin >= xMax or yMin >= yMax:
+            return empty
+
+        with ScratchWorkspace() as scratch:
+            clippedGrid = scratch.getRasterPath("tileData")
+            arcpy.Clip_management(self.layer.dataSource, "%r %r %r %r" % (xMin, yMin, xMax, yMax), clippedGrid,
+                                  "#", "#", "NONE")
+            projectedGrid = scratch.getRasterPath("tileProj")
+            geoTransform = ProjectionUtilities.getGeoTransform(layerSpatialReference, self.spatialReference)
+            #registration point at the origin aligns pixels of all tiles
+            arcpy.ProjectRaster_management(clippedGrid, projectedGrid, self.spatialReference.exportToString(),
+                                           "NEAREST", repr(self.cellSize), geoTransform, "0 0")
+            reader = RasterWindowReader(projectedGrid)
+            values = reader.read(tile)
+            del reader
+        self.tilesProjected += 1
+        return values
+
+    def _getTile(self, row, col):
+        """
+        Return masked array of tile, from cache or projected (and cached)
+        """
+
+        if self.key is not None:
+            cached = self.tileCache.getTile(self.key, row, col)
+            if cached is not None:
+                self.tilesRead += 1
+                values, mask = cached
+                return numpy.ma.masked_array(values, mask=mask if mask is not None else False)
+
+        values = self._projectTile(self._getTileGrid(row, col))
+        if self.key is not None:
+            self.tileCache.setTile(self.key, row, col, values, self.isInteger)
+        return values
+
+    def read(self, window):
+        """
+        Read the pixel values within a window.
+
+        :param window: GridTransform of window, aligned to pixels of grid
+        :return: masked array of window.shape
+        """
+
+        tileSize = self.tileCache.tileSize
+        data = numpy.zeros(window.shape, dtype=numpy.float64 if not self.isInteger else numpy.int64)
+        mask = numpy.ones(window.shape, dtype=bool)
+
+        #limit to the part of the window that overlaps the projected layer, in rows and columns counted from the origin of
+        #the projection (as tiles are)
+        rowOffset, colOffset = self.grid.getOffset(window)
+        originRow, originCol = self.grid.getOffset(self._getTileGrid(0, 0))
+        startRow, startCol = max(rowOffset, 0) - originRow, max(colOffset, 0) - originCol
+        endRow = min(rowOffset + window.rows, self.grid.rows) - originRow
+        endCol = min(colOffset + window.cols, self.grid.cols) - originCol
+        windowRow, windowCol = rowOffset - originRow, colOffset - originCol
+        if endRow <= startRow or endCol <= startCol:
+            return numpy.ma.masked_array(data, mask=mask)
+
+        for tileRow in range(startRow // tileSize, (endRow - 1) // tileSize + 1):
+            for tileCol in range(startCol // tileSize, (endCol - 1) // tileSize + 1):
+                tile = self._getTile(tileRow, tileCol)
+                rows = slice(max(startRow, tileRow * tileSize), min(endRow, (tileRow + 1) * tileSize))
+                cols = slice(max(startCol, tileCol * tileSize), min(endCol, (tileCol + 1) * tileSize))
+                tileValues = tile[rows.start - tileRow * tileSize:rows.stop - tileRow * tileSize,
+                                  cols.start - tileCol * tileSize:cols.stop - tileCol * tileSize]
+                windowSlice = (slice(rows.start - windowRow, rows.stop - windowRow),
+                               slice(cols.start - windowCol, cols.stop - windowCol))
+                data[windowSlice] = tileValues.filled(0)
+                mask[windowSlice] = numpy.ma.getmaskarray(tileValues)
+
+        return numpy.ma.masked_array(data, mask=mask)
+
+    def saveWindow(self, window, path):
+        """
+        Save the pixel values within a window as a raster dataset in the target spatial reference (e.g., for methods that
+        require a raster dataset)
+
+        :param window: GridTransform of window, aligned to pixels of grid
+        :param path: path of raster dataset
+        :return: path
+        """
+
+        values = self.read(window)
+        if self.isInteger:
+            noDataValue = self.noDataValue
+            if noDataValue is None:
+                noDataValue = int(values.min()) - 1 if values.count() else -1
+            data = values.astype(numpy.int32).filled(noDataValue)
+        else:
+            noDataValue = self.noDataValue if self.noDataValue is not None else float(numpy.finfo(numpy.float32).min)
+            data = values.astype(numpy.float32).filled(noDataValue)
+        raster = arcpy.NumPyArrayToRaster(data, arcpy.Point(window.xMin, window.yMin), window.cellWidth,
+                                          window.cellHeight, noDataValue)
+        raster.save(path)
+        del raster
+        arcpy.DefineProjection_management(path, self.spatialReference)
+        return path
+
+    def close(self):
+        """
+        Evict least recently used tiles if cache is too big, once this reader is done
+        """
+
+        logger.debug("Read %i projected tiles from cache, projected %i tiles" % (self.tilesRead, self.tilesProjected))
+        if self.tilesProjected:
+            self.tileCache.evict()
+
+
+def getProjectedTileCache():
+    """
+    Return the projected tile cache configured in settings (PROJECTED_TILE_CACHE_DIR), or None if disabled
+    """
+
+    global _projectedTileCache
+    if not settings.PROJECTED_TILE_CACHE_DIR:
+        return None
+    if (_projectedTileCache is None or _projectedTileCache.directory != settings.PROJECTED_TILE_CACHE_DIR or
+            _projectedTileCache.tileSize != settings.PROJECTED_TILE_SIZE):
+        _projectedTileCache = ProjectedTileCache(settings.PROJECTED_TILE_CACHE_DIR,
+                                                 settings.PROJECTED_TILE_CACHE_MAX_BYTES, settings.PROJECTED_TILE_SIZE)
+    return _projectedTileCache
+
+
+def getProjectedTileReader(layer, spatialReference):
+    """
+    Return ProjectedTileReader for a raster layer projected to spatial reference, or None if the projected tile cache is
+    disabled or the layer cannot be cached
+
+    :param layer: LayerMetadata of raster layer
+    :param spatialReference: target spatial reference
+    """
+
+    tileCache = getProjectedTileCache()
+    if tileCache is None or layer.version is None:
+        return None
+    return ProjectedTileReader(tileCache, layer, spatialReference)
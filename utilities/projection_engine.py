@@ -0,0 +1,355 @@
+"""
+Coordinate transformations calculated in memory with numpy, for the coordinate systems used by the tools: Albers Equal
+Area Conic (including the custom Albers projection created for the area of interest), Web Mercator (Mercator Auxiliary
+Sphere), and geographic coordinates.
+
+Transformations are only available between spatial references on the same datum, where no geographic transformation is
+required.  For other datums or projections, getTransformer returns None and features must be projected with arcpy
+instead.  Formulas are from Snyder, Map Projections: A Working Manual (USGS Professional Paper 1395).
+"""
+
+import re
+import math
+import logging
+
+import numpy
+
+from tool_exceptions import GPToolError
+from utilities.geodesic import getAuthalicQ
+
+
+logger = logging.getLogger(__name__)
+
+NUMBER_PATTERN = r"([-+]?[\d.]+(?:[eE][-+]?\d+)?)"
+
+#maximum number of iterations for inverse Albers latitude
+MAX_ITERATIONS = 15
+
+_coordinateSystems = dict()
+_transformers = dict()
+
+
+def parseWKT(wkt):
+    """
+    Return the properties of a coordinate system needed to transform coordinates, parsed from its well-known text, as a
+    dictionary of:
+
+    * type: Projected or Geographic
+    * datum: name of datum
+    * semiMajorAxis: semi-major axis of spheroid, in meters
+    * flattening: flattening of spheroid (0 for a sphere)
+    * radiansPerUnit: radians per angular unit of geographic coordinate system
+    * primeMeridian: longitude of prime meridian, in angular units
+    * projection: name of projection (None for geographic coordinate systems)
+    * parameters: dictionary of projection parameters, by lower case name
+    * metersPerUnit: meters per linear unit of projection (None for geographic coordinate systems)
+
+    :param wkt: well-known text of coordinate system (ESRI flavor, as exported by arcpy)
+    :return: dictionary of properties, or None if the well-known text could not be parsed
+    """
+
+    wkt = wkt.split(";")[0]
+    spheroidMatch = re.search(r"DATUM\['([^']*)'\s*,\s*SPHEROID\['[^']*'\s*,\s*%s\s*,\s*%s\s*\]" %
+                              (NUMBER_PATTERN, NUMBER_PATTERN), wkt)
+    primeMeridianMatch = re.search(r"PRIMEM\['[^']*'\s*,\s*%s\s*\]\s*,\s*UNIT\['[^']*'\s*,\s*%s\s*\]" %
+                                   (NUMBER_PATTERN, NUMBER_PATTERN), wkt)
+    if not (spheroidMatch and primeMeridianMatch):
+        return None
+
+    inverseFlattening = float(spheroidMatch.group(3))
+    properties = {
+        "type": "Projected" if wkt.startswith("PROJCS") else "Geographic",
+        "datum": spheroidMatch.group(1),
+        "semiMajorAxis": float(spheroidMatch.group(2)),
+        "flattening": 1.0 / inverseFlattening if inverseFlattening else 0.0,
+        "primeMeridian": float(primeMeridianMatch.group(1)),
+        "radiansPerUnit": float(primeMeridianMatch.group(2)),
+        "projection": None,
+        "parameters": dict(),
+        "metersPerUnit": None
+    }
+    if properties["type"] == "Projected":
+        projectionMatch = re.search(r"PROJECTION\['([^']*)'\]", wkt)
+        units = re.findall(r"UNIT\['[^']*'\s*,\s*%s\s*\]" % (NUMBER_PATTERN), wkt)
+        if not projectionMatch or len(units) < 2:
+            return None
+        properties["projection"] = projectionMatch.group(1)
+        properties["metersPerUnit"] = float(units[-1])
+        for name, value in re.findall(r"PARAMETER\['([^']*)'\s*,\s*%s\s*\]" % (NUMBER_PATTERN), wkt):
+            properties["parameters"][name.lower()] = float(value)
+    return properties
+
+
+def _wrapLongitudes(longitudes):
+    """
+    Wrap longitudes (in radians) to the range -pi to pi
+    """
+
+    return numpy.where(numpy.abs(longitudes) > math.pi + 1e-9,
+                       numpy.mod(longitudes + math.pi, 2 * math.pi) - math.pi, longitudes)
+
+
+class CoordinateSystem(object):
+    """
+    Base class of coordinate systems.  Subclasses convert coordinates to and from geographic coordinates in radians
+    (longitudes relative to Greenwich).
+    """
+
+    def __init__(self, properties):
+        """
+        :param properties: dictionary of properties, from parseWKT
+        """
+
+        self.datum = properties["datum"]
+        self.semiMajorAxis = properties["semiMajorAxis"]
+        self.flattening = properties["flattening"]
+        self.eccentricitySquared = self.flattening * (2 - self.flattening)
+        self.radiansPerUnit = properties["radiansPerUnit"]
+        self.primeMeridian = properties["primeMeridian"] * self.radiansPerUnit
+
+    def isSameDatum(self, other):
+        """
+        Return True if no geographic transformation is needed between this and the other coordinate system
+        """
+
+        return (self.datum == other.datum and self.semiMajorAxis == other.semiMajorAxis and
+                self.flattening == other.flattening)
+
+    def toGeographic(self, x, y):
+        """
+        :param x: array of x coordinates
+        :param y: array of y coordinates
+        :return: tuple of arrays of longitudes and latitudes, in radians
+        """
+
+        raise NotImplementedError
+
+    def fromGeographic(self, longitudes, latitudes):
+        """
+        :param longitudes: array of longitudes, in radians
+        :param latitudes: array of latitudes, in radians
+        :return: tuple of arrays of x and y coordinates
+        """
+
+        raise NotImplementedError
+
+
+class GeographicSystem(CoordinateSystem):
+    def toGeographic(self, x, y):
+        return x * self.radiansPerUnit + self.primeMeridian, y * self.radiansPerUnit
+
+    def fromGeographic(self, longitudes, latitudes):
+        return _wrapLongitudes(longitudes - self.primeMeridian) / self.radiansPerUnit, latitudes / self.radiansPerUnit
+
+
+class AlbersSystem(CoordinateSystem):
+    """
+    Albers Equal Area Conic projection on the ellipsoid (Snyder, p. 101)
+    """
+
+    def __init__(self, properties):
+        super(AlbersSystem, self).__init__(properties)
+        parameters = properties["parameters"]
+        self.metersPerUnit = properties["metersPerUnit"]
+        self.falseEasting = parameters.get("false_easting", 0.0)
+        self.falseNorthing = parameters.get("false_northing", 0.0)
+        self.centralMeridian = parameters["central_meridian"] * self.radiansPerUnit + self.primeMeridian
+        latitude1 = parameters["standard_parallel_1"] * self.radiansPerUnit
+        latitude2 = parameters.get("standard_parallel_2", parameters["standard_parallel_1"]) * self.radiansPerUnit
+        latitude0 = parameters.get("latitude_of_origin", 0.0) * self.radiansPerUnit
+
+        m1 = self._getM(latitude1)
+        m2 = self._getM(latitude2)
+        q1 = self._getQ(latitude1)
+        q2 = self._getQ(latitude2)
+        if abs(latitude1 - latitude2) < 1e-10:
+            self.n = math.sin(latitude1)
+        else:
+            self.n = (m1 ** 2 - m2 ** 2) / (q2 - q1)
+        self.c = m1 ** 2 + self.n * q1
+        self.rho0 = self._getRho(self._getQ(latitude0))
+        #q at the poles, beyond which inverse latitudes are undefined
+        self.qPole = float(getAuthalicQ(numpy.array(1.0), self.eccentricitySquared))
+
+    def _getM(self, latitude):
+        return math.cos(latitude) / math.sqrt(1 - self.eccentricitySquared * math.sin(latitude) ** 2)
+
+    def _getQ(self, latitudes):
+        return getAuthalicQ(numpy.sin(latitudes), self.eccentricitySquared)
+
+    def _getRho(self, q):
+        return self.semiMajorAxis * numpy.sqrt(numpy.maximum(self.c - self.n * q, 0)) / self.n
+
+    def getScaleFactors(self, latitudes):
+        """
+        Return the scale factor along the parallel at each latitude (the scale factor along meridians is its
+        reciprocal, since the projection is equal area)
+
+        :param latitudes: array of latitudes, in radians
+        """
+
+        m = numpy.cos(latitudes) / numpy.sqrt(1 - self.eccentricitySquared * numpy.sin(latitudes) ** 2)
+        return self._getRho(self._getQ(latitudes)) * self.n / (self.semiMajorAxis * m)
+
+    def fromGeographic(self, longitudes, latitudes):
+        rho = self._getRho(self._getQ(latitudes))
+        theta = self.n * _wrapLongitudes(longitudes - self.centralMeridian)
+        x = rho * numpy.sin(theta) / self.metersPerUnit + self.falseEasting
+        y = (self.rho0 - rho * numpy.cos(theta)) / self.metersPerUnit + self.falseNorthing
+        return x, y
+
+    def toGeographic(self, x, y):
+        sign = 1 if self.n > 0 else -1
+        dx = (x - self.falseEasting) * self.metersPerUnit * sign
+        dy = (self.rho0 - (y - self.falseNorthing) * self.metersPerUnit) * sign
+        rho = numpy.hypot(dx, dy)
+        theta = numpy.arctan2(dx, dy)
+        q = numpy.clip((self.c - (rho * self.n / self.semiMajorAxis) ** 2) / self.n, -self.qPole, self.qPole)
+        longitudes = self.centralMeridian + theta / self.n
+
+        latitudes = numpy.arcsin(numpy.clip(q / 2.0, -1, 1))
+        if self.eccentricitySquared > 0:
+            #iterate (Snyder eq. 3-16), except at the poles where the correction is undefined
+            notPole = numpy.abs(q) < self.qPole - 1e-12
+            e2 = self.eccentricitySquared
+            for i in range(MAX_ITERATIONS):
+                sinLatitudes = numpy.sin(latitudes)
+                cosLatitudes = numpy.where(notPole, numpy.cos(latitudes), 1)
+                denominator = 1 - e2 * sinLatitudes ** 2
+                delta = numpy.where(notPole, denominator ** 2 / (2 * cosLatitudes) * (
+                    q / (1 - e2) - getAuthalicQ(sinLatitudes, e2) / (1 - e2)), 0)
+                latitudes = latitudes + delta
+                if numpy.abs(delta).max() < 1e-12:
+                    break
+            latitudes = numpy.where(notPole, latitudes, numpy.sign(q) * math.pi / 2)
+        return longitudes, latitudes
+
+
+class WebMercatorSystem(CoordinateSystem):
+    """
+    Mercator projection on the auxiliary sphere of the semi-major axis of the datum (Web Mercator)
+    """
+
+    def __init__(self, properties):
+        super(WebMercatorSystem, self).__init__(properties)
+        parameters = properties["parameters"]
+        self.metersPerUnit = properties["metersPerUnit"]
+        self.falseEasting = parameters.get("false_easting", 0.0)
+        self.falseNorthing = parameters.get("false_northing", 0.0)
+        self.centralMeridian = parameters.get("central_meridian", 0.0) * self.radiansPerUnit + self.primeMeridian
+        self.radius = self.semiMajorAxis * math.cos(parameters.get("standard_parallel_1", 0.0) * self.radiansPerUnit)
+
+    def fromGeographic(self, longitudes, latitudes):
+        latitudes = numpy.clip(latitudes, -math.pi / 2 + 1e-10, math.pi / 2 - 1e-10)
+        x = self.radius * _wrapLongitudes(longitudes - self.centralMeridian) / self.metersPerUnit + self.falseEasting
+        y = self.radius * numpy.log(numpy.tan(math.pi / 4 + latitudes / 2)) / self.metersPerUnit + self.falseNorthing
+        return x, y
+
+    def toGeographic(self, x, y):
+        longitudes = (x - self.falseEasting) * self.metersPerUnit / self.radius + self.centralMeridian
+        latitudes = math.pi / 2 - 2 * numpy.arctan(numpy.exp(-(y - self.falseNorthing) * self.metersPerUnit /
+                                                             self.radius))
+        return longitudes, latitudes
+
+
+def getCoordinateSystem(wkt):
+    """
+    Return CoordinateSystem for well-known text, or None if its projection is not supported
+
+    :param wkt: well-known text of coordinate system
+    """
+
+    if not _coordinateSystems.has_key(wkt):
+        properties = parseWKT(wkt)
+        coordinateSystem = None
+        if properties is None:
+            logger.debug("Could not parse coordinate system: %s" % (wkt))
+        elif properties["type"] == "Geographic":
+            coordinateSystem = GeographicSystem(properties)
+        elif properties["projection"] == "Albers" and properties["parameters"].has_key("standard_parallel_1"):
+            coordinateSystem = AlbersSystem(properties)
+        elif (properties["projection"] == "Mercator_Auxiliary_Sphere" and
+              properties["parameters"].get("auxiliary_sphere_type", 0.0) == 0):
+            coordinateSystem = WebMercatorSystem(properties)
+        _coordinateSystems[wkt] = coordinateSystem
+    return _coordinateSystems[wkt]
+
+
+class Transformer(object):
+    """
+    Transforms coordinates from one coordinate system to another, on the same datum
+    """
+
+    def __init__(self, source, target):
+        """
+        :param source: source CoordinateSystem
+        :param target: target CoordinateSystem
+        """
+
+        self.source = source
+        self.target = target
+
+    def transform(self, x, y):
+        """
+        Transform coordinates
+
+        :param x: array of x coordinates
+        :param y: array of y coordinates
+        :return: tuple of arrays of x and y coordinates in target coordinate system
+        """
+
+        longitudes, latitudes = self.source.toGeographic(numpy.asarray(x, dtype=numpy.float64),
+                                                         numpy.asarray(y, dtype=numpy.float64))
+        return self.target.fromGeographic(longitudes, latitudes)
+
+    def transformPart(self, part):
+        """
+        Transform a ring, path, or set of points
+
+        :param part: array of x, y coordinates
+        :return: array of x, y coordinates in target coordinate system
+        """
+
+        x, y = self.transform(part[:, 0], part[:, 1])
+        return numpy.column_stack((x, y))
+
+
+def getTransformer(srcSR, targetSR):
+    """
+    Return Transformer between spatial references, or None if either projection is not supported or a geographic
+    transformation is required (in which case arcpy must be used)
+
+    :param srcSR: source ArcGIS spatial reference object
+    :param targetSR: target ArcGIS spatial reference object
+    """
+
+    key = (srcSR.exportToString(), targetSR.exportToString())
+    if not _transformers.has_key(key):
+        source = getCoordinateSystem(key[0])
+        target = getCoordinateSystem(key[1])
+        transformer = None
+        if source is not None and target is not None and source.isSameDatum(target):
+            transformer = Transformer(source, target)
+        _transformers[key] = transformer
+    return _transformers[key]
+
+
+def getPartsExtent(parts):
+    """
+    Return the bounds of parts.  Raises GPToolError if there are no coordinates, or the bounds are not finite (e.g.,
+    coordinates outside the valid area of the projection they were transformed to).
+
+    :param parts: list of arrays of x, y coordinates
+    :return: tuple of xMin, yMin, xMax, yMax
+    """
+
+    parts = [part for part in parts if len(part)]
+    if not parts:
+        raise GPToolError("EMPTY_GEOMETRY: area of interest has no coordinates")
+    coordinates = numpy.concatenate(parts)
+    xMin, yMin = coordinates.min(axis=0)
+    xMax, yMax = coordinates.max(axis=0)
+    bounds = (float(xMin), float(yMin), float(xMax), float(yMax))
+    if not numpy.all(numpy.isfinite(bounds)):
+        raise GPToolError("INVALID_GEOMETRY: bounds of area of interest are not finite: %s" % (str(bounds)))
+    return bounds
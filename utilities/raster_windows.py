@@ -0,0 +1,76 @@
+"""
+Read raster datasets in windows, so that large rasters can be processed in blocks of bounded size without writing
+intermediate rasters.
+"""
+
+import logging
+
+import arcpy
+import numpy
+
+from utilities.grid import getGridTransform
+
+logger = logging.getLogger(__name__)
+
+
+class RasterWindowReader(object):
+    """
+    Reads windows of a raster dataset into numpy masked arrays, with NoData values masked out.  Windows must be aligned
+    to the pixels of the raster, but may extend beyond it; pixels outside the raster are masked out.
+    """
+
+    def __init__(self, raster, metadata=None):
+        """
+        :param raster: path to raster dataset, or arcpy Raster object
+        :param metadata: optional LayerMetadata of raster dataset (from metadata catalog), so that raster does not need
+            to be opened to describe it
+        """
+
+        self.metadata = metadata
+        if metadata is not None:
+            self.raster = raster
+            self.grid = metadata.grid
+            self.isInteger = metadata.isInteger
+            self.noDataValue = metadata.noDataValue
+            return
+
+        if not isinstance(raster, arcpy.Raster):
+            raster = arcpy.Raster(raster)
+        self.raster = raster
+        self.grid = getGridTransform(raster)
+        self.isInteger = raster.isInteger
+        self.noDataValue = raster.noDataValue
+
+    def read(self, window):
+        """
+        Read the pixel values within a window.
+
+        :param window: GridTransform of window, aligned to pixels of raster
+        :return: masked array of window.shape
+        """
+
+        rowOffset, colOffset = self.grid.getOffset(window)
+        #limit to the part of the window that overlaps the raster
+        startRow, startCol = max(rowOffset, 0), max(colOffset, 0)
+        endRow = min(rowOffset + window.rows, self.grid.rows)
+        endCol = min(colOffset + window.cols, self.grid.cols)
+
+        data = numpy.zeros(window.shape, dtype=numpy.float64 if not self.isInteger else numpy.int64)
+        mask = numpy.ones(window.shape, dtype=bool)
+        if endRow > startRow and endCol > startCol:
+            readGrid = self.grid.window(startRow, startCol, endRow - startRow, endCol - startCol)
+            #offset lower left corner by a fraction of a pixel, so that it falls unambiguously in the correct pixel
+            lowerLeft = arcpy.Point(readGrid.xMin + 0.25 * readGrid.cellWidth, readGrid.yMin + 0.25 * readGrid.cellHeight)
+            values = arcpy.RasterToNumPyArray(self.raster, lowerLeft, readGrid.cols, readGrid.rows)
+            valid = numpy.ones(values.shape, dtype=bool)
+            if self.noDataValue is not None:
+                valid &= values != self.noDataValue
+            if values.dtype.kind == "f":
+                valid &= ~numpy.isnan(values)
+
+            rows = slice(startRow - rowOffset, endRow - rowOffset)
+            cols = slice(startCol - colOffset, endCol - colOffset)
+            data[rows, cols] = values
+            mask[rows, cols] = ~valid
+
+        return numpy.ma.masked_array(data, mask=mask)
@@ -0,0 +1,159 @@
+"""
+Persistent cache of tabulation results for each layer, stored on local disk.
+
+Results are keyed by a hash of the area of interest geometry, the layer data source and its version (modification time
+and size of the files behind it), the normalized layer configuration, the target projection, and the settings that
+affect results.  Changing any source dataset changes its version, so stale results are never returned.  Entries are
+evicted in least recently used order when the total size of the cache exceeds its limit.
+"""
+
+import os
+import json
+import time
+import uuid
+import hashlib
+import logging
+
+import settings
+from utilities.PathUtils import getDataSourceVersion
+
+
+logger = logging.getLogger(__name__)
+
+#Increment when the structure of results changes, to invalidate previously cached results
+CACHE_VERSION = 1
+
+_resultCache = None
+
+
+def getCacheKey(geometryHash, dataSource, layerConfig, spatialReference):
+    """
+    Return cache key for results of a layer, or None if results of this layer cannot be cached
+
+    :param geometryHash: hash of area of interest geometry (see FeatureClassWrapper.getGeometryHash)
+    :param dataSource: path to data source of layer
+    :param layerConfig: subset of config for a single layer, before it is used for tabulation
+    :param spatialReference: spatial reference object with target projection
+    """
+
+    version = getDataSourceVersion(dataSource)
+    if version is None:
+        return None
+    keySettings = [CACHE_VERSION, settings.PRECISE_MAX_PIXELS, settings.PRECISE_COVERAGE_METHOD,
+                   settings.RASTER_STREAMING, settings.GEOGRAPHIC_AREA_METHOD,
+                   bool(settings.PROJECTED_TILE_CACHE_DIR) and settings.PROJECTED_TILE_SIZE]
+    digest = hashlib.sha1()
+    for value in (geometryHash, os.path.normcase(os.path.abspath(dataSource)), version,
+                  json.dumps(layerConfig, sort_keys=True), spatialReference.exportToString(), json.dumps(keySettings)):
+        digest.update(unicode(value).encode("utf-8"))
+        digest.update("\0")
+    return digest.hexdigest()
+
+
+class ResultCache(object):
+    """
+    Cache of JSON results in a directory, with one file per entry.  Reading an entry marks it as recently used by
+    updating its modification time.
+    """
+
+    def __init__(self, directory, maxBytes):
+        """
+        :param directory: directory for cache files, created if necessary
+        :param maxBytes: maximum total size of cache files
+        """
+
+        self.directory = directory
+        self.maxBytes = maxBytes
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+    def _getPath(self, key):
+        return os.path.join(self.directory, "%s.json" % (key))
+
+    def get(self, key):
+        """
+        Return cached results for key, or None if not in cache
+
+        :param key: cache key
+        """
+
+        path = self._getPath(key)
+        try:
+            with open(path, "rb") as cacheFile:
+                value = json.loads(cacheFile.read())
+            os.utime(path, None)
+            return value
+        except (IOError, OSError, ValueError):
+            return None
+
+    def set(self, key, value):
+        """
+        Store results for key, then evict least recently used entries if cache is too big.  Failures are logged, not
+        raised.
+
+        :param key: cache key
+        :param value: results that can be serialized to JSON
+        """
+
+        path = self._getPath(key)
+        #write to a temporary file first, so that concurrent readers never see partial entries
+        tempPath = "%s.%s.tmp" % (path, uuid.uuid4().hex)
+        try:
+            with open(tempPath, "wb") as cacheFile:
+                cacheFile.write(json.dumps(value))
+            if os.path.exists(path):
+                os.remove(path)
+            os.rename(tempPath, path)
+        except (IOError, OSError, TypeError, ValueError) as ex:
+            logger.warning("Could not cache results: %s" % (ex))
+            if os.path.exists(tempPath):
+                os.remove(tempPath)
+            return
+        self._evict()
+
+    def _evict(self):
+        """
+        Delete least recently used entries until total size is within limit
+        """
+
+        entries = []
+        totalBytes = 0
+        for fileName in os.listdir(self.directory):
+            if not fileName.endswith(".json"):
+                continue
+            path = os.path.join(self.directory, fileName)
+            try:
+                size = os.path.getsize(path)
+                entries.append((os.path.getmtime(path), size, path))
+                totalBytes += size
+            except OSError:
+                continue
+
+        if totalBytes <= self.maxBytes:
+            return
+        entries.sort()
+        start = time.time()
+        numEvicted = 0
+        for modified, size, path in entries:
+            if totalBytes <= self.maxBytes:
+                break
+            try:
+                os.remove(path)
+                totalBytes -= size
+                numEvicted += 1
+            except OSError:
+                continue
+        logger.debug("Evicted %i entries from result cache in %.2f seconds" % (numEvicted, time.time() - start))
+
+
+def getResultCache():
+    """
+    Return the result cache configured in settings (RESULT_CACHE_DIR), or None if caching is disabled
+    """
+
+    global _resultCache
+    if not settings.RESULT_CACHE_DIR:
+        return None
+    if _resultCache is None or _resultCache.directory != settings.RESULT_CACHE_DIR:
+        _resultCache = ResultCache(settings.RESULT_CACHE_DIR, settings.RESULT_CACHE_MAX_BYTES)
+    return _resultCache
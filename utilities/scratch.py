@@ -0,0 +1,122 @@
+"""
+Request-scoped scratch space for intermediate datasets.
+
+Intermediate datasets are given unique names, so that concurrent tabulations in the same process or the same scratch
+workspace do not overwrite each other's data.  All datasets created through a ScratchWorkspace are deleted when it is
+closed, including after failures.
+"""
+
+import os
+import uuid
+import logging
+
+import arcpy
+
+from utilities.PathUtils import get_scratch_GDB
+
+
+logger = logging.getLogger(__name__)
+
+
+def getUniqueName(name):
+    """
+    Return a unique name for a dataset, based on name (e.g., drawingFC_0123456789abcdef).  Names start with a letter and
+    only contain letters, numbers and underscores, so they are valid in all workspaces.
+
+    :param name: base name of dataset
+    """
+
+    return "%s_%s" % (name, uuid.uuid4().hex[:16])
+
+
+class ScratchWorkspace(object):
+    """
+    Hands out unique names for intermediate datasets in the scratch folder, scratch geodatabase, or IN_MEMORY workspace,
+    and deletes those datasets when closed.  Use as a context manager:
+
+        with ScratchWorkspace() as scratch:
+            clippedGrid = scratch.getRasterPath("data")
+            ...
+
+    The number of bytes written to the scratch folder is tracked for files in the scratch folder; datasets in
+    geodatabases and IN_MEMORY are not included.
+    """
+
+    def __init__(self):
+        self._paths = []
+        self.bytesWritten = 0
+
+    def _track(self, path):
+        self._paths.append(path)
+        return path
+
+    def getRasterPath(self, name, extension=".img"):
+        """
+        Return unique path for a raster dataset in the scratch folder
+
+        :param name: base name of raster
+        :param extension: file extension that determines the raster format
+        """
+
+        return self._track(os.path.join(arcpy.env.scratchWorkspace, getUniqueName(name) + extension))
+
+    def getGDBPath(self, name):
+        """
+        Return unique path for a feature class or table in the scratch geodatabase
+
+        :param name: base name of dataset
+        """
+
+        return self._track(os.path.join(get_scratch_GDB(), getUniqueName(name)))
+
+    def getMemoryPath(self, name):
+        """
+        Return unique path for a feature class or table in the IN_MEMORY workspace
+
+        :param name: base name of dataset
+        """
+
+        return self._track("IN_MEMORY/%s" % (getUniqueName(name)))
+
+    def getLayerName(self, name):
+        """
+        Return unique name for a feature or raster layer
+
+        :param name: base name of layer
+        """
+
+        return self._track(getUniqueName(name))
+
+    def _getFileSize(self, path):
+        """
+        Return size of files that make up a dataset in the scratch folder (including auxiliary files)
+        """
+
+        directory, fileName = os.path.split(path)
+        if not os.path.isfile(path):
+            return 0
+        baseName = os.path.splitext(fileName)[0]
+        return sum([os.path.getsize(os.path.join(directory, otherName)) for otherName in os.listdir(directory)
+                    if otherName.startswith(baseName) and os.path.isfile(os.path.join(directory, otherName))])
+
+    def close(self):
+        """
+        Delete all datasets created in this workspace.  Failures to delete are logged, but not raised.
+        """
+
+        while self._paths:
+            path = self._paths.pop()
+            try:
+                self.bytesWritten += self._getFileSize(path)
+                if arcpy.Exists(path):
+                    arcpy.Delete_management(path)
+            except:
+                logger.warning("Could not delete scratch dataset: %s" % (path))
+        logger.debug("Scratch workspace closed, %i bytes written to scratch folder" % (self.bytesWritten))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
@@ -0,0 +1,236 @@
+"""
+Tally counts and quantities of values using numpy.
+
+The tally strategy is chosen based on the type, range, and cardinality of the values:
+
+* offset bincount: integer values with a compact range (including negative values)
+* sort and reduce: integer values with a sparse or very large range (e.g., ID rasters)
+* unique + bincount: any other values (floating point, strings)
+
+All strategies run in a single O(n) or O(n log n) pass and return compact arrays, sorted by value.
+
+Values can also be tallied by classes of values in a single pass, using ClassBinner.
+"""
+
+import logging
+from numbers import Number
+
+import numpy
+
+logger = logging.getLogger(__name__)
+
+
+#Largest range of integer values (max - min + 1) that will be tallied using an offset bincount
+BINCOUNT_MAX_RANGE = 2 ** 24
+#Offset bincount is used if the range of values is within this many bins per value tallied (or is small enough anyway)
+BINCOUNT_BINS_PER_VALUE = 4
+BINCOUNT_MIN_RANGE = 2 ** 16
+
+
+def _getValidValues(values, weights=None):
+    """
+    Flatten values and weights, removing any masked values
+    """
+
+    mask = numpy.ma.getmask(values)
+    values = numpy.ma.getdata(values).ravel()
+    if weights is not None:
+        weights = numpy.ma.getdata(weights).ravel().astype(numpy.float64)
+    if mask is not numpy.ma.nomask:
+        valid = ~mask.ravel()
+        values = values[valid]
+        if weights is not None:
+            weights = weights[valid]
+    return values, weights
+
+
+def getTallyMethod(values):
+    """
+    Return the name of the tally strategy appropriate for values: bincount, sort, or unique
+
+    :param values: flat array of values, without masked values
+    """
+
+    if not numpy.issubdtype(values.dtype, numpy.integer) or not len(values):
+        return "unique"
+    valueRange = int(values.max()) - int(values.min()) + 1
+    if valueRange <= BINCOUNT_MAX_RANGE and valueRange <= max(BINCOUNT_MIN_RANGE, BINCOUNT_BINS_PER_VALUE * len(values)):
+        return "bincount"
+    return "sort"
+
+
+def tallyValues(values, weights=None):
+    """
+    Tally the number of occurrences and sum of weights for each unique value.
+
+    :param values: array of values (may be a masked array, masked values are excluded)
+    :param weights: optional array of weights (e.g., quantities measured for each pixel) of same shape as values
+    :return: tuple of (unique values, counts, sum of weights) arrays, sorted by value.  Sum of weights is None if weights
+        are not provided.
+    """
+
+    values, weights = _getValidValues(values, weights)
+    method = getTallyMethod(values)
+    logger.debug("Tallying %i values using %s method" % (len(values), method))
+
+    if not len(values):
+        return values, numpy.zeros(0, dtype=numpy.int64), None if weights is None else numpy.zeros(0)
+
+    if method == "bincount":
+        offset = int(values.min())
+        bins = (values.astype(numpy.int64) - offset).astype(numpy.intp)
+        counts = numpy.bincount(bins)
+        present = numpy.flatnonzero(counts)
+        sums = None
+        if weights is not None:
+            sums = numpy.bincount(bins, weights=weights)[present]
+        return (present + offset).astype(values.dtype), counts[present], sums
+
+    elif method == "sort":
+        if weights is not None:
+            order = numpy.argsort(values, kind="mergesort")
+            sortedValues = values[order]
+        else:
+            sortedValues = numpy.sort(values)
+        starts = numpy.concatenate(([0], numpy.flatnonzero(sortedValues[1:] != sortedValues[:-1]) + 1))
+        counts = numpy.diff(numpy.append(starts, len(sortedValues)))
+        sums = None
+        if weights is not None:
+            sums = numpy.add.reduceat(weights[order], starts)
+        return sortedValues[starts], counts, sums
+
+    uniqueValues, inverse = numpy.unique(values, return_inverse=True)
+    counts = numpy.bincount(inverse, minlength=len(uniqueValues))
+    sums = None
+    if weights is not None:
+        sums = numpy.bincount(inverse, weights=weights, minlength=len(uniqueValues))
+    return uniqueValues, counts, sums
+
+
+
+class ClassBinner(object):
+    """
+    Classify values into classes, where each class is a range of values: greater than or equal to lower value and less
+    than upper value.
+
+    Class ranges are split into elementary intervals between the sorted unique class breaks, so that all values can be
+    assigned to an interval in a single pass using searchsorted, regardless of whether the classes are sorted, have gaps
+    between them, or overlap.  Intervals are then mapped back to the classes that contain them.
+    """
+
+    def __init__(self, classBreaks):
+        """
+        :param classBreaks: list of [lower, upper] class ranges
+        """
+
+        self.classBreaks = classBreaks
+        ranges = numpy.array([(float(classRange[0]), float(classRange[1])) for classRange in classBreaks],
+                             dtype=numpy.float64).reshape(-1, 2)
+        self._edges = numpy.unique(ranges.ravel())
+        self._numIntervals = max(len(self._edges) - 1, 0)
+        #interval i spans edges[i] to edges[i + 1]; covered[i, j] is True if interval i is within class j
+        self._covered = numpy.logical_and(ranges[:, 0][numpy.newaxis, :] <= self._edges[:-1][:, numpy.newaxis],
+                                          ranges[:, 1][numpy.newaxis, :] >= self._edges[1:][:, numpy.newaxis])
+        #first class containing each interval, or -1 if interval is in a gap between classes
+        self._intervalClass = numpy.zeros(self._numIntervals, dtype=numpy.intp) - 1
+        if self._numIntervals:
+            self._intervalClass = numpy.where(self._covered.any(axis=1), self._covered.argmax(axis=1), -1)
+
+    def _getIntervals(self, values):
+        """
+        Return index of elementary interval for each value, or -1 if outside all intervals (including NaN)
+        """
+
+        intervals = numpy.searchsorted(self._edges, values, side="right") - 1
+        intervals[intervals >= self._numIntervals] = -1
+        return intervals
+
+    def classify(self, values):
+        """
+        Return the index of the first class that contains each value, or -1 if not in any class
+
+        :param values: array of numeric values
+        """
+
+        values = numpy.asarray(values, dtype=numpy.float64)
+        if not self._numIntervals:
+            return numpy.zeros(values.shape, dtype=numpy.intp) - 1
+        intervals = self._getIntervals(values)
+        return numpy.where(intervals >= 0, self._intervalClass[intervals], -1)
+
+    def getClass(self, value):
+        """
+        Return the index of the first class that contains a single value, or None if not in any class or not numeric
+
+        :param value: value to classify
+        """
+
+        if not isinstance(value, Number) or isinstance(value, bool):
+            return None
+        classIndex = int(self.classify(numpy.array([value]))[0])
+        return classIndex if classIndex >= 0 else None
+
+    def tally(self, values, weights=None, firstClassOnly=False):
+        """
+        Tally the number of values and sum of weights within each class.
+
+        :param values: array of numeric values (may be a masked array, masked values are excluded)
+        :param weights: optional array of weights (e.g., quantities measured for each pixel) of same shape as values
+        :param firstClassOnly: if True, values are only tallied in the first class that contains them; otherwise values
+            are tallied in every class that contains them
+        :return: tuple of (counts, sum of weights) arrays with an entry for each class.  Sum of weights is None if
+            weights are not provided.
+        """
+
+        values, weights = _getValidValues(values, weights)
+        numClasses = len(self.classBreaks)
+        if not self._numIntervals:
+            return numpy.zeros(numClasses, dtype=numpy.int64), None if weights is None else numpy.zeros(numClasses)
+
+        intervals = self._getIntervals(values.astype(numpy.float64))
+        valid = intervals >= 0
+        intervals = intervals[valid]
+        if weights is not None:
+            weights = weights[valid]
+
+        if firstClassOnly:
+            classes = self._intervalClass[intervals]
+            inClass = classes >= 0
+            counts = numpy.bincount(classes[inClass], minlength=numClasses)
+            sums = None
+            if weights is not None:
+                sums = numpy.bincount(classes[inClass], weights=weights[inClass], minlength=numClasses)
+            return counts, sums
+
+        intervalCounts = numpy.bincount(intervals, minlength=self._numIntervals)
+        counts = numpy.dot(intervalCounts, self._covered).astype(numpy.int64)
+        sums = None
+        if weights is not None:
+            sums = numpy.dot(numpy.bincount(intervals, weights=weights, minlength=self._numIntervals), self._covered)
+        return counts, sums
+
+
+def sumByValue(values, counts, weights=None):
+    """
+    Sum counts and weights for each unique value, such as to combine tallies of separate blocks of a raster, or to
+    summarize records of a table.
+
+    :param values: array of values of any type that can be sorted
+    :param counts: array of integer counts for each value
+    :param weights: optional array of weights (e.g., quantities) for each value
+    :return: tuple of (unique values, sum of counts, sum of weights) arrays, sorted by value.  Sum of weights is None if
+        weights are not provided.
+    """
+
+    values = numpy.asarray(values)
+    counts = numpy.asarray(counts, dtype=numpy.float64)
+    if not len(values):
+        return values, numpy.zeros(0, dtype=numpy.int64), None if weights is None else numpy.zeros(0)
+
+    uniqueValues, inverse = numpy.unique(values, return_inverse=True)
+    summedCounts = numpy.bincount(inverse, weights=counts, minlength=len(uniqueValues)).round().astype(numpy.int64)
+    summedWeights = None
+    if weights is not None:
+        summedWeights = numpy.bincount(inverse, weights=numpy.asarray(weights, dtype=numpy.float64),
+                                       minlength=len(uniqueValues))
+    return uniqueValues, summedCounts, summedWeights
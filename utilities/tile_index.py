@@ -0,0 +1,300 @@
+"""
+Tile indexes of raster datasets: histograms of values (integer rasters) and running moments (all rasters) of each tile,
+at several tile sizes, built offline as a pyramid of pre-aggregated tiles.
+
+Tiles entirely within a polygon area of interest are tabulated from the index using the largest tiles that fit, without
+reading their pixels; only the smallest tiles that contain edges of the area of interest are read.  The time to tabulate
+a large area of interest is then proportional to its perimeter rather than its area.
+
+Indexes are stored as one .npz file per raster in TILE_INDEX_DIR (settings), and are only used while the version of the
+raster (modification time and size of its files) matches the version they were built from.  Build indexes with:
+
+    python -m utilities.tile_index <path to raster> [<path to raster> ...]
+"""
+
+import os
+import sys
+import uuid
+import hashlib
+import logging
+
+import numpy
+
+import settings
+from utilities.grid import GridTransform
+from utilities.moments import RunningStatistics
+from utilities.aoi_decomposition import AOIDecomposition
+from utilities.raster_windows import RasterWindowReader
+from utilities.tally import tallyValues
+from utilities.PathUtils import getDataSourceVersion
+
+
+logger = logging.getLogger(__name__)
+
+#Tile indexes loaded in this process: path => (modification time of index file, TileIndex)
+_tileIndexes = dict()
+
+
+def getTileIndexPath(dataSource, directory=None):
+    """
+    Return path of the tile index file of a raster
+
+    :param dataSource: path to raster dataset
+    :param directory: directory of tile indexes, defaults to TILE_INDEX_DIR in settings
+    """
+
+    key = hashlib.sha1(os.path.normcase(os.path.abspath(dataSource)).encode("utf-8")).hexdigest()
+    return os.path.join(directory or settings.TILE_INDEX_DIR, "%s.npz" % (key))
+
+
+class TileIndex(object):
+    """
+    Summaries of the tiles of a raster at several tile sizes.  For each tile size, tiles are numbered in row major order
+    from the upper left corner of the raster; tiles along the right and bottom edges extend beyond the raster.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: path of tile index file
+        """
+
+        self.path = path
+        data = numpy.load(path)
+        try:
+            self._arrays = dict([(key, data[key]) for key in data.files])
+        finally:
+            data.close()
+        self.version = self._arrays["version"].item()
+        self.grid = GridTransform(*([float(value) for value in self._arrays["origin"]] +
+                                    [int(value) for value in self._arrays["shape"]]))
+        self.isInteger = bool(self._arrays["isInteger"])
+        self.tileSizes = [int(tileSize) for tileSize in self._arrays["tileSizes"]]
+
+    def _getArray(self, name, tileSize):
+        return self._arrays["%s_%i" % (name, tileSize)]
+
+    def getTileGrid(self, tileSize):
+        """
+        Return grid of tiles of a tile size, where each tile is a pixel
+
+        :param tileSize: number of rows and columns of pixels in each tile
+        """
+
+        return self.grid.getBlockGrid(tileSize)
+
+    def decompose(self, rings, window):
+        """
+        Split a window of the raster into tiles entirely within polygon rings, which are tabulated from this index, and
+        the smallest tiles that contain edges of the rings, which must be read.  Tiles entirely outside the rings are
+        excluded.
+
+        :param rings: list of arrays of x, y coordinates of each ring, in spatial reference of raster
+        :param window: GridTransform of window aligned to pixels of raster, covering extent of rings
+        :return: tuple of (list of (tile size, array of numbers of tiles within rings), number of pixels within those
+            tiles (including those beyond the raster), list of GridTransform of tiles that must be read)
+        """
+
+        insideTiles = []
+        numPixels = 0
+        parent = None
+        for tileSize in self.tileSizes:
+            tileGrid = self.getTileGrid(tileSize)
+            tileWindow = tileGrid.getWindowForExtent(window.xMin, window.yMin, window.xMax, window.yMax, clip=False)
+            rowOffset, colOffset = tileGrid.getOffset(tileWindow)
+            decomposition = AOIDecomposition(rings, tileWindow, "Polygon")
+            inside = decomposition.inside
+
+            #exclude tiles within larger tiles that are already inside
+            newInside = inside
+            if parent is not None:
+                parentSize, parentRowOffset, parentColOffset, parentInside = parent
+                parentRows = (rowOffset + numpy.arange(tileWindow.rows)) * tileSize // parentSize - parentRowOffset
+                parentCols = (colOffset + numpy.arange(tileWindow.cols)) * tileSize // parentSize - parentColOffset
+                newInside = inside & ~parentInside[numpy.ix_(parentRows, parentCols)]
+            parent = (tileSize, rowOffset, colOffset, inside)
+
+            rows, cols = numpy.nonzero(newInside)
+            rows = rows + rowOffset
+            cols = cols + colOffset
+            numPixels += len(rows) * tileSize * tileSize
+            inRaster = (rows >= 0) & (rows < tileGrid.rows) & (cols >= 0) & (cols < tileGrid.cols)
+            insideTiles.append((tileSize, rows[inRaster] * tileGrid.cols + cols[inRaster]))
+
+        blocks = [self.grid.window((rowOffset + row) * tileSize, (colOffset + col) * tileSize, tileSize, tileSize)
+                  for row, col in zip(*numpy.nonzero(decomposition.boundary))]
+        return insideTiles, numPixels, blocks
+
+    def getCount(self, insideTiles):
+        """
+        Return the number of pixels with data within tiles
+
+        :param insideTiles: list of (tile size, array of numbers of tiles), from decompose
+        """
+
+        return sum([int(self._getArray("counts", tileSize)[tiles].sum()) for tileSize, tiles in insideTiles])
+
+    def getStatistics(self, insideTiles):
+        """
+        Return RunningStatistics of pixel values within tiles
+
+        :param insideTiles: list of (tile size, array of numbers of tiles), from decompose
+        """
+
+        statistics = RunningStatistics()
+        for tileSize, tiles in insideTiles:
+            statistics.merge(RunningStatistics.fromBlocks(*[self._getArray(name, tileSize)[tiles]
+                                                            for name in ("counts", "sums", "m2s", "mins", "maxs")]))
+        return statistics
+
+    def getValueCounts(self, insideTiles):
+        """
+        Return the number of pixels of each value within tiles of an integer raster.  Values are repeated for each tile
+        (combine with tally.sumByValue).
+
+        :param insideTiles: list of (tile size, array of numbers of tiles), from decompose
+        :return: tuple of (values, counts) arrays
+        """
+
+        values = []
+        counts = []
+        for tileSize, tiles in insideTiles:
+            offsets = self._getArray("offsets", tileSize)
+            starts = offsets[tiles]
+            lengths = offsets[tiles + 1] - starts
+            entries = numpy.repeat(starts - (numpy.cumsum(lengths) - lengths), lengths) + numpy.arange(lengths.sum())
+            values.append(self._getArray("values", tileSize)[entries])
+            counts.append(self._getArray("valueCounts", tileSize)[entries])
+        return numpy.concatenate(values), numpy.concatenate(counts)
+
+
+def getTileIndex(dataSource, version):
+    """
+    Return the tile index of a raster from TILE_INDEX_DIR in settings, or None if it has not been built or is out of
+    date.  Indexes are kept in memory once loaded.
+
+    :param dataSource: path to raster dataset
+    :param version: current version of raster, from getDataSourceVersion
+    """
+
+    if not settings.TILE_INDEX_DIR or version is None:
+        return None
+    path = getTileIndexPath(dataSource)
+    try:
+        modified = os.path.getmtime(path)
+    except OSError:
+        return None
+
+    cached = _tileIndexes.get(path)
+    if cached is None or cached[0] != modified:
+        try:
+            cached = (modified, TileIndex(path))
+        except (IOError, OSError, ValueError, KeyError) as ex:
+            logger.warning("Could not read tile index %s: %s" % (path, ex))
+            return None
+        _tileIndexes[path] = cached
+
+    tileIndex = cached[1]
+    if tileIndex.version != version:
+        logger.debug("Tile index of %s is out of date" % (dataSource))
+        return None
+    return tileIndex
+
+
+def buildTileIndex(dataSource, directory=None, tileSizes=None):
+    """
+    Build the tile index of a raster, reading the raster once in blocks of the largest tile size.
+
+    :param dataSource: path to raster dataset
+    :param directory: directory of tile indexes, defaults to TILE_INDEX_DIR in settings
+    :param tileSizes: tile sizes, each a multiple of the next smaller size; defaults to TILE_INDEX_SIZES in settings
+    :return: path of tile index file
+    """
+
+    directory = directory or settings.TILE_INDEX_DIR
+    tileSizes = sorted(set(tileSizes or settings.TILE_INDEX_SIZES), reverse=True)
+    for larger, smaller in zip(tileSizes[:-1], tileSizes[1:]):
+        if larger % smaller:
+            raise ValueError("TILE_SIZES_NOT_NESTED: each tile size must be a multiple of the next smaller size")
+    version = getDataSourceVersion(dataSource)
+    if version is None:
+        raise ValueError("DATA_SOURCE_NOT_VERSIONED: cannot index %s" % (dataSource))
+
+    reader = RasterWindowReader(dataSource)
+    grid = reader.grid
+    valueType = numpy.int64 if reader.isInteger else numpy.float64
+    logger.debug("Building tile index of %s (%i x %i pixels)" % (dataSource, grid.rows, grid.cols))
+
+    levels = []
+    for tileSize in tileSizes:
+        tileGrid = grid.getBlockGrid(tileSize)
+        numTiles = tileGrid.rows * tileGrid.cols
+        levels.append({
+            "cols": tileGrid.cols,
+            "counts": numpy.zeros(numTiles, dtype=numpy.int64),
+            "sums": numpy.zeros(numTiles),
+            "m2s": numpy.zeros(numTiles),
+            "mins": numpy.zeros(numTiles, dtype=valueType),
+            "maxs": numpy.zeros(numTiles, dtype=valueType),
+            "tallies": dict()
+        })
+
+    for block in grid.getBlocks(tileSizes[0]):
+        values = reader.read(block)
+        blockRow, blockCol = grid.getOffset(block)
+        for tileSize, level in zip(tileSizes, levels):
+            for row in range(0, block.rows, tileSize):
+                for col in range(0, block.cols, tileSize):
+                    tileValues = values[row:row + tileSize, col:col + tileSize]
+                    statistics = RunningStatistics()
+                    statistics.update(tileValues)
+                    if not statistics.count:
+                        continue
+                    tile = ((blockRow + row) // tileSize) * level["cols"] + (blockCol + col) // tileSize
+                    level["counts"][tile] = statistics.count
+                    level["sums"][tile] = statistics.sum
+                    level["m2s"][tile] = statistics.m2
+                    level["mins"][tile] = statistics.min
+                    level["maxs"][tile] = statistics.max
+                    if reader.isInteger:
+                        level["tallies"][tile] = tallyValues(tileValues)[:2]
+
+    arrays = {
+        "version": numpy.array(version),
+        "origin": numpy.array([grid.xMin, grid.yMax, grid.cellWidth, grid.cellHeight]),
+        "shape": numpy.array([grid.rows, grid.cols], dtype=numpy.int64),
+        "isInteger": numpy.array(reader.isInteger),
+        "tileSizes": numpy.array(tileSizes, dtype=numpy.int64)
+    }
+    for tileSize, level in zip(tileSizes, levels):
+        for name in ("counts", "sums", "m2s", "mins", "maxs"):
+            arrays["%s_%i" % (name, tileSize)] = level[name]
+        if reader.isInteger:
+            #histograms of all tiles are stored end to end; offsets are the start of each tile, and the end of the last
+            tallies = [level["tallies"].get(tile) for tile in range(len(level["counts"]))]
+            lengths = numpy.array([len(tally[0]) if tally else 0 for tally in tallies], dtype=numpy.int64)
+            arrays["offsets_%i" % (tileSize)] = numpy.concatenate(([0], numpy.cumsum(lengths)))
+            present = [tally for tally in tallies if tally]
+            arrays["values_%i" % (tileSize)] = numpy.concatenate([numpy.zeros(0, dtype=numpy.int64)] +
+                                                                  [tally[0] for tally in present])
+            arrays["valueCounts_%i" % (tileSize)] = numpy.concatenate([numpy.zeros(0, dtype=numpy.int64)] +
+                                                                       [tally[1] for tally in present])
+
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    path = getTileIndexPath(dataSource, directory)
+    #write to a temporary file first, so that readers never see partial indexes
+    tempPath = "%s.%s.tmp" % (path, uuid.uuid4().hex)
+    with open(tempPath, "wb") as indexFile:
+        numpy.savez_compressed(indexFile, **arrays)
+    if os.path.exists(path):
+        os.remove(path)
+    os.rename(tempPath, path)
+    logger.debug("Built tile index of %s: %s" % (dataSource, path))
+    return path
+
+
+if __name__ == "__main__":
+    import tool_logging  # init logging in this process
+
+    for dataSource in sys.argv[1:]:
+        print("Built tile index of %s: %s" % (dataSource, buildTileIndex(dataSource)))